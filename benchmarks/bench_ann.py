@@ -0,0 +1,73 @@
+"""Recall@k and queries per second of the IVF index against exact search.
+
+The vectors are clustered unit vectors, like embeddings of documents about a
+few thousand topics, and the queries are drawn from the same distribution.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+from common import report
+
+from madia.retrieval.ann import IVFIndex
+
+K = 10
+QUERIES = 200
+
+
+def unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def clustered(rng, rows, centers, noise=0.04):
+    labels = rng.integers(len(centers), size=rows)
+    noisy = centers[labels] + noise * rng.standard_normal(
+        (rows, centers.shape[1]), dtype=np.float32
+    )
+    return unit(noisy).astype(np.float32)
+
+
+def top_k(scores, k):
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=2000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    centers = unit(rng.standard_normal((args.topics, args.dim), dtype=np.float32))
+    vectors = clustered(rng, args.rows, centers)
+    queries = clustered(rng, QUERIES, centers)
+
+    start = time.perf_counter()
+    index = IVFIndex.build(vectors)
+    report(
+        "build", rows=args.rows, nlist=index.nlist, seconds=time.perf_counter() - start
+    )
+
+    start = time.perf_counter()
+    truth = [set(top_k(vectors @ query, K)) for query in queries]
+    report("exact", qps=QUERIES / (time.perf_counter() - start))
+
+    for nprobe in (1, 4, 8, 16, 32):
+        found = 0
+        start = time.perf_counter()
+        for query, expected in zip(queries, truth):
+            rows = index.candidates(query, nprobe)
+            found += len(expected & set(rows[top_k(vectors[rows] @ query, K)]))
+        elapsed = time.perf_counter() - start
+        report(
+            f"ivf nprobe={nprobe}",
+            recall_at_10=found / (K * QUERIES),
+            qps=QUERIES / elapsed,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Hit rate and throughput of the caption cache on a feed with duplicates.
+
+The feed is 1000 images of 400 distinct pictures, the popular ones more
+often, each as one of 4 copies: the original JPEG, a thumbnail, a PNG and a
+JPEG re-encoded at a lower quality. Captioning takes 20 ms, a batched GPU
+BLIP, and a caption is right when it's the one of the same picture.
+
+Strategies: no cache, the bytes only (``max_distance=-1``), and the
+perceptual hash.
+"""
+from __future__ import annotations
+
+import random
+import time
+from io import BytesIO
+
+from common import report
+from PIL import Image
+
+from madia.llm.caption_cache import CaptionCache, ImageKey, caption_params
+
+PICTURES = 400
+REQUESTS = 1000
+CAPTION_SECONDS = 0.02
+PARAMS = caption_params("Salesforce/blip-image-captioning-large")
+
+
+def picture(seed, size=384):
+    rng = random.Random(seed)
+    small = Image.new("RGB", (6, 6))
+    small.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(36)])
+    image = small.resize((size, size), Image.BICUBIC)
+    # Some grain, as in photos
+    noise = Image.effect_noise((size, size), 12).convert("RGB")
+    return Image.blend(image, noise, 0.1)
+
+
+def encode(image, format="JPEG", **kwargs):
+    buffer = BytesIO()
+    image.save(buffer, format, **kwargs)
+    return buffer.getvalue()
+
+
+def copies(image):
+    return [
+        encode(image, quality=90),
+        encode(image.resize((128, 128)), quality=85),
+        encode(image.resize((256, 256)), "PNG"),
+        encode(image, quality=50),
+    ]
+
+
+def build_feed():
+    rng = random.Random(0)
+    variants = [copies(picture(seed)) for seed in range(PICTURES)]
+    weights = [1 / (rank + 1) for rank in range(PICTURES)]
+    feed = []
+    for index in rng.choices(range(PICTURES), weights, k=REQUESTS):
+        feed.append((index, rng.choice(variants[index])))
+    return feed
+
+
+def run(name, feed, cache):
+    wrong = 0
+    start = time.perf_counter()
+    for index, data in feed:
+        key = ImageKey(data)
+        caption = cache.get(PARAMS, key) if cache is not None else None
+        if caption is None:
+            time.sleep(CAPTION_SECONDS)
+            caption = f"picture {index}"
+            if cache is not None:
+                cache.put(PARAMS, key, caption)
+        wrong += caption != f"picture {index}"
+    elapsed = time.perf_counter() - start
+    report(
+        name,
+        hit_rate=cache.hits / len(feed) if cache is not None else 0.0,
+        wrong_captions=wrong,
+        images_per_s=len(feed) / elapsed,
+    )
+
+
+def main():
+    feed = build_feed()
+    # Every copy of a picture after its first one hits
+    report("ideal", hit_rate=1 - len({index for index, _ in feed}) / len(feed))
+    run("no_cache", feed, None)
+    run("bytes_only", feed, CaptionCache(":memory:", max_distance=-1))
+    run("perceptual_hash", feed, CaptionCache(":memory:"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Pages per second and peak RSS of the PDF chunkers.
+
+``data/WizardLM.pdf`` is repeated ``--repeat`` times into one large PDF, then
+chunked in a fresh process per mode, so each peak RSS is measured alone:
+
+- materialized: every page, then every chunk, in lists before use, as
+  ``PyPDFLoader(...).load()`` followed by ``split_documents`` does.
+- streaming: page by page, in-process.
+- parallel: page ranges in a process pool, with backpressure. Its RSS adds
+  the peak of the largest worker. Workers default to the CPUs, ``--workers``
+  to change it.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import report
+from pypdf import PdfWriter
+
+from madia.retrieval.loaders import (Chunk, ParallelChunker, count_pages,
+                                     iter_chunks, iter_pages, split_text)
+from madia.utils_string import string_to_md5
+
+SOURCE = os.path.join(os.path.dirname(__file__), "..", "data", "WizardLM.pdf")
+
+
+def materialized(path, _workers):
+    pages = list(iter_pages(path))
+    chunks = [
+        Chunk(string_to_md5(text), path, page, text)
+        for page, page_text in pages
+        for text in split_text(page_text)
+    ]
+    return len(chunks)
+
+
+def streaming(path, _workers):
+    return sum(1 for _ in iter_chunks(path))
+
+
+def parallel(path, workers):
+    with ParallelChunker(workers) as chunker:
+        return sum(1 for _ in chunker.iter_chunks(path))
+
+
+MODES = {"materialized": materialized, "streaming": streaming, "parallel": parallel}
+
+
+def peak_rss_kib():
+    # Unlike ru_maxrss, VmHWM isn't inherited from the parent across exec
+    with open("/proc/self/status", encoding="ascii") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_mode(mode, path, workers):
+    start = time.perf_counter()
+    chunks = MODES[mode](path, workers)
+    seconds = time.perf_counter() - start
+    rss = peak_rss_kib() + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    pages = count_pages(path)
+    report(
+        mode,
+        pages=pages,
+        chunks=chunks,
+        pages_per_s=pages / seconds,
+        peak_rss_mib=rss / 1024,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--mode", choices=MODES)
+    parser.add_argument("--path")
+    args = parser.parse_args()
+    if args.mode:
+        run_mode(args.mode, args.path, args.workers)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "repeated.pdf")
+        writer = PdfWriter()
+        for _ in range(args.repeat):
+            writer.append(SOURCE)
+        with open(path, "wb") as file:
+            writer.write(file)
+        for mode in MODES:
+            command = [sys.executable, __file__, "--mode", mode, "--path", path]
+            if args.workers:
+                command += ["--workers", str(args.workers)]
+            subprocess.run(command, check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Prompt tokens sent per question by the search agent, raw vs compacted results.
+
+20 questions, each taking 1 to 3 searches before the answer. A search gives
+Serper's 10 results, with the near-copies real results have: the same
+sentence quoted by several sites. One question in 4 gets an answer box,
+which the wrapper returns alone, and so does compaction.
+
+``raw`` puts the results in the agent's scratchpad as
+``GoogleSerperAPIWrapper.run`` gives them, every later model call of the
+question sends them again. ``compacted`` deduplicates them, ranks them by
+overlap with the question and keeps 200 tokens per search.
+
+Tokens are counted with tiktoken's ``cl100k_base`` if its encoding is
+cached, else estimated at 4 characters each.
+"""
+from __future__ import annotations
+
+import os
+from contextlib import redirect_stdout
+from io import StringIO
+
+from common import report
+
+from madia.config import settings
+from madia.llm.compaction import count_tokens
+from madia.llm.fakes import FakeChatModel, FakeSerper
+from madia.llm.openai_search import BufferedSearchWindowMessage
+
+# The model is a fake, but ChatOpenAI wants a key to be built
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmarks")
+
+QUESTIONS = 20
+RESULTS = 10
+FACTS = [
+    "{topic} was first released in {year}, after two years of development "
+    "by a small team of volunteers working on it in their spare time.",
+    "The latest version of {topic} adds support for plugins, a faster "
+    "startup and a new configuration format that older releases can't read.",
+    "{topic} is used by thousands of companies, according to a survey "
+    "published last year by an independent research group.",
+    "Critics of {topic} point to its documentation, which they say lags "
+    "behind the features added in the last few releases.",
+    "A conference dedicated to {topic} is held every spring, with talks "
+    "from its maintainers and from the companies depending on it.",
+]
+FILLER = [
+    "Sign up to our newsletter to get the latest news, reviews and deals "
+    "delivered straight to your inbox every week.",
+    "This page was last edited on 3 March, text is available under the "
+    "Creative Commons license, additional terms may apply.",
+    "Related searches: download, tutorial, alternatives, pricing, reviews, "
+    "comparison, latest version, release notes.",
+]
+
+
+class CountingChatModel(FakeChatModel):
+    """A fake model adding up the tokens of the prompts it receives."""
+
+    prompt_tokens: int = 0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompt_tokens += sum(count_tokens(m.content) for m in messages)
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+def topics(question):
+    return [f"topic{question}{part}" for part in "abc"[: question % 3 + 1]]
+
+
+def snippets(question):
+    pool = []
+    for topic in topics(question):
+        year = 1990 + question
+        facts = [fact.format(topic=topic, year=year) for fact in FACTS]
+        # Sites quoting one another, with an ellipsis or another case
+        pool += facts + [facts[0][:-1] + " ...", facts[1].lower()]
+    return pool + FILLER
+
+
+def script(question):
+    steps = [
+        f"Thought: I should search for {topic}.\n"
+        f"Action: Intermediate Answer\nAction Input: When was {topic} released"
+        for topic in topics(question)
+    ]
+    return steps + ["Thought: I now know the final answer.\nFinal Answer: The answer."]
+
+
+def run(name, compaction):
+    settings.set("search_compaction", compaction)
+    prompt_tokens = searches = failed = 0
+    for question in range(QUESTIONS):
+        answer = f"Released in {1990 + question}" if question % 4 == 0 else None
+        serper = FakeSerper(snippets(question), k=RESULTS, answer=answer)
+        search = BufferedSearchWindowMessage(search=serper, agent="react")
+        search.llm = CountingChatModel(cycle=True, responses=script(question))
+        with redirect_stdout(StringIO()):
+            answer = search.get_response(
+                f"When were {' and '.join(topics(question))} released?"
+            )
+        prompt_tokens += search.llm.prompt_tokens
+        searches += len(serper.queries)
+        failed += answer != "The answer."
+    report(
+        name,
+        prompt_tokens_per_question=prompt_tokens / QUESTIONS,
+        searches_per_question=searches / QUESTIONS,
+        failed=failed,
+    )
+
+
+def main():
+    run("raw", False)
+    run("compacted", True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Latency of a one-shot ``madia`` command, cold process vs ``madia serve``.
+
+The cold run imports and sets up everything on each call, the daemon run only
+starts the thin client, which forwards the command over the Unix socket.
+"""
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import percentile, report
+
+RUNS = 10
+COMMAND = [sys.executable, "-m", "madia.cli", "hardcoded_print"]
+
+
+def timed_runs(env):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(COMMAND, env=env, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def wait_for(path, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"daemon did not start listening on {path}")
+        time.sleep(0.1)
+
+
+def main():
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-x"))
+    with tempfile.TemporaryDirectory() as tmp:
+        env["MADIA_DAEMON_SOCKET"] = os.path.join(tmp, "madia.sock")
+
+        cold = timed_runs(dict(env, MADIA_NO_DAEMON="1"))
+        daemon = subprocess.Popen(
+            [sys.executable, "-m", "madia.cli", "serve"],
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            wait_for(env["MADIA_DAEMON_SOCKET"])
+            warm = timed_runs(env)
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    for name, timings in (("cold", cold), ("daemon", warm)):
+        report(
+            name,
+            p50_ms=percentile(timings, 50) * 1000,
+            p95_ms=percentile(timings, 95) * 1000,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Microbenchmark of command dispatch over a 10k-command tree."""
+from __future__ import annotations
+
+import random
+import shlex
+
+from common import best_of, report
+
+from madia.repl.commands import CommandTable
+
+FANOUT = 22  # 22 + 22**2 + 22**3 ~ 11k commands
+DISPATCHES = 20_000
+
+
+def build_tree(depth=3, prefix=""):
+    tree = {}
+    for i in range(FANOUT):
+        name = f"{prefix}c{i}"
+        tree[name] = {"cmd": len, "help": f"Help for {name}"}
+        if depth > 1:
+            tree[name]["child"] = build_tree(depth - 1, f"{name}_")
+    return tree
+
+
+def legacy_execute(completion_dict, command):
+    """The previous BaseRepl.execute_command walk, without the help branch.
+
+    It tokenized with shlex.split, which safe_shlex_split now skips when the
+    input has no quotes or escapes.
+    """
+    command_arr = shlex.split(command)
+    cur_tree = completion_dict
+    fn = None
+    for i, cur_level in enumerate(command_arr):
+        if cur_level not in cur_tree:
+            break
+        cur_obj = cur_tree[cur_level]
+        cur_tree = cur_obj.get("child", cur_tree)
+        fn = cur_obj if callable(cur_obj) else cur_obj.get("cmd", None)
+    return fn(" ".join(command_arr[i:]))
+
+
+def main():
+    tree = build_tree()
+    rng = random.Random(1)
+    commands = []
+    for _ in range(DISPATCHES):
+        a, b, c = (rng.randrange(FANOUT) for _ in range(3))
+        commands.append(f"c{a} c{a}_c{b} c{a}_c{b}_c{c} some question here")
+
+    compile_seconds = best_of(CommandTable, tree, repeat=3)
+    table = CommandTable(tree)
+    report("dispatch_compile", commands=len(table), seconds=compile_seconds)
+
+    compiled = best_of(lambda: [table.execute(c) for c in commands], repeat=3)
+    report("dispatch_compiled", us_per_command=compiled / DISPATCHES * 1e6)
+
+    legacy = best_of(lambda: [legacy_execute(tree, c) for c in commands], repeat=3)
+    report("dispatch_legacy", us_per_command=legacy / DISPATCHES * 1e6)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Ingestion throughput and query latency of the local documents index.
+
+A synthetic PDF of 10k pages (``--pages`` to change it) is generated, ingested
+with the offline hashing embedding, ingested again (everything unchanged),
+then queried.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from common import percentile, report
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from madia.retrieval.docs import DocsIndex
+from madia.retrieval.embeddings import get_embedding
+
+VOCABULARY = [f"term{i}" for i in range(5000)]
+LINES_PER_PAGE = 40
+WORDS_PER_LINE = 12
+QUERIES = 200
+
+
+def make_pdf(path, pages, rng):
+    writer = PdfWriter()
+    font = DictionaryObject(
+        {
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+        }
+    )
+    font_ref = writer._add_object(font)  # pylint: disable=protected-access
+    for _ in range(pages):
+        page = writer.add_blank_page(612, 792)
+        lines = [
+            " ".join(rng.choices(VOCABULARY, k=WORDS_PER_LINE))
+            for _ in range(LINES_PER_PAGE)
+        ]
+        content = DecodedStreamObject()
+        content.set_data(
+            (
+                "BT /F1 10 Tf 12 TL 40 760 Td "
+                + " ".join(f"({line}) '" for line in lines)
+                + " ET"
+            ).encode("latin-1")
+        )
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font_ref})}
+        )
+    with open(path, "wb") as file:
+        writer.write(file)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=10_000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "corpus.pdf")
+        make_pdf(pdf_path, args.pages, rng)
+        index = DocsIndex(os.path.join(tmp, "index"), get_embedding("hashing"))
+
+        stats = index.ingest(pdf_path)
+        report(
+            "ingest",
+            pages=args.pages,
+            chunks=stats.chunks,
+            seconds=stats.seconds,
+            pages_per_s=args.pages / stats.seconds,
+        )
+        stats = index.ingest(pdf_path)
+        report("reingest_unchanged", seconds=stats.seconds)
+
+        timings = []
+        for _ in range(QUERIES):
+            query = " ".join(rng.choices(VOCABULARY, k=6))
+            start = time.perf_counter()
+            index.search(query)
+            timings.append(time.perf_counter() - start)
+        report(
+            "query",
+            rows=len(index.store),
+            p50_ms=percentile(timings, 50) * 1000,
+            p95_ms=percentile(timings, 95) * 1000,
+        )
+
+
+if __name__ == "__main__":
+    main()
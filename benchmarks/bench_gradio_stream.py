@@ -0,0 +1,63 @@
+"""Load test of the streaming Gradio chat with a fake model.
+
+50 users send a message at the same time. The Gradio queue is simulated with a
+semaphore of ``concurrency_count`` workers, and the time to first token (TTFT)
+is measured from the moment the message is sent.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from common import percentile, report
+
+from madia.gradio.chatbot_v1 import build_predict
+from madia.gradio.sessions import SessionStore
+from madia.llm.fakes import FakeChatModel
+
+USERS = 50
+ANSWER = " ".join(f"word{i}" for i in range(30))
+
+
+def run_user(predict, workers, user):
+    request = SimpleNamespace(session_hash=f"user-{user}")
+    sent = time.perf_counter()
+    with workers:
+        partials = predict(f"question {user}", request)
+        next(partials)
+        first_token = time.perf_counter() - sent
+        for _ in partials:
+            pass
+    return first_token, time.perf_counter() - sent
+
+
+def main():
+    llm = FakeChatModel(
+        responses=[ANSWER], first_token_latency=0.3, tokens_per_second=50
+    )
+    predict = build_predict(llm, SessionStore(llm))
+    for concurrency_count in (1, 8, USERS):
+        workers = threading.Semaphore(concurrency_count)
+        with ThreadPoolExecutor(USERS) as pool:
+            results = list(
+                pool.map(
+                    lambda user: run_user(predict, workers, user),
+                    range(USERS),
+                )
+            )
+        ttft = [first for first, _ in results]
+        total = [whole for _, whole in results]
+        report(
+            "gradio_stream",
+            users=USERS,
+            concurrency_count=concurrency_count,
+            ttft_p50=percentile(ttft, 50),
+            ttft_p99=percentile(ttft, 99),
+            total_p99=percentile(total, 99),
+        )
+
+
+if __name__ == "__main__":
+    main()
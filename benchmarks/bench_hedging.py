@@ -0,0 +1,72 @@
+"""Answer latency with and without hedging, against a heavy-tailed fake model.
+
+The fake model answers 20 tokens at 400 tokens/s after a first token latency
+of 40-120 ms, except 4% of the requests that take 1.5 s, the slow responses
+that make the p99. Requests come from 4 threads, as from Gradio users.
+
+The hedging policy is the default one: hedge at the p95 of the first token
+latency, with a budget of 10% extra requests.
+"""
+from __future__ import annotations
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from common import percentile, report
+from langchain.schema import HumanMessage
+
+from madia.llm.fakes import FakeChatModel
+from madia.llm.hedging import HedgePolicy, HedgingMixin
+
+REQUESTS = 400
+THREADS = 4
+SLOW_RATE = 0.04
+SLOW_LATENCY = 1.5
+
+
+class FakeHedgedModel(HedgingMixin, FakeChatModel):
+    hedge_policy: Any = None
+
+
+def heavy_tail(rng):
+    def latency():
+        if rng.random() < SLOW_RATE:
+            return SLOW_LATENCY
+        return rng.uniform(0.04, 0.12)
+
+    return latency
+
+
+def run(name, policy):
+    llm = FakeHedgedModel(
+        responses=[" ".join(f"word{i}" for i in range(20))],
+        tokens_per_second=400,
+        latency_fn=heavy_tail(random.Random(42)),
+        hedge_policy=policy,
+    )
+
+    def ask(i):
+        start = time.perf_counter()
+        llm.predict_messages([HumanMessage(content=f"question {i}")])
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        latencies = list(pool.map(ask, range(REQUESTS)))
+    report(
+        name,
+        p50_ms=percentile(latencies, 50) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+        max_ms=max(latencies) * 1000,
+        extra_requests_pct=(llm.calls / REQUESTS - 1) * 100,
+    )
+
+
+def main():
+    run("no_hedging", None)
+    run("hedging", HedgePolicy())
+
+
+if __name__ == "__main__":
+    main()
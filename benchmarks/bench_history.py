@@ -0,0 +1,56 @@
+"""Benchmark the REPL history store and auto-suggest with 1M entries."""
+from __future__ import annotations
+
+import os
+import random
+import sys
+import tempfile
+
+from common import best_of, report
+
+from madia.repl.history import CompactFileHistory, PrefixIndex
+
+ENTRIES = 1_000_000
+LOOKUPS = 10_000
+
+
+def linear_lookup(strings, prefix):
+    """What AutoSuggestFromHistory does on every keystroke."""
+    for string in reversed(strings):
+        if string.startswith(prefix):
+            return string
+    return None
+
+
+def main(entries=ENTRIES):
+    rng = random.Random(42)
+    strings = [
+        f"{rng.choice(['ai', 'bots joker', 'openai search'])} question {i}"
+        for i in range(entries)
+    ]
+    prefixes = [s[: rng.randint(2, len(s))] for s in rng.sample(strings, LOOKUPS)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = CompactFileHistory(os.path.join(tmp, "history.jsonl"), entries)
+        history._compact(strings)  # pylint: disable=protected-access
+        size = os.path.getsize(history.filename)
+        load = best_of(lambda: list(history.load_history_strings()), repeat=1)
+        report("history_load", entries=entries, bytes=size, seconds=load)
+
+    index = PrefixIndex()
+    build = best_of(index.rebuild, strings, repeat=1)
+    report("prefix_index_build", entries=entries, seconds=build)
+
+    indexed = best_of(lambda: [index.lookup(p) for p in prefixes], repeat=3)
+    report("suggest_indexed", lookups=LOOKUPS, us_per_lookup=indexed / LOOKUPS * 1e6)
+
+    # The linear scan is far too slow to run for every prefix
+    sample = prefixes[:20]
+    linear = best_of(lambda: [linear_lookup(strings, p) for p in sample], repeat=1)
+    report(
+        "suggest_linear", lookups=len(sample), us_per_lookup=linear / len(sample) * 1e6
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ENTRIES)
@@ -0,0 +1,76 @@
+"""Decode time and peak memory of a 20 megapixel JPEG, before captioning.
+
+``full`` is the former path: the file read in memory, then decoded at full
+resolution in RGB. ``draft`` memory-maps the file and lets libjpeg decode
+it at the smallest scale still over BLIP's 384 px input.
+
+Each path runs in its own process, so the peak resident memory it reports
+is its own, above the process after imports.
+"""
+from __future__ import annotations
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from io import BytesIO
+
+from common import best_of, report
+from PIL import Image
+
+from madia.llm.images import decode_image, image_data
+
+WIDTH, HEIGHT = 5472, 3648
+INPUT_SIZE = 384
+
+
+def make_jpeg(path):
+    # Noise over a gradient, for a photo-like file size
+    gradient = Image.linear_gradient("L").resize((WIDTH, HEIGHT))
+    noise = Image.effect_noise((WIDTH, HEIGHT), 40)
+    image = Image.merge("RGB", (gradient, noise, gradient.transpose(0)))
+    image.save(path, quality=90)
+
+
+def decode_full(path):
+    with open(path, "rb") as file:
+        return Image.open(BytesIO(file.read())).convert("RGB")
+
+
+def decode_draft(path):
+    with image_data(path) as data:
+        return decode_image(data, INPUT_SIZE)
+
+
+def child(name, path):
+    decode = {"full": decode_full, "draft": decode_draft}[name]
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    seconds = best_of(decode, path)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    report(
+        name,
+        decode_ms=seconds * 1000,
+        # ru_maxrss is in KiB on Linux
+        peak_mib=peak / 1024,
+        size=f"{decode(path).size[0]}x{decode(path).size[1]}",
+    )
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "large.jpg")
+        # In a process of its own too, the peak memory survives exec()
+        subprocess.run([sys.executable, __file__, "make", path], check=True)
+        print(f"{WIDTH}x{HEIGHT} JPEG, {os.path.getsize(path) / 2**20:.1f} MiB")
+        for name in ("full", "draft"):
+            subprocess.run([sys.executable, __file__, name, path], check=True)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["make"]:
+        make_jpeg(sys.argv[2])
+    elif len(sys.argv) == 3:
+        child(*sys.argv[1:])
+    else:
+        main()
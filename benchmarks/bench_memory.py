@@ -0,0 +1,84 @@
+"""Prompt tokens per turn over a 500-turn scripted chat, per memory mode.
+
+- unbounded: the whole history is sent, the token limit raised out of the way.
+- buffer: ``ConversationTokenBufferMemory``, old turns are dropped.
+- summary: :class:`madia.llm.conversation.RollingSummaryMemory`, old turns are
+  summarized in the background by a fake model taking 30 ms per summary.
+
+Each answer takes 10 ms, as the fake chat model would, so background summaries
+land between turns as they do in a real chat.
+
+``save_ms`` is the time spent in the memory on the request path per turn.
+"""
+from __future__ import annotations
+
+import time
+
+from common import percentile, report
+from langchain.memory import ConversationTokenBufferMemory
+
+from madia.llm.conversation import RollingSummaryMemory
+from madia.llm.fakes import FakeChatModel
+
+TURNS = 500
+WINDOW_TOKENS = 1000
+ANSWER_LATENCY = 0.01
+SUMMARY = " ".join(f"gist{i}" for i in range(120))
+
+
+def run(name, memory, llm):
+    prompt_tokens, save_times = [], []
+    for turn in range(TURNS):
+        question = f"Question {turn}: " + " ".join(f"q{i}" for i in range(30))
+        answer = f"Answer {turn}: " + " ".join(f"a{i}" for i in range(80))
+        history = memory.load_memory_variables({})["chat_history"]
+        prompt_tokens.append(llm.get_num_tokens_from_messages(history) + 35)
+        time.sleep(ANSWER_LATENCY)
+        start = time.perf_counter()
+        memory.save_context({"question": question}, {"text": answer})
+        save_times.append(time.perf_counter() - start)
+    report(
+        name,
+        mean_prompt_tokens=sum(prompt_tokens) / TURNS,
+        last_prompt_tokens=prompt_tokens[-1],
+        save_ms_p50=percentile(save_times, 50) * 1000,
+        save_ms_max=max(save_times) * 1000,
+    )
+
+
+def main():
+    llm = FakeChatModel()
+    run(
+        "unbounded",
+        ConversationTokenBufferMemory(
+            llm=llm,
+            memory_key="chat_history",
+            return_messages=True,
+            max_token_limit=10**9,
+        ),
+        llm,
+    )
+    run(
+        "buffer",
+        ConversationTokenBufferMemory(
+            llm=llm,
+            memory_key="chat_history",
+            return_messages=True,
+            max_token_limit=WINDOW_TOKENS,
+        ),
+        llm,
+    )
+    summarizer = FakeChatModel(responses=[SUMMARY], first_token_latency=0.03)
+    memory = RollingSummaryMemory(
+        llm=llm,
+        summary_llm=summarizer,
+        return_messages=True,
+        max_token_limit=WINDOW_TOKENS,
+    )
+    run("summary", memory, llm)
+    memory.wait()
+    report("summary_calls", calls=summarizer.calls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Overhead of the per-command metrics, enabled vs disabled.
+
+- dispatch: a command returning at once through ``BaseRepl``, the worst case
+  as the metrics are all there is besides parsing, so it's given per command.
+- chat_turn: a 20-turn chat with a fake streaming model answering 200 tokens
+  per turn, with 20 ms of simulated network time per turn. A real model takes
+  seconds per answer, so this overstates the relative overhead.
+"""
+from __future__ import annotations
+
+import os
+import time
+
+from common import best_of, report
+
+from madia.metrics import metrics
+from madia.repl.base_repl import BaseRepl
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmarks")
+
+DISPATCHES = 20_000
+TURNS = 20
+NETWORK_LATENCY = 0.02
+
+
+def dispatch():
+    repl = BaseRepl({"openai": {"child": {"search": {"cmd": len}}}})
+    for _ in range(DISPATCHES):
+        repl.execute_command("openai search madia")
+
+
+def chat_turns():
+    from madia.llm.fakes import FakeChatModel
+    from madia.llm.openai_chat import BufferedWindowMessage
+    from madia.llm.utils import metrics_handler
+
+    chat = BufferedWindowMessage()
+    chat.llm = chat.memory.llm = FakeChatModel(
+        responses=[" ".join(f"word{i}" for i in range(200))],
+        callbacks=[metrics_handler],
+    )
+    repl = BaseRepl({"ai": {"cmd": chat.get_response}})
+
+    def run():
+        chat.memory.clear()
+        for turn in range(TURNS):
+            repl.execute_command(f"ai question {turn}")
+            time.sleep(NETWORK_LATENCY)
+
+    return run
+
+
+def compare(name, fn, rounds=5, calls=1):
+    # Interleaved, so both see the same machine load
+    disabled, enabled = [], []
+    for _ in range(rounds):
+        metrics.enabled = False
+        disabled.append(best_of(fn, repeat=3))
+        metrics.enabled = True
+        enabled.append(best_of(fn, repeat=3))
+    disabled, enabled = min(disabled), min(enabled)
+    report(
+        name,
+        disabled_ms=disabled * 1000,
+        enabled_ms=enabled * 1000,
+        overhead_pct=(enabled / disabled - 1) * 100,
+        overhead_us_per_call=(enabled - disabled) / calls * 1e6,
+    )
+
+
+def main():
+    compare("dispatch", dispatch, calls=DISPATCHES)
+    compare("chat_turn", chat_turns(), calls=TURNS)
+
+
+if __name__ == "__main__":
+    main()
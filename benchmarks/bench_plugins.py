@@ -0,0 +1,79 @@
+"""Startup cost of the plugin commands, entry point discovery vs the manifest.
+
+10 plugins are installed in a temporary site directory, next to the
+distributions of this environment. Importing a plugin takes 20 ms, standing
+for the dependencies it imports. ``discover`` reads every distribution's
+entry points and imports the plugins, as on each start without a cache.
+``manifest`` fingerprints the installed distributions and reads the cached
+manifest, no plugin is imported.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+from importlib.metadata import distributions
+
+from common import best_of, report
+
+from madia.repl.plugins import PluginManifest, discover_plugins
+
+PLUGINS = 10
+IMPORT_SECONDS = 0.02
+PLUGIN = f"""
+import time
+
+time.sleep({IMPORT_SECONDS})
+
+
+def run(arguments):
+    return arguments
+
+
+command = {{
+    "cmd": run,
+    "help": "A plugin command",
+    "child": {{"sub": {{"cmd": run, "help": "A plugin subcommand"}}}},
+}}
+"""
+
+
+def install(site, index):
+    name = f"madia_bench_plugin{index}"
+    with open(os.path.join(site, f"{name}.py"), "w", encoding="utf-8") as file:
+        file.write(PLUGIN)
+    dist_info = os.path.join(site, f"{name}-0.1.dist-info")
+    os.mkdir(dist_info)
+    with open(os.path.join(dist_info, "METADATA"), "w", encoding="utf-8") as file:
+        file.write(f"Metadata-Version: 2.1\nName: {name}\n")
+    with open(
+        os.path.join(dist_info, "entry_points.txt"), "w", encoding="utf-8"
+    ) as file:
+        file.write(f"[madia.commands]\nplugin{index} = {name}:command\n")
+
+
+def discover():
+    # As a new process would, with none of the plugins imported
+    for index in range(PLUGINS):
+        sys.modules.pop(f"madia_bench_plugin{index}", None)
+    return discover_plugins()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        site = os.path.join(directory, "site")
+        os.mkdir(site)
+        for index in range(PLUGINS):
+            install(site, index)
+        sys.path.insert(0, site)
+        manifest = PluginManifest(os.path.join(directory, "plugins.json"))
+        manifest.rebuild()
+
+        print(f"{sum(1 for _ in distributions())} distributions installed")
+        for name, load in (("discover", discover), ("manifest", manifest.commands)):
+            commands = load()
+            report(name, ms=best_of(load) * 1000, commands=len(commands))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Simulated answer latency, cost and failures of model routing strategies.
+
+The prompt mix in ``data/prompt_mix.jsonl`` gives the command, prompt and
+completion tokens of 500 requests, one every 5 s of simulated time. Each
+model answers after its first token latency, jittered by up to 50%, then at
+its tokens/s. Requests 200 to 300 hit an incident where gpt-3.5-turbo's
+first token takes 8 times longer. A prompt over a model's context fails.
+
+Strategies: always gpt-3.5-turbo, always gpt-4, and the router with the
+routes below, with and without the latency of the models, fed the simulated
+first token latencies. ``incident_ttft_p90_s`` is the p90 of the first token
+latency during the incident.
+"""
+from __future__ import annotations
+
+import json
+import os
+import random
+from collections import Counter
+
+from common import percentile, report
+
+from madia.llm.router import (COMPLETION_RESERVE, LATENCY_TOLERANCE,
+                              ModelRouter, Route, context_window)
+from madia.metrics import MODEL_PRICES
+
+PROMPT_MIX = os.path.join(os.path.dirname(__file__), "data", "prompt_mix.jsonl")
+INTERVAL = 5.0
+INCIDENT = range(200, 300)
+INCIDENT_SLOWDOWN = 8
+# First token latency in seconds, tokens per second
+MODELS = {
+    "gpt-3.5-turbo": (0.4, 60),
+    "gpt-3.5-turbo-16k": (0.6, 50),
+    "gpt-4": (1.0, 15),
+}
+ROUTES = [
+    # gpt-4 is slower by design, it only gives way when it's much slower
+    Route(
+        ("gpt-4", "gpt-3.5-turbo-16k"),
+        command="bots developer",
+        min_prompt_tokens=200,
+        latency_tolerance=4.0,
+    ),
+    Route(("gpt-3.5-turbo", "gpt-3.5-turbo-16k")),
+]
+
+
+def load_mix():
+    with open(PROMPT_MIX, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def simulate(name, mix, choose):
+    rng = random.Random(42)
+    latencies, incident, models = [], [], Counter()
+    cost = failed = 0
+    for index, request in enumerate(mix):
+        model = choose(request, index * INTERVAL)
+        models[model] += 1
+        prompt, completion = request["prompt_tokens"], request["completion_tokens"]
+        if prompt + COMPLETION_RESERVE > context_window(model):
+            failed += 1
+            continue
+        first_token, tokens_per_second = MODELS[model]
+        if model == "gpt-3.5-turbo" and index in INCIDENT:
+            first_token *= INCIDENT_SLOWDOWN
+        first_token *= rng.uniform(1.0, 1.5)
+        choose.observe(model, first_token)
+        latencies.append(first_token + completion / tokens_per_second)
+        if index in INCIDENT:
+            incident.append(first_token)
+        prompt_price, completion_price = MODEL_PRICES[model]
+        cost += (prompt * prompt_price + completion * completion_price) / 1000
+    report(
+        name,
+        p50_s=percentile(latencies, 50),
+        p99_s=percentile(latencies, 99),
+        incident_ttft_p90_s=percentile(incident, 90),
+        cost_usd=cost,
+        failed=failed,
+        models=dict(models),
+    )
+
+
+class Always:
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, request, now):
+        return self.model
+
+    def observe(self, model, seconds):
+        pass
+
+
+class Routed:
+    def __init__(self, latency_tolerance):
+        self.now = 0.0
+        self.router = ModelRouter(
+            ROUTES, latency_tolerance=latency_tolerance, clock=lambda: self.now
+        )
+
+    def __call__(self, request, now):
+        self.now = now
+        return self.router.choose(
+            request["prompt_tokens"], request["command"], "gpt-3.5-turbo"
+        ).model
+
+    def observe(self, model, seconds):
+        self.router.observe(model, seconds)
+
+
+def main():
+    mix = load_mix()
+    simulate("always_gpt-3.5-turbo", mix, Always("gpt-3.5-turbo"))
+    simulate("always_gpt-4", mix, Always("gpt-4"))
+    # Rules and context windows only
+    simulate("routed_static", mix, Routed(1e9))
+    simulate("routed", mix, Routed(LATENCY_TOLERANCE))
+
+
+if __name__ == "__main__":
+    main()
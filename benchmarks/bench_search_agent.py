@@ -0,0 +1,89 @@
+"""Model round trips and wall time per question, ReAct vs function calling.
+
+20 questions, 8 of them needing two searches, e.g. comparing two things.
+The fake model is scripted as the two agents' prompts make real models
+answer: ReAct writes a thought and one action per turn, so two searches take
+two turns, and 1 answer in 10 doesn't follow the format, which fails the
+question. Function calling asks for both searches in one turn, as JSON.
+
+The model answers after 50 ms at 400 tokens/s, a search takes 30 ms.
+"""
+from __future__ import annotations
+
+import os
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+from common import report
+
+from madia.llm.fakes import FakeChatModel, FakeSerper
+from madia.llm.openai_search import BufferedSearchWindowMessage
+
+# The model is a fake, but ChatOpenAI wants a key to be built
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmarks")
+
+QUESTIONS = 20
+FIRST_TOKEN_LATENCY = 0.05
+TOKENS_PER_SECOND = 400
+SEARCH_LATENCY = 0.03
+
+
+def topics(question):
+    if question % 5 in (1, 3):
+        return [f"topic{question}a", f"topic{question}b"]
+    return [f"topic{question}"]
+
+
+def react_script(question):
+    if question % 10 == 9:
+        # No "Action:", the output parser fails
+        return ["I think the answer is in the news, I would have to look it up."]
+    steps = [
+        f"Thought: I should search for {topic}.\n"
+        f"Action: Intermediate Answer\nAction Input: {topic}"
+        for topic in topics(question)
+    ]
+    return steps + ["Thought: I now know the final answer.\nFinal Answer: The answer."]
+
+
+def functions_script(question):
+    calls = [
+        {"name": "search", "arguments": {"query": topic}} for topic in topics(question)
+    ]
+    return [{"name": "tool_calls", "arguments": {"calls": calls}}, "The answer."]
+
+
+def run(name, agent, script):
+    calls = failed = 0
+    start = time.perf_counter()
+    for question in range(QUESTIONS):
+        search = BufferedSearchWindowMessage(
+            search=FakeSerper(latency=SEARCH_LATENCY), agent=agent
+        )
+        search.llm = FakeChatModel(
+            cycle=True,
+            responses=script(question),
+            first_token_latency=FIRST_TOKEN_LATENCY,
+            tokens_per_second=TOKENS_PER_SECOND,
+        )
+        with redirect_stdout(StringIO()):
+            answer = search.get_response(f"Question {question}?")
+        calls += search.llm.calls
+        failed += answer != "The answer."
+    elapsed = time.perf_counter() - start
+    report(
+        name,
+        round_trips=calls / QUESTIONS,
+        ms_per_question=elapsed / QUESTIONS * 1000,
+        failed=failed,
+    )
+
+
+def main():
+    run("react", "react", react_script)
+    run("functions", "functions", functions_script)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Resume time of a 10k-message session: token window vs whole history."""
+from __future__ import annotations
+
+import os
+import tempfile
+
+from common import best_of, report
+from langchain.schema import AIMessage, HumanMessage
+
+from madia.llm.session_log import SessionLogStore
+
+MESSAGES = 10_000
+WINDOW_TOKENS = 2000
+ANSWER = " ".join(f"word{i % 50}" for i in range(200))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        log = SessionLogStore(tmp).open("long")
+        for i in range(0, MESSAGES, 2):
+            log.append(
+                [HumanMessage(content=f"question {i}"), AIMessage(content=ANSWER)],
+                [5, 250],
+            )
+        raw = sum(
+            len(message.content) for message in log.read(MESSAGES - 2, MESSAGES)
+        ) * (MESSAGES // 2)
+        report(
+            "size",
+            messages=len(log),
+            log_kib=os.path.getsize(log.log_path) / 1024,
+            content_kib=raw / 1024,
+        )
+        report(
+            "resume",
+            window_ms=best_of(log.tail, WINDOW_TOKENS) * 1000,
+            messages=len(log.tail(WINDOW_TOKENS)),
+        )
+        report("read_all", ms=best_of(log.read) * 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Benchmark a 10 MB agent transcript written through temporary_stdout()."""
+from __future__ import annotations
+
+import sys
+import threading
+import tracemalloc
+
+from common import CountingSink, best_of, report
+
+from madia.repl.utils import temporary_stdout
+
+TRANSCRIPT_BYTES = 10 * 1024 * 1024
+LEGACY_BYTES = 1024 * 1024
+TOKEN = "Thought: I should search "  # ~ a few LLM tokens per write
+
+
+class LegacyStreamWrapper:
+    """The previous implementation, keeping the whole text in one string."""
+
+    def __init__(self, original_stream):
+        self.original_stream = original_stream
+        self.lock = threading.Lock()
+        self.buffer = ""
+
+    def write(self, data):
+        with self.lock:
+            self.buffer += data
+            self.original_stream.write(data)
+            self.original_stream.flush()
+
+    def flush(self):
+        with self.lock:
+            self.original_stream.flush()
+
+    def clear(self):
+        with self.lock:
+            self.original_stream.write("\033[F\033[K" * self.buffer.count("\n"))
+            self.buffer = ""
+            self.original_stream.flush()
+
+
+def write_transcript(size):
+    written = 0
+    while written < size:
+        sys.stdout.write(TOKEN)
+        written += len(TOKEN)
+        if written % 800 < len(TOKEN):
+            sys.stdout.write("\n")
+
+
+def run_new(sink, size):
+    original, sys.stdout = sys.stdout, sink
+    try:
+        with temporary_stdout():
+            write_transcript(size)
+    finally:
+        sys.stdout = original
+
+
+def run_legacy(sink, size):
+    original = sys.stdout
+    wrapper = LegacyStreamWrapper(sink)
+    sys.stdout = wrapper
+    try:
+        write_transcript(size)
+    finally:
+        sys.stdout = original
+        wrapper.flush()
+        wrapper.clear()
+
+
+def measure(name, runner, size):
+    sink = CountingSink()
+    seconds = best_of(runner, sink, size, repeat=1)
+    tracemalloc.start()
+    runner(CountingSink(), size)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    report(
+        name,
+        mb=size / 2**20,
+        seconds=seconds,
+        peak_kb=peak / 1024,
+        sink_writes=sink.writes,
+        sink_flushes=sink.flushes,
+    )
+
+
+def main():
+    measure("stream_wrapper", run_new, TRANSCRIPT_BYTES)
+    measure("stream_wrapper_legacy", run_legacy, LEGACY_BYTES)
+
+
+if __name__ == "__main__":
+    main()
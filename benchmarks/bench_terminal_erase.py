@@ -0,0 +1,55 @@
+"""Benchmark erasing a 50k-line response with delete_stdout_content()."""
+from __future__ import annotations
+
+import sys
+
+from common import CountingSink, best_of, report
+
+from madia.repl.utils import delete_stdout_content
+
+LINES = 50_000
+LEGACY_LINES = 5_000
+
+
+def legacy_delete_stdout_content(content):
+    """The previous implementation, splitting the content once per line."""
+    if not content:
+        return
+    number_of_lines = content.count("\n")
+
+    for line_no in range(number_of_lines):
+        sys.stdout.write("\x1b[1A")
+        sys.stdout.flush()
+        sys.stdout.write(
+            "\r" + " " * len(content.split("\n")[number_of_lines - 1 - line_no]) + "\r"
+        )
+        sys.stdout.flush()
+    if number_of_lines == 0:
+        sys.stdout.write("\r")
+    sys.stdout.flush()
+
+
+def measure(name, delete_fn, lines):
+    content = "".join(f"line {i} " + "word " * (i % 40) + "\n" for i in range(lines))
+    sink = CountingSink()
+    original, sys.stdout = sys.stdout, sink
+    try:
+        seconds = best_of(delete_fn, content, repeat=1)
+    finally:
+        sys.stdout = original
+    report(
+        name,
+        lines=lines,
+        seconds=seconds,
+        sink_writes=sink.writes,
+        sink_flushes=sink.flushes,
+    )
+
+
+def main():
+    measure("delete_stdout_content", delete_stdout_content, LINES)
+    measure("delete_stdout_content_legacy", legacy_delete_stdout_content, LEGACY_LINES)
+
+
+if __name__ == "__main__":
+    main()
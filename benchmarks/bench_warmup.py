@@ -0,0 +1,72 @@
+"""Latency of a heavy command's first run, with and without completion warm-up.
+
+The command loads a fake model in 1 s on its first run, like BLIP weights
+for ``image caption``. The user types ``image caption <url>`` at a keystroke
+every 100 ms, each completed as prompt_toolkit does, then enters it.
+Reported: the command's latency once entered, and the slowest keystroke's
+completion, which the warm-up must not slow down.
+"""
+from __future__ import annotations
+
+import time
+from functools import lru_cache
+
+from common import report
+from prompt_toolkit.document import Document
+
+from madia.repl.base_repl import BaseRepl
+from madia.repl.warmup import WarmupRunner
+
+LOAD_SECONDS = 1.0
+KEYSTROKE_INTERVAL = 0.1
+TYPED = "image caption https://example.com/cat.jpg"
+
+
+def build_repl(warmup):
+    @lru_cache(maxsize=1)
+    def load_model():
+        time.sleep(LOAD_SECONDS)
+        return "model"
+
+    tree = {
+        "image": {
+            "cmd": lambda x: "image",
+            "child": {
+                "caption": {
+                    "cmd": lambda url: f"{load_model()} captioned {url}",
+                    "warmup": load_model,
+                },
+                "crop": {"cmd": lambda x: "cropped"},
+            },
+        },
+    }
+    repl = BaseRepl(tree)
+    repl.warmups = WarmupRunner() if warmup else None
+    return repl
+
+
+def run(name, warmup):
+    repl = build_repl(warmup)
+    completer = repl.CustomCompleter(repl.completion_dict, repl.warmups)
+    slowest = 0.0
+    for end in range(1, len(TYPED) + 1):
+        start = time.perf_counter()
+        list(completer.get_completions(Document(TYPED[:end]), None))
+        slowest = max(slowest, time.perf_counter() - start)
+        time.sleep(KEYSTROKE_INTERVAL)
+    start = time.perf_counter()
+    repl.execute_command(TYPED)
+    report(
+        name,
+        command_ms=(time.perf_counter() - start) * 1000,
+        slowest_keystroke_ms=slowest * 1000,
+    )
+
+
+def main():
+    run("no_warmup", False)
+    run("warmup", True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Helpers shared by the benchmark scripts.
+
+Run a benchmark from the repository root, e.g.:
+
+.. code-block:: bash
+
+    PYTHONPATH=src python benchmarks/bench_history.py
+"""
+from __future__ import annotations
+
+import time
+
+
+def best_of(fn, *args, repeat=5, **kwargs):
+    """Run ``fn`` ``repeat`` times and return the fastest wall time in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def percentile(values, q):
+    """Return the ``q`` (0-100) percentile of ``values``, nearest-rank method."""
+    ordered = sorted(values)
+    rank = max(1, round(q / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def report(name, **metrics):
+    """Print one benchmark result line."""
+    values = ", ".join(
+        f"{key}={value:.6g}" if isinstance(value, float) else f"{key}={value}"
+        for key, value in metrics.items()
+    )
+    print(f"{name}: {values}")
+
+
+class CountingSink:
+    """Stand-in for the terminal, counting writes and flushes."""
+
+    def __init__(self):
+        self.writes = self.flushes = self.size = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.size += len(data)
+
+    def flush(self):
+        self.flushes += 1
@@ -0,0 +1,350 @@
+"""Offline benchmark suite of the REPL, rendering and LLM plumbing.
+
+Every model and service is a fake from :mod:`madia.llm.fakes`, so the suite
+runs without network or API keys. Results are written as JSON, and compared
+with a baseline when one is given:
+
+.. code-block:: bash
+
+    PYTHONPATH=src python benchmarks/suite.py --output before.json
+    # ... change the code ...
+    PYTHONPATH=src python benchmarks/suite.py --baseline before.json
+
+The exit code is 1 when a case's best time got slower than the baseline's by
+more than ``--threshold`` (20% by default): the minimum is the least affected
+by other processes, the median is recorded too. ``--filter`` runs only the
+cases whose name contains it.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+from common import CountingSink
+
+# The suite never calls OpenAI, but ChatOpenAI wants a key to be built
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmarks")
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+CASES = {}
+
+
+def case(name, repeat=5):
+    """
+    Register a benchmark case.
+
+    The decorated function does the setup and returns the callable to time.
+    """
+
+    def register(setup):
+        CASES[name] = (setup, repeat)
+        return setup
+
+    return register
+
+
+@case("cold_start.cli", repeat=3)
+def cold_start():
+    env = dict(os.environ, MADIA_NO_DAEMON="1")
+    command = [sys.executable, "-m", "madia.cli", "hardcoded_print"]
+    return lambda: subprocess.run(
+        command, env=env, check=True, stdout=subprocess.DEVNULL
+    )
+
+
+@case("dispatch.10k_commands")
+def dispatch():
+    from bench_dispatch import FANOUT, build_tree
+
+    from madia.repl.commands import CommandTable
+
+    table = CommandTable(build_tree())
+    commands = [
+        f"c{i % FANOUT} c{i % FANOUT}_c{i % 7} c{i % FANOUT}_c{i % 7}_c{i % 5} hi"
+        for i in range(2000)
+    ]
+    return lambda: [table.execute(command) for command in commands]
+
+
+@case("completion.nested_tree")
+def completion():
+    from bench_dispatch import build_tree
+    from prompt_toolkit.document import Document
+
+    from madia.repl.base_repl import BaseRepl
+
+    completer = BaseRepl.CustomCompleter(build_tree(depth=2))
+    documents = [Document(f"c{i % 22} c{i % 22}_") for i in range(200)]
+    return lambda: [list(completer.get_completions(d, None)) for d in documents]
+
+
+@case("render.streaming_tokens")
+def streaming_render():
+    from madia.llm.utils import ShortProgressStringsHandler
+
+    tokens = [f"token{i} " for i in range(2000)]
+
+    def run():
+        handler = ShortProgressStringsHandler()
+        handler.banner_lines = []
+        with redirect_stdout(CountingSink()):
+            for token in tokens:
+                handler.on_llm_new_token(token)
+            handler.on_llm_end(None)
+
+    return run
+
+
+@case("render.highlighting")
+def highlighting():
+    from madia.repl.utils import detect_and_highlight_code
+
+    block = "Some text.\n```python\ndef add(a, b):\n    return a + b\n```\n"
+    answer = block * 20
+    return lambda: detect_and_highlight_code(answer)
+
+
+def _memory_turns(memory, turns=200):
+    for turn in range(turns):
+        memory.save_context(
+            {"question": f"Question {turn} " + "word " * 30},
+            {"text": f"Answer {turn} " + "word " * 80},
+        )
+        memory.load_memory_variables({})
+
+
+@case("memory.token_buffer")
+def token_buffer_memory():
+    from langchain.memory import ConversationTokenBufferMemory
+
+    from madia.llm.fakes import FakeChatModel
+
+    llm = FakeChatModel()
+    return lambda: _memory_turns(
+        ConversationTokenBufferMemory(
+            llm=llm, memory_key="chat_history", max_token_limit=1000
+        )
+    )
+
+
+@case("memory.rolling_summary")
+def rolling_summary_memory():
+    from madia.llm.conversation import RollingSummaryMemory
+    from madia.llm.fakes import FakeChatModel
+
+    llm = FakeChatModel(responses=["the gist " * 50])
+
+    def run():
+        memory = RollingSummaryMemory(llm=llm, summary_llm=llm, max_token_limit=1000)
+        _memory_turns(memory)
+        memory.wait()
+
+    return run
+
+
+@case("caching.history_suggest")
+def history_suggest():
+    from madia.repl.history import PrefixIndex
+
+    strings = [f"ai question number {i}" for i in range(100_000)]
+    index = PrefixIndex()
+    index.rebuild(strings)
+    prefixes = [f"ai question number {i}" for i in range(0, 100_000, 50)]
+    return lambda: [index.lookup(prefix) for prefix in prefixes]
+
+
+@case("caching.chat_client_pool")
+def chat_client_pool():
+    from madia.llm.clients import get_chat_client
+
+    return lambda: [get_chat_client("gpt-3.5-turbo") for _ in range(10_000)]
+
+
+@case("llm.chat_turns")
+def chat_turns():
+    from madia.llm.fakes import FakeChatModel
+    from madia.llm.openai_chat import BufferedWindowMessage
+
+    chat = BufferedWindowMessage()
+    chat.llm = chat.memory.llm = FakeChatModel(
+        responses=[" ".join(f"word{i}" for i in range(100))]
+    )
+
+    def run():
+        chat.memory.clear()
+        for turn in range(20):
+            chat.get_response(f"question {turn}")
+
+    return run
+
+
+@case("llm.search_agent")
+def search_agent():
+    from madia.llm.fakes import FakeChatModel, FakeSerper
+    from madia.llm.openai_search import BufferedSearchWindowMessage
+
+    search = BufferedSearchWindowMessage(
+        search=FakeSerper(["Madia is a REPL."]), agent="react"
+    )
+    search.llm = FakeChatModel(
+        cycle=True,
+        responses=[
+            "I should search.\nAction: Intermediate Answer\nAction Input: madia",
+            "I now know the final answer.\nFinal Answer: Madia is a REPL.",
+        ],
+    )
+
+    def run():
+        # The agent erases its progress output from the terminal
+        with redirect_stdout(CountingSink()):
+            for _ in range(10):
+                search.get_response("What is madia?")
+
+    return run
+
+
+@case("llm.search_agent_functions")
+def search_agent_functions():
+    from madia.llm.fakes import FakeChatModel, FakeSerper
+    from madia.llm.openai_search import BufferedSearchWindowMessage
+
+    search = BufferedSearchWindowMessage(
+        search=FakeSerper(["Madia is a REPL."]), agent="functions"
+    )
+    search.llm = FakeChatModel(
+        cycle=True,
+        responses=[
+            {
+                "name": "tool_calls",
+                "arguments": {
+                    "calls": [{"name": "search", "arguments": {"query": "madia"}}]
+                },
+            },
+            "Madia is a REPL.",
+        ],
+    )
+
+    def run():
+        with redirect_stdout(CountingSink()):
+            for _ in range(10):
+                search.get_response("What is madia?")
+
+    return run
+
+
+@case("llm.caption")
+def caption():
+    from PIL import Image
+
+    from madia.llm.blip_caption import caption_image_url
+    from madia.llm.fakes import fake_blip
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "image.png")
+    Image.new("RGB", (1024, 768), "teal").save(path)
+    blip = fake_blip(["a teal square"])
+    return lambda: [caption_image_url(path, blip=blip) for _ in range(10)]
+
+
+def run_case(name):
+    setup, repeat = CASES[name]
+    run = setup()
+    run()  # warm-up, e.g. lazy imports and caches
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "repeat": repeat,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print the change of each case and return the names of the regressions."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<32} {result['min'] * 1000:>10.3f} ms   (new)")
+            continue
+        ratio = result["min"] / base["min"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:<32} {result['min'] * 1000:>10.3f} ms "
+            f"{(ratio - 1) * 100:>+7.1f}%{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", default="")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = {}
+    for name in CASES:
+        if args.filter in name:
+            results[name] = run_case(name)
+            print(f"{name:<32} {results[name]['min'] * 1000:>10.3f} ms")
+
+    commit = git_commit()
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit or 'nogit'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "meta": {
+                    "commit": commit,
+                    "date": datetime.now(timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "machine": platform.platform(),
+                },
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        print(f"\nCompared with {args.baseline}:")
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,13 @@
 """Python Package Template"""
 from __future__ import annotations
 
-from madia.config import check_settings
+import time
+
+# Where the startup time reported by ``config stats`` starts
+_import_started = time.perf_counter()
+
+# After the timestamp, so the package's own imports are counted
+from madia.config import check_settings  # noqa: E402
 
 __version__ = "0.0.4"
 
@@ -1,22 +1,20 @@
 from __future__ import annotations
 
-import logging
+import os
 import sys
-from datetime import datetime
-from functools import partial
-from pprint import pformat
+import time
 
-from madia.config import save_settings, settings
-from madia.llm.openai_chat import BufferedWindowMessage
-from madia.llm.openai_search import BufferedSearchWindowMessage
-from madia.logger import get_buffered_logs, get_logger, show_logs_to_user
-from madia.options_dict import main_loop_options
-from madia.repl.base_repl import BaseRepl
+from madia.daemon import forward, serve
+from madia.logger import get_logger
 
 logger = get_logger(__name__)
 
 logger.info("Starting cli.py file")
 
+SHORTCUT_BANNER = (
+    "This is a shortcut, for any Madia Command that you can run via REPL\n"
+)
+
 
 def cli():
     """Command line interface for MadIA assistant.
@@ -29,7 +27,14 @@ def cli():
     to interactively chat with the assistant.
 
     If command line arguments are passed, it will execute that command using
-    the assistant and print the result.
+    the assistant and print the result. When a ``madia serve`` daemon is
+    running, the command is forwarded to it, skipping the imports and setup.
+    Set ``MADIA_NO_DAEMON=1`` to always run the command in-process.
+
+    ``madia --profile <command>`` runs the startup and the command under the
+    profiler, writing the results under ``~/.madia/profiles``, and
+    ``madia --profile import-time`` breaks down the startup imports. In the
+    REPL, prefix a command with ``profile`` to profile it.
 
     Usage:
 
@@ -42,21 +47,73 @@ def cli():
        madia.cli("hello") # Executes 'hello' command
 
     """
+    if sys.argv[1:2] == ["serve"]:
+        serve()
+        return
+    if sys.argv[1:2] == ["--profile"]:
+        # Always in-process, the profile is of this process
+        _run_profiled(sys.argv[2:])
+        return
+
+    if len(sys.argv) > 1 and not os.environ.get("MADIA_NO_DAEMON"):
+        print(SHORTCUT_BANNER)
+        exit_code = forward(sys.argv[1:])
+        if exit_code is not None:
+            sys.exit(exit_code)
+        _run_local(sys.argv[1:], print_banner=False)
+    else:
+        _run_local(sys.argv[1:])
+
+
+def _build_repl():
+    # Heavy imports, only paid for when no daemon does the work
+    import madia
+    from madia.metrics import STARTUP_COMMAND, metrics
+    from madia.options_dict import main_loop_options
+    from madia.repl.base_repl import BaseRepl
 
-    if len(sys.argv) == 1:
+    metrics.observe(
+        "startup",
+        time.perf_counter() - madia._import_started,  # pylint: disable=W0212
+        command=STARTUP_COMMAND,
+    )
+    return BaseRepl(main_loop_options, default_fn=print)
+
+
+def _run_local(argv, print_banner=True):
+    from madia.config import start_settings_watcher
+
+    if not argv:
         print("MadIA REPL with Autocomplete - Type 'exit' or 'quit' to exit.")
-        base_repl = BaseRepl(main_loop_options, default_fn=print)
+        # Pick up edits to ~/.madia/config.yaml without restarting the REPL
+        start_settings_watcher()
+        base_repl = _build_repl()
         base_repl.loop()
     else:
-        print("This is a shortcut, for any Madia Command that you can run via REPL\n")
-        base_repl = BaseRepl(main_loop_options, default_fn=print)
-        base_repl.present_result(
-            base_repl.execute_command(
-                " ".join(
-                    sys.argv[1:],
-                )
-            )
-        )
+        if print_banner:
+            print(SHORTCUT_BANNER)
+        base_repl = _build_repl()
+        base_repl.run_command(" ".join(argv))
+
+
+def _run_profiled(argv):
+    """Profile the startup and the command, or only the imports for import-time."""
+    from madia.config import start_settings_watcher
+    from madia.profiling import Profiler, profile_imports
+
+    if argv == ["import-time"]:
+        print(profile_imports())
+        return
+
+    with Profiler(" ".join(argv) or "startup") as profiler:
+        base_repl = _build_repl()
+        if argv:
+            base_repl.present_result(base_repl.execute_command(" ".join(argv)))
+    print(profiler.summary())
+    if not argv:
+        print("MadIA REPL with Autocomplete - Type 'exit' or 'quit' to exit.")
+        start_settings_watcher()
+        base_repl.loop()
 
 
 if __name__ == "__main__":
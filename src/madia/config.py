@@ -1,6 +1,11 @@
 from __future__ import annotations
 
+import inspect
+import logging
 import os
+import threading
+import weakref
+from types import MappingProxyType
 
 from dynaconf import Dynaconf, loaders
 from dynaconf.utils.boxing import DynaBox
@@ -8,12 +13,29 @@ from dynaconf.utils.boxing import DynaBox
 # Constants in uppercase
 SETTINGS_PATH = "~/.madia/config.yaml"
 ABS_SETTINGS_PATH = os.path.expanduser(SETTINGS_PATH)
+SETTINGS_ENV = "dev"
+SETTINGS_POLL_INTERVAL = 1.0
+DEFAULT_SETTINGS = {
+    "log_path": "~/.madia/logs",
+    "rep_hist_path": "~/.madia/repl_history",
+    "log_filename": "app.log",
+    "log_filename_full_fp": "app_fp.log",
+    "rep_hist": True,
+}
 # Load settings from Dynaconf
 settings = Dynaconf(
     settings_files=[ABS_SETTINGS_PATH],
     environments=True,  # Enable environment variable overrides
+    env=SETTINGS_ENV,
 )
 
+# The logger module depends on this one, so we can't use madia.logger here
+_logger = logging.getLogger(__name__)
+_settings_lock = threading.RLock()
+_subscribers = []
+_snapshot = MappingProxyType({})
+_watcher = None
+
 
 def save_settings():
     """Check if the settings are properly configured.
@@ -43,7 +65,7 @@ def save_settings():
     This will validate and add any missing default settings.
 
     """
-    data = settings.as_dict(env="dev")
+    data = settings.as_dict(env=SETTINGS_ENV)
 
     # Get the absolute path and directory of the config file
     config_dir = os.path.dirname(ABS_SETTINGS_PATH)
@@ -55,7 +77,7 @@ def save_settings():
         ABS_SETTINGS_PATH,
         DynaBox(data).to_dict(),
         merge=False,
-        env="dev",
+        env=SETTINGS_ENV,
     )
 
 
@@ -81,16 +103,10 @@ def check_settings():
 
     This will validate and add any missing default settings.
     """
-    default_settings = {
-        "log_path": "~/.madia/logs",
-        "rep_hist_path": "~/.madia/repl_history",
-        "log_filename": "app.log",
-        "log_filename_full_fp": "app_fp.log",
-        "rep_hist": True,
-    }
+    global _snapshot
 
     new_key = False
-    for key, value in default_settings.items():
+    for key, value in DEFAULT_SETTINGS.items():
         if not settings.get(key):
             if "path" in key and "~" in value:
                 os.makedirs(os.path.expanduser(value), exist_ok=True)
@@ -99,3 +115,170 @@ def check_settings():
 
     if new_key:
         save_settings()
+
+    with _settings_lock:
+        _snapshot = MappingProxyType(_normalize(settings.as_dict()))
+
+
+def _normalize(data):
+    return {str(key).lower(): value for key, value in data.items()}
+
+
+def settings_snapshot():
+    """Return the active settings as a read-only mapping.
+
+    The snapshot is replaced as a whole on every reload, so a reader holding
+    it never observes a half-applied config file. Keys are lowercase.
+
+    Returns:
+        Mapping[str, Any]: The settings in effect since the last (re)load.
+    """
+    return _snapshot
+
+
+def subscribe(callback, keys=None):
+    """Register a callback to be notified when the settings change.
+
+    The callback is invoked as ``callback(changed_keys, snapshot)`` after a
+    reload swaps in new settings. Bound methods are held weakly, so
+    subscribing an object doesn't keep it alive.
+
+    Args:
+        callback (Callable[[frozenset, Mapping], None]): Function to notify.
+        keys (Iterable[str], optional): Only notify when one of these keys
+            changed. Defaults to any key.
+
+    Returns:
+        Callable[[], None]: Function that removes the subscription.
+
+    Examples:
+
+        >>> unsubscribe = subscribe(print, keys=["log_path"])
+    """
+    if inspect.ismethod(callback):
+        ref = weakref.WeakMethod(callback)
+    else:
+        ref = lambda: callback  # noqa: E731
+    entry = (ref, frozenset(k.lower() for k in keys) if keys else None)
+    with _settings_lock:
+        _subscribers.append(entry)
+
+    def unsubscribe():
+        with _settings_lock:
+            if entry in _subscribers:
+                _subscribers.remove(entry)
+
+    return unsubscribe
+
+
+def reload_settings():
+    """Re-read the settings file and notify subscribers of what changed.
+
+    The file is parsed into a fresh Dynaconf instance first; if that fails the
+    active settings are left untouched. Keys missing from the file fall back
+    to :data:`DEFAULT_SETTINGS`.
+
+    Returns:
+        frozenset: The lowercase keys whose values changed.
+    """
+    global _snapshot
+
+    try:
+        fresh = Dynaconf(
+            settings_files=[ABS_SETTINGS_PATH], environments=True, env=SETTINGS_ENV
+        )
+        new_data = {**DEFAULT_SETTINGS, **_normalize(fresh.as_dict())}
+    except Exception:  # pylint: disable=broad-except
+        _logger.exception(
+            "Unable to reload %s, keeping current settings", SETTINGS_PATH
+        )
+        return frozenset()
+
+    with _settings_lock:
+        old_data = _snapshot
+        changed = frozenset(
+            key
+            for key in old_data.keys() | new_data.keys()
+            if old_data.get(key) != new_data.get(key)
+        )
+        if not changed:
+            return changed
+        for key in changed:
+            if key in new_data:
+                settings.set(key, new_data[key])
+            else:
+                settings.unset(key)
+        _snapshot = MappingProxyType(new_data)
+        subscribers = list(_subscribers)
+
+    _logger.info("Settings reloaded, changed keys: %s", sorted(changed))
+    for ref, keys in subscribers:
+        callback = ref()
+        if callback is None:
+            with _settings_lock:
+                if (ref, keys) in _subscribers:
+                    _subscribers.remove((ref, keys))
+            continue
+        if keys is not None and not keys & changed:
+            continue
+        try:
+            callback(changed, _snapshot)
+        except Exception:  # pylint: disable=broad-except
+            _logger.exception("Settings subscriber %r failed", callback)
+    return changed
+
+
+class SettingsWatcher(threading.Thread):
+    """
+    Daemon thread reloading the settings whenever the config file changes.
+
+    It polls the file's mtime and size, which works on every platform and is
+    cheap enough at a one second interval.
+
+    Attributes:
+        path (str): The file being watched.
+        interval (float): Seconds between polls.
+    """
+
+    def __init__(self, path=ABS_SETTINGS_PATH, interval=SETTINGS_POLL_INTERVAL):
+        super().__init__(name="madia-settings-watcher", daemon=True)
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._last_stat = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            current = self._stat()
+            if current != self._last_stat:
+                self._last_stat = current
+                reload_settings()
+
+    def stop(self):
+        """Stop polling; the thread exits after the current interval."""
+        self._stop_event.set()
+
+
+def start_settings_watcher(interval=SETTINGS_POLL_INTERVAL):
+    """Start the process wide :class:`SettingsWatcher`, if not running yet.
+
+    Args:
+        interval (float, optional): Seconds between polls of the config file.
+
+    Returns:
+        SettingsWatcher: The running watcher.
+    """
+    global _watcher
+
+    with _settings_lock:
+        if _watcher is None or not _watcher.is_alive():
+            _watcher = SettingsWatcher(interval=interval)
+            _watcher.start()
+        return _watcher
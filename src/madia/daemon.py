@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from contextlib import contextmanager, redirect_stdout
+
+from madia.config import settings
+from madia.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_SOCKET_PATH = "~/.madia/madia.sock"
+# stdout and the COLUMNS variable are process-wide, commands run one at a time
+_command_lock = threading.Lock()
+
+
+def socket_path():
+    """
+    Return the daemon's Unix socket path.
+
+    The ``MADIA_DAEMON_SOCKET`` environment variable wins over the
+    ``daemon_socket`` setting.
+
+    Returns:
+        str: The absolute socket path.
+    """
+    path = os.environ.get("MADIA_DAEMON_SOCKET") or settings.get(
+        "daemon_socket", DEFAULT_SOCKET_PATH
+    )
+    return os.path.expanduser(path)
+
+
+def _send(wfile, **frame):
+    wfile.write(json.dumps(frame).encode("utf-8") + b"\n")
+    wfile.flush()
+
+
+class _FrameWriter:
+    """File-like object sending what is written as ``out`` frames."""
+
+    def __init__(self, wfile, tty):
+        self.wfile = wfile
+        self.tty = tty
+
+    def write(self, data):
+        if data:
+            _send(self.wfile, out=data)
+        return len(data)
+
+    def flush(self):
+        self.wfile.flush()
+
+    def isatty(self):
+        return self.tty
+
+
+@contextmanager
+def _client_columns(columns):
+    """Set ``COLUMNS`` to the client's width, restoring it afterwards."""
+    from madia.repl.terminal import reset_terminal_size
+
+    previous = os.environ.get("COLUMNS")
+    if columns:
+        os.environ["COLUMNS"] = str(columns)
+    reset_terminal_size()
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop("COLUMNS", None)
+        else:
+            os.environ["COLUMNS"] = previous
+        reset_terminal_size()
+
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        from madia.repl.utils import safe_shlex_split
+
+        line = self.rfile.readline()
+        if not line:  # a ping, the client only checked we're listening
+            return
+        request = json.loads(line)
+        command = " ".join(request["argv"])
+        repl = self.server.repl
+
+        # Split as BaseRepl.execute_command does, to find the same command
+        found, _ = repl.commands.resolve(safe_shlex_split(command))
+        if found and found.node.get("interactive"):
+            # It needs the client's terminal, let the client run it
+            _send(self.wfile, local=True)
+            return
+
+        columns = request.get("columns")
+        writer = _FrameWriter(self.wfile, request.get("tty", False))
+        exit_code = 0
+        with _command_lock, _client_columns(columns), redirect_stdout(writer):
+            try:
+                repl.run_command(command)
+            except (Exception, SystemExit):  # pylint: disable=broad-except
+                traceback.print_exc(file=writer)
+                exit_code = 1
+        _send(self.wfile, exit=exit_code)
+
+
+class MadiaDaemon(socketserver.UnixStreamServer):
+    """
+    Unix socket server running commands in a warm process.
+
+    The command tree, the LLM sessions behind it and any loaded model stay in
+    memory between commands, so only the first one pays for the imports and
+    setup. Commands run one at a time, as they share ``sys.stdout``.
+
+    Args:
+        path (str): The socket path.
+        repl (BaseRepl): The REPL whose commands are served.
+    """
+
+    def __init__(self, path, repl):
+        self.repl = repl
+        # bind() creates the socket, owner only from the start, not after a chmod
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, _CommandHandler)
+        finally:
+            os.umask(umask)
+
+
+def serve(path=None):
+    """
+    Run the ``madia serve`` daemon until interrupted.
+
+    Args:
+        path (str, optional): The socket path, defaults to :func:`socket_path`.
+    """
+    from madia.config import start_settings_watcher
+    from madia.options_dict import main_loop_options
+    from madia.repl.base_repl import BaseRepl
+
+    path = path or socket_path()
+    if os.path.exists(path):
+        if forward(["--ping"], path) is not None:
+            print(f"A madia daemon is already listening on {path}")
+            return
+        os.unlink(path)  # stale socket from a daemon that died
+
+    start_settings_watcher()
+    server = MadiaDaemon(path, BaseRepl(main_loop_options, default_fn=print))
+    print(f"madia daemon listening on {path}")
+    logger.info("Daemon listening on %s", path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping madia daemon")
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
+def forward(argv, path=None):
+    """
+    Run a command in the daemon, streaming its output to stdout.
+
+    Args:
+        argv (List[str]): The command line arguments, without the program.
+        path (str, optional): The socket path, defaults to :func:`socket_path`.
+
+    Returns:
+        int, optional: The command's exit code, or None when no daemon is
+        listening or the command must run locally.
+    """
+    path = path or socket_path()
+    try:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(path)
+    except OSError:
+        return None
+
+    # Held before the command starts, a daemon in this process, as in the
+    # tests, redirects sys.stdout while it runs
+    stdout = sys.stdout
+    with client, client.makefile("rwb") as stream:
+        if argv == ["--ping"]:
+            return 0
+        _send(
+            stream,
+            argv=argv,
+            columns=shutil.get_terminal_size().columns,
+            tty=stdout.isatty(),
+        )
+        for line in stream:
+            frame = json.loads(line)
+            if "out" in frame:
+                stdout.write(frame["out"])
+                stdout.flush()
+            elif "exit" in frame:
+                return frame["exit"]
+            elif frame.get("local"):
+                return None
+    return None
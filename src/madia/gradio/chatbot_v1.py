@@ -1,15 +1,46 @@
 from __future__ import annotations
 
 import gradio as gr
-import openai
-from langchain.callbacks.base import BaseCallbackHandler
-from langchain.chat_models import ChatOpenAI
-from langchain.schema import AIMessage, HumanMessage
 
+from madia.config import settings
+from madia.gradio.sessions import (DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_TOKENS,
+                                   SessionStore)
+from madia.llm.clients import get_chat_client
 
-class ShortProgressStringsHandler(BaseCallbackHandler):
-    def on_llm_new_token(self, token: str, **kwargs) -> None:
-        yield token
+DEFAULT_MODEL = "gpt-3.5-turbo-0613"
+DEFAULT_CONCURRENCY_COUNT = 16
+DEFAULT_MAX_SIZE = 128
+
+
+def build_predict(llm, sessions):
+    """
+    Build the Gradio chat function streaming answers from ``llm``.
+
+    The conversation is kept server side in ``sessions``, keyed by the Gradio
+    session, so the client doesn't send the history back with each message.
+
+    Args:
+        llm (BaseChatModel): The chat model, shared by all the users.
+        sessions (SessionStore): The users' conversations.
+
+    Returns:
+        Callable[[str, gr.Request], Iterator[tuple]]: A generator function
+        yielding the cleared textbox and the chat, with the partial answer,
+        as the tokens arrive.
+    """
+
+    def predict(message, request: gr.Request):
+        session = sessions.get(request.session_hash)
+        prompt = session.prompt_for(message)
+        display = list(session.display)
+
+        answer = ""
+        for chunk in llm.stream(prompt):
+            answer += chunk.content
+            yield "", display + [[message, answer]]
+        sessions.record(session, message, answer)
+
+    return predict
 
 
 def cb_fn(_):
@@ -21,17 +52,30 @@ def cb_fn(_):
 
     #chatbot { flex-grow: 1; overflow: auto;}
     """
-    llm = ChatOpenAI(temperature=1.0, model="gpt-3.5-turbo-0613")
-
-    def predict(message, history):
-        history_langchain_format = []
-        for human, ai in history:
-            history_langchain_format.append(HumanMessage(content=human))
-            history_langchain_format.append(AIMessage(content=ai))
-        history_langchain_format.append(HumanMessage(content=message))
-        gpt_response = llm(
-            history_langchain_format, callbacks=[ShortProgressStringsHandler()]
+    llm = get_chat_client(settings.get("gradio_model", DEFAULT_MODEL), temperature=1.0)
+    sessions = SessionStore(
+        llm,
+        max_tokens=settings.get("gradio_max_tokens", DEFAULT_MAX_TOKENS),
+        summarize=settings.get("gradio_summarize", False),
+        idle_timeout=settings.get("gradio_session_idle_seconds", DEFAULT_IDLE_TIMEOUT),
+    )
+
+    def clear(request: gr.Request):
+        sessions.drop(request.session_hash)
+        return []
+
+    with gr.Blocks(css=CSS, theme=gr.themes.Soft()) as demo:
+        chatbot = gr.Chatbot(elem_id="chatbot")
+        textbox = gr.Textbox(
+            placeholder="Type a message...", show_label=False, container=False
         )
-        return gpt_response.content
+        clear_btn = gr.Button("🗑️  Clear")
+        textbox.submit(build_predict(llm, sessions), textbox, [textbox, chatbot])
+        clear_btn.click(clear, None, chatbot, queue=False)
 
-    gr.ChatInterface(predict, css=CSS, theme=gr.themes.Soft()).queue().launch()
+    demo.queue(
+        concurrency_count=settings.get(
+            "gradio_concurrency_count", DEFAULT_CONCURRENCY_COUNT
+        ),
+        max_size=settings.get("gradio_max_size", DEFAULT_MAX_SIZE),
+    ).launch()
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+from madia.llm.conversation import TokenWindow
+from madia.llm.utils import summarize_messages
+from madia.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_TOKENS = 2000
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+
+
+class ChatSession:
+    """
+    The conversation of one Gradio session, kept on the server.
+
+    The prompt is built from a :class:`madia.llm.conversation.TokenWindow`,
+    so it never exceeds ``max_tokens`` however long the chat gets. Turns
+    falling out of the window are optionally folded into a summary that is
+    sent as a system message.
+
+    Attributes:
+        window (TokenWindow): The recent messages sent to the model.
+        summary (str): Summary of the turns evicted from the window.
+        display (List[List[str]]): The ``[human, ai]`` pairs shown in the chat.
+        last_access (float): ``time.monotonic()`` of the last request.
+    """
+
+    def __init__(self, llm, max_tokens=DEFAULT_MAX_TOKENS):
+        self.window = TokenWindow(llm, max_tokens)
+        self.summary = ""
+        self.display = []
+        self.last_access = time.monotonic()
+        self.lock = threading.Lock()
+
+    def prompt_for(self, message):
+        """
+        Build the messages to send to the model for a new user message.
+
+        Args:
+            message (str): The user's message.
+
+        Returns:
+            List[BaseMessage]: The summary, recent turns and new message.
+        """
+        with self.lock:
+            self.last_access = time.monotonic()
+            prompt = list(self.window)
+            if self.summary:
+                prompt.insert(
+                    0, SystemMessage(content=f"Conversation summary: {self.summary}")
+                )
+        prompt.append(HumanMessage(content=message))
+        return prompt
+
+    def record(self, message, answer):
+        """
+        Add a completed turn to the conversation.
+
+        Args:
+            message (str): The user's message.
+            answer (str): The model's answer.
+
+        Returns:
+            List[BaseMessage]: The messages evicted from the window.
+        """
+        with self.lock:
+            self.display.append([message, answer])
+            evicted = self.window.append(HumanMessage(content=message))
+            evicted += self.window.append(AIMessage(content=answer))
+        return evicted
+
+    def fold_into_summary(self, llm, messages):
+        """Summarize evicted messages into :attr:`summary`."""
+        with self.lock:
+            summary = self.summary
+        try:
+            summary = summarize_messages(llm, summary, messages)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Unable to summarize %d messages", len(messages))
+            return
+        with self.lock:
+            self.summary = summary
+
+
+class SessionStore:
+    """
+    The :class:`ChatSession` of every connected Gradio user.
+
+    Sessions idle for longer than ``idle_timeout`` seconds are evicted, which
+    is checked at most once a minute when a session is looked up.
+
+    Args:
+        llm (BaseChatModel): The model, used to count and summarize tokens.
+        max_tokens (int, optional): Token budget of each session's window.
+        summarize (bool, optional): Summarize the turns leaving the window.
+            Summaries are written in a background thread, off the request path.
+        idle_timeout (float, optional): Seconds before an idle session is
+            evicted.
+    """
+
+    SWEEP_INTERVAL = 60
+
+    def __init__(
+        self,
+        llm,
+        max_tokens=DEFAULT_MAX_TOKENS,
+        summarize=False,
+        idle_timeout=DEFAULT_IDLE_TIMEOUT,
+    ):
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._summarizer = ThreadPoolExecutor(1, "madia-summarizer")
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id):
+        """
+        Return the session, creating it on first use.
+
+        Args:
+            session_id (str): The Gradio ``session_hash``.
+
+        Returns:
+            ChatSession: The session.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep >= self.SWEEP_INTERVAL:
+                self._sweep(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = ChatSession(
+                    self.llm, self.max_tokens
+                )
+        return session
+
+    def _sweep(self, now):
+        self._last_sweep = now
+        idle = [
+            session_id
+            for session_id, session in self._sessions.items()
+            if now - session.last_access > self.idle_timeout
+        ]
+        for session_id in idle:
+            del self._sessions[session_id]
+        if idle:
+            logger.debug("Evicted %d idle chat sessions", len(idle))
+
+    def drop(self, session_id):
+        """Forget a session, e.g. when the user clears the chat."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def record(self, session, message, answer):
+        """
+        Add a completed turn to a session, summarizing evicted turns if enabled.
+
+        Args:
+            session (ChatSession): The session.
+            message (str): The user's message.
+            answer (str): The model's answer.
+        """
+        evicted = session.record(message, answer)
+        if evicted and self.summarize:
+            self._summarizer.submit(session.fold_into_summary, self.llm, evicted)
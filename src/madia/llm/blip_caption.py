@@ -1,20 +1,37 @@
 from __future__ import annotations
 
-import requests
-import torch
-from PIL import Image
-from transformers import BlipForConditionalGeneration, BlipProcessor
+from functools import lru_cache
 
+from madia.llm.caption_cache import ImageKey, caption_params, get_caption_cache
+from madia.llm.images import decode_image, image_data, is_many, iter_images
+from madia.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_BLIP_MODEL = "Salesforce/blip-image-captioning-large"
+# The input of BLIP, when the processor doesn't tell
+DEFAULT_INPUT_SIZE = 384
+
+
+@lru_cache(maxsize=2)
+def load_blip(hf_model):
+    """
+    Load a BLIP processor and model, once per process.
+
+    torch and transformers come with the optional ``local_llm`` extra, so
+    they are only imported here. Keeping the loaded model around makes every
+    caption after the first one skip the multi-second load, e.g. in the
+    ``madia serve`` daemon.
+
+    Args:
+        hf_model (str): The Hugging Face model name.
+
+    Returns:
+        tuple: The processor, the model and the device it runs on.
+    """
+    import torch
+    from transformers import BlipForConditionalGeneration, BlipProcessor
 
-def caption_image_url(
-    img_url,
-    hf_model="Salesforce/blip-image-captioning-large",
-    *,
-    input_text="",
-    return_tensors="pt",
-    max_new_tokens=100,
-    skip_special_tokens=True,
-):
     # use GPU if it's available
     device = "cuda" if torch.cuda.is_available() else "cpu"
 
@@ -22,8 +39,36 @@ def caption_image_url(
     processor = BlipProcessor.from_pretrained(hf_model)
     # then we initialize the model itself
     model = BlipForConditionalGeneration.from_pretrained(hf_model).to(device)
+    return processor, model, device
+
+
+def load_image(source, size=None):
+    """
+    Open an image from a local path or a URL.
+
+    Args:
+        source (str): The image's path or URL.
+        size (int, optional): Decode JPEGs at a reduced resolution, still
+            at least this size, see :func:`madia.llm.images.decode_image`.
+
+    Returns:
+        Image.Image: The image, in RGB.
+    """
+    with image_data(source) as data:
+        return decode_image(data, size)
+
+
+def input_size(processor):
+    """Return the side of the model's input images, in pixels."""
+    size = getattr(getattr(processor, "image_processor", None), "size", None)
+    return max(size.values()) if size else DEFAULT_INPUT_SIZE
 
-    image = Image.open(requests.get(img_url, stream=True).raw).convert("RGB")
+
+def _generate_caption(
+    blip, data, input_text, return_tensors, max_new_tokens, skip_special_tokens
+):
+    processor, model, device = blip
+    image = decode_image(data, input_size(processor))
 
     # unconditional image captioning
     inputs = processor(image, input_text, return_tensors=return_tensors).to(device)
@@ -31,3 +76,97 @@ def caption_image_url(
     out = model.generate(**inputs, max_new_tokens=max_new_tokens)
 
     return processor.decode(out[0], skip_special_tokens=skip_special_tokens)
+
+
+def caption_images(
+    source,
+    hf_model=DEFAULT_BLIP_MODEL,
+    *,
+    input_text="",
+    return_tensors="pt",
+    max_new_tokens=100,
+    skip_special_tokens=True,
+    blip=None,
+    cache=None,
+):
+    """
+    Caption the images of a URL, file, glob or directory, one at a time.
+
+    Each image is memory-mapped when local, and JPEGs are decoded close to
+    the model's input size, not at their full resolution.
+
+    Args:
+        source (str): See :func:`madia.llm.images.iter_images`.
+        hf_model (str, optional): The BLIP model.
+        input_text (str, optional): The text the captions start with.
+        blip (tuple, optional): Replaces the model, e.g. with
+            :func:`madia.llm.fakes.fake_blip`. Its captions aren't the
+            model's, so they are only cached in a given ``cache``.
+        cache (CaptionCache, optional): The captions cache, the one of the
+            settings if None, none if False.
+
+    Yields:
+        Tuple[str, str]: Each image's path or URL and its caption. For a
+        directory or glob, an image that can't be read or captioned gets an
+        ``Error: ...`` caption instead of stopping the others.
+
+    Raises:
+        Exception: For a single image, why it couldn't be captioned.
+    """
+    if cache is False:
+        cache = None
+    elif cache is None and blip is None:
+        cache = get_caption_cache()
+    params = caption_params(
+        hf_model,
+        input_text,
+        max_new_tokens=max_new_tokens,
+        skip_special_tokens=skip_special_tokens,
+    )
+
+    many = is_many(source)
+    for path in iter_images(source):
+        try:
+            with image_data(path) as data:
+                key = caption = None
+                if cache is not None:
+                    key = ImageKey(data)
+                    caption = cache.get(params, key)
+                if caption is None:
+                    caption = _generate_caption(
+                        blip or load_blip(hf_model),
+                        data,
+                        input_text,
+                        return_tensors,
+                        max_new_tokens,
+                        skip_special_tokens,
+                    )
+                    if cache is not None:
+                        cache.put(params, key, caption)
+        except Exception as error:  # pylint: disable=broad-except
+            if not many:
+                raise
+            # One corrupt file doesn't lose the batch's other captions
+            logger.warning("Unable to caption %s", path, exc_info=True)
+            caption = f"Error: {type(error).__name__}: {error}"
+        yield path, caption
+
+
+def caption_image_url(img_url, hf_model=DEFAULT_BLIP_MODEL, **kwargs):
+    """
+    Caption an image, or every image of a directory or glob.
+
+    Args:
+        img_url (str): A URL, a file, a glob or a directory.
+        hf_model (str, optional): The BLIP model.
+        **kwargs: See :func:`caption_images`.
+
+    Returns:
+        str: The caption, or one ``path: caption`` line per image.
+    """
+    captions = caption_images(img_url, hf_model, **kwargs)
+    if is_many(img_url):
+        lines = [f"{path}: {caption}" for path, caption in captions]
+    else:
+        lines = [caption for _, caption in captions]
+    return "\n".join(lines) if lines else f"No images found at {img_url}"
@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+
+from madia.config import settings
+from madia.llm.images import open_image
+from madia.logger import get_logger
+from madia.utils_string import string_to_md5
+
+logger = get_logger(__name__)
+
+DEFAULT_CACHE_PATH = "~/.madia/cache/captions.sqlite3"
+DEFAULT_MAX_ENTRIES = 10_000
+# Hashes this many bits apart are the same picture
+DEFAULT_MAX_DISTANCE = 4
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+# The 64 bits of a hash are split in 5 bands, of 13 bits but the last of 12.
+# A copy whose hash is at most 4 bits away has at most 4 bands changed, so
+# it shares at least one band with the original
+BANDS = DEFAULT_MAX_DISTANCE + 1
+BAND_BITS = -(-HASH_BITS // BANDS)
+# Bumped when the bands' layout changes, the bands are then rebuilt
+BANDS_VERSION = 1
+# JPEGs are decoded at 1/8 scale or less, the hash only needs 9x8 pixels
+DECODE_SIZE = 64
+# A hash with fewer bits set, or unset, is of a flat picture, e.g. a blank
+# page, matched by its bytes only: flat pictures all look the same
+MIN_HASH_BITS = 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captions (
+    id INTEGER PRIMARY KEY,
+    params TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    fingerprint INTEGER NOT NULL,
+    caption TEXT NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS captions_digest ON captions (params, digest);
+CREATE INDEX IF NOT EXISTS captions_used ON captions (used);
+CREATE TABLE IF NOT EXISTS bands (
+    params TEXT NOT NULL,
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    id INTEGER NOT NULL REFERENCES captions (id) ON DELETE CASCADE,
+    PRIMARY KEY (params, band, value, id)
+) WITHOUT ROWID;
+"""
+
+
+def dhash(image):
+    """
+    Return the 64 bits difference hash of an image.
+
+    Each bit tells whether a pixel is brighter than its right neighbour, in
+    the image shrunk to 9x8 grey pixels, so resized or re-encoded copies of
+    a picture get the same hash, or one a few bits apart.
+
+    Args:
+        image (Image.Image): The image, not loaded yet for JPEGs to be
+            decoded at a reduced size.
+
+    Returns:
+        int: The hash.
+    """
+    image.draft("L", (DECODE_SIZE, DECODE_SIZE))
+    pixels = list(
+        image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR).getdata()
+    )
+    value = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + column]
+            value = value << 1 | (left > pixels[row * (HASH_SIZE + 1) + column + 1])
+    return value
+
+
+def _is_flat(value):
+    bits = bin(value).count("1")
+    return min(bits, HASH_BITS - bits) < MIN_HASH_BITS
+
+
+def _signed(value):
+    # SQLite integers are signed 64 bits
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bands(fingerprint):
+    # The last band holds the bits left, the mask doesn't go past the hash
+    fingerprint &= (1 << HASH_BITS) - 1
+    mask = (1 << BAND_BITS) - 1
+    return [(band, fingerprint >> (band * BAND_BITS) & mask) for band in range(BANDS)]
+
+
+class ImageKey:
+    """
+    The keys of an image in the cache: the MD5 of its bytes, and its
+    :func:`dhash`, decoded on first use only.
+
+    Passed to :meth:`CaptionCache.get` then :meth:`CaptionCache.put`, the
+    image is hashed once for both.
+
+    Args:
+        data (Union[mmap.mmap, bytes]): The image file's content.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.digest = hashlib.md5(data).hexdigest()
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = dhash(open_image(self.data))
+        return self._fingerprint
+
+
+def _image_key(data):
+    return data if isinstance(data, ImageKey) else ImageKey(data)
+
+
+class CaptionCache:
+    """
+    Captions cache in SQLite, keyed by the captioning parameters and image.
+
+    An image is found by the MD5 of its bytes first, then by its
+    :func:`dhash`, so the same picture under another URL, size or encoding
+    hits too, and its bytes are then cached as well. Close hashes are found
+    through the bands of their bits, like in locality-sensitive hashing, with
+    no scan of the table. Flat pictures are only found by their bytes.
+
+    The least recently used captions are evicted past ``max_entries``.
+
+    Args:
+        path (str): The SQLite file, ``:memory:`` for a cache in memory.
+        max_entries (int, optional): The most captions kept.
+        max_distance (int, optional): The most bits two hashes of the same
+            picture differ by, at most ``BANDS - 1``.
+
+    Attributes:
+        hits (int): Lookups found by their bytes or hash.
+        misses (int): Lookups not found.
+
+    Raises:
+        ValueError: If ``max_distance`` is too large for the bands to find
+            every close hash.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        cache = CaptionCache("~/.madia/cache/captions.sqlite3")
+        params = caption_params("Salesforce/blip-image-captioning-large")
+        key = ImageKey(data)
+        caption = cache.get(params, key)
+        if caption is None:
+            caption = caption_image(data)
+            cache.put(params, key, caption)
+    """
+
+    def __init__(
+        self,
+        path,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        max_distance=DEFAULT_MAX_DISTANCE,
+    ):
+        if max_distance >= BANDS:
+            raise ValueError(
+                f"max_distance is at most {BANDS - 1}, the close hashes would "
+                "not all share a band"
+            )
+        if path != ":memory:":
+            path = os.path.expanduser(path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+        # Shared by the daemon's threads, behind the lock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(SCHEMA)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != BANDS_VERSION:
+            self._rebuild_bands()
+
+    def _rebuild_bands(self):
+        # Caches written with other bands would miss their close hashes
+        with self.db:
+            self.db.execute("DELETE FROM bands")
+            rows = self.db.execute(
+                "SELECT id, params, fingerprint FROM captions"
+            ).fetchall()
+            self.db.executemany(
+                "INSERT INTO bands (params, band, value, id) VALUES (?, ?, ?, ?)",
+                [
+                    (params, band, band_value, row_id)
+                    for row_id, params, fingerprint in rows
+                    if not _is_flat(fingerprint & (1 << HASH_BITS) - 1)
+                    for band, band_value in _bands(fingerprint)
+                ],
+            )
+            self.db.execute(f"PRAGMA user_version = {BANDS_VERSION}")
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM captions").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def get(self, params, data):
+        """
+        Return the caption of an image, or None.
+
+        Args:
+            params (str): The key of the captioning parameters, see
+                :func:`caption_params`.
+            data (Union[mmap.mmap, bytes, ImageKey]): The image file's
+                content, or its key to hash it once for a miss's :meth:`put`.
+
+        Returns:
+            str: The cached caption, or None.
+        """
+        key = _image_key(data)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT id, caption FROM captions WHERE params = ? AND digest = ?",
+                (params, key.digest),
+            ).fetchone()
+        by_hash = row is None
+        if by_hash:
+            # Only decoded when the bytes are new
+            value = key.fingerprint
+            row = None if _is_flat(value) else self._nearest(params, value)
+        with self.lock, self.db:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.db.execute(
+                "UPDATE captions SET used = ? WHERE id = ?", (time.time(), row[0])
+            )
+            if by_hash:
+                # The next lookup of these bytes doesn't decode them. Stored
+                # with the hash it matched and no bands, so a copy of a copy
+                # can't drift further than max_distance from the original
+                self._insert(params, key.digest, row[2], row[1], banded=False)
+        return row[1]
+
+    def _nearest(self, params, value):
+        conditions = " OR ".join(["(band = ? AND value = ?)"] * BANDS)
+        arguments = [item for band in _bands(value) for item in band]
+        with self.lock:
+            candidates = self.db.execute(
+                "SELECT DISTINCT captions.id, fingerprint, caption FROM bands "
+                "JOIN captions USING (id) "
+                f"WHERE bands.params = ? AND ({conditions})",
+                (params, *arguments),
+            ).fetchall()
+        best = None
+        for row_id, fingerprint, caption in candidates:
+            distance = bin((fingerprint ^ _signed(value)) & (1 << 64) - 1).count("1")
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, row_id, caption, fingerprint)
+        return best and best[1:]
+
+    def put(self, params, data, caption):
+        """
+        Cache the caption of an image, evicting the least recently used.
+
+        Args:
+            params (str): The key of the captioning parameters.
+            data (Union[mmap.mmap, bytes, ImageKey]): The image file's
+                content, or the key its :meth:`get` hashed.
+            caption (str): Its caption.
+        """
+        key = _image_key(data)
+        value = key.fingerprint
+        with self.lock, self.db:
+            self._insert(params, key.digest, value, caption)
+
+    def _insert(self, params, digest, value, caption, banded=True):
+        # In a transaction, with the lock held
+        row_id = self.db.execute(
+            "INSERT INTO captions (params, digest, fingerprint, caption, used) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (params, digest, _signed(value), caption, time.time()),
+        ).lastrowid
+        if banded and not _is_flat(value):
+            self.db.executemany(
+                "INSERT INTO bands (params, band, value, id) VALUES (?, ?, ?, ?)",
+                [
+                    (params, band, band_value, row_id)
+                    for band, band_value in _bands(value)
+                ],
+            )
+        count = self.db.execute("SELECT COUNT(*) FROM captions").fetchone()[0]
+        if count > self.max_entries:
+            self.db.execute(
+                "DELETE FROM captions WHERE id IN "
+                "(SELECT id FROM captions ORDER BY used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+
+def caption_params(hf_model, input_text="", **generation):
+    """
+    Return the cache key of the captioning parameters.
+
+    Args:
+        hf_model (str): The BLIP model.
+        input_text (str, optional): The text the caption starts with.
+        **generation: The generation parameters, e.g. ``max_new_tokens``.
+
+    Returns:
+        str: The key.
+    """
+    return string_to_md5(
+        hf_model, input_text, json.dumps(generation, sort_keys=True, default=str)
+    )
+
+
+_caption_cache = None
+_caption_cache_lock = threading.Lock()
+
+
+def get_caption_cache():
+    """
+    Return the cache configured by the ``caption_cache*`` settings, or None.
+
+    The cache is on unless ``caption_cache`` is false, in
+    ``caption_cache_path`` with at most ``caption_cache_max_entries``
+    captions.
+    """
+    global _caption_cache  # pylint: disable=global-statement
+    if not settings.get("caption_cache", True):
+        return None
+    with _caption_cache_lock:
+        if _caption_cache is None:
+            _caption_cache = CaptionCache(
+                settings.get("caption_cache_path", DEFAULT_CACHE_PATH),
+                max_entries=settings.get(
+                    "caption_cache_max_entries", DEFAULT_MAX_ENTRIES
+                ),
+            )
+    return _caption_cache
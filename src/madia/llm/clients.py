@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import socket
+import threading
+from typing import Any
+from urllib.parse import urlsplit
+
+import openai
+from langchain.chat_models import ChatOpenAI
+
+from madia.config import settings
+from madia.llm.hedging import HedgingMixin, get_hedge_policy
+from madia.llm.singleflight import SingleFlightMixin
+from madia.llm.utils import metrics_handler
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class MadiaChatOpenAI(SingleFlightMixin, HedgingMixin, ChatOpenAI):
+    """
+    ``ChatOpenAI`` with the request policies of madia.
+
+    Identical concurrent requests are sent once, see
+    :mod:`madia.llm.singleflight`, then slow streaming requests are hedged,
+    see :mod:`madia.llm.hedging`.
+
+    Attributes:
+        single_flight (bool): Whether identical requests are coalesced.
+        hedge_policy (HedgePolicy, optional): When to hedge, never if None.
+    """
+
+    single_flight: bool = True
+    hedge_policy: Any = None
+
+
+def build_chat_client(model, **kwargs):
+    """
+    Build a :class:`MadiaChatOpenAI` with the policies set in the settings.
+
+    Args:
+        model (str): The OpenAI model name.
+        **kwargs: Other ``ChatOpenAI`` parameters.
+
+    Returns:
+        MadiaChatOpenAI: The new client.
+    """
+    return MadiaChatOpenAI(
+        model=model,
+        single_flight=settings.get("llm_single_flight", True),
+        hedge_policy=get_hedge_policy(model),
+        **kwargs,
+    )
+
+
+def get_chat_client(model, temperature=0.3, streaming=True, **kwargs):
+    """
+    Return a ``ChatOpenAI`` client shared by everyone asking for the same one.
+
+    Clients are created on first use and then reused, so concurrent requests
+    share the client and its HTTP connection pool. Pass per-request callbacks
+    when calling the client, not here, as they would leak to other callers;
+    only the shared :mod:`madia.metrics` handler is attached to the client.
+    The client is built by :func:`build_chat_client`.
+
+    Args:
+        model (str): The OpenAI model name.
+        temperature (float, optional): The sampling temperature.
+        streaming (bool, optional): Whether the client streams tokens.
+        **kwargs: Other hashable ``ChatOpenAI`` parameters.
+
+    Returns:
+        ChatOpenAI: The shared client.
+    """
+    key = (model, temperature, streaming, tuple(sorted(kwargs.items())))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = build_chat_client(
+                model,
+                temperature=temperature,
+                streaming=streaming,
+                callbacks=[metrics_handler],
+                **kwargs,
+            )
+    return client
+
+
+def warm_up_connection():
+    """
+    Resolve the OpenAI API's host name ahead of the first request.
+
+    openai keeps one HTTP session per thread, set up with its proxies and
+    retries, and replaces it every few minutes, so a connection opened from
+    the warm-up thread couldn't be reused by the request; its sessions are
+    left alone. Resolving the host fills the system's DNS cache instead, the
+    slowest part of a cold connection on a slow resolver. A command entered
+    meanwhile waits for the lookup, as it would have done it anyway.
+    """
+    proxy = openai.proxy
+    if isinstance(proxy, dict):
+        proxy = proxy.get("https") or proxy.get("http")
+    # Through a proxy, its host is the one connected to
+    url = urlsplit(proxy or openai.api_base)
+    socket.getaddrinfo(url.hostname, url.port or 443, type=socket.SOCK_STREAM)
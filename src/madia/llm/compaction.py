@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+
+from madia.llm.router import estimate_tokens
+from madia.logger import get_logger
+from madia.metrics import metrics
+
+logger = get_logger(__name__)
+
+DEFAULT_TOOL_TOKEN_BUDGET = 200
+# Snippets sharing this much of their words say the same thing
+DUPLICATE_OVERLAP = 0.8
+NO_RESULTS = "No good Google Search Result was found"
+SEPARATOR = "\n"
+
+WORD = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    """
+    a about an and are as at be by did do does for from has have how i in is it
+    its me of on or that the their this to was were what when where which who
+    why will with you your
+    """.split()
+)
+
+
+@lru_cache(maxsize=1)
+def _token_counter():
+    # The encoding is downloaded on first use, count roughly when offline
+    from madia.retrieval.loaders import token_length
+
+    try:
+        token_length("")
+    except Exception:  # pylint: disable=broad-except
+        logger.warning("No tiktoken encoding, estimating tool output tokens")
+        return estimate_tokens
+    return token_length
+
+
+def count_tokens(text):
+    """Return the tokens of ``text``, with tiktoken's encoding if available."""
+    return _token_counter()(text)
+
+
+def words(text):
+    """Return the lowercase words of ``text``, without stopwords."""
+    return {word for word in WORD.findall(text.lower()) if word not in STOPWORDS}
+
+
+def serper_snippets(results, k=None):
+    """
+    Return the snippets of a Serper response, as ``GoogleSerperAPIWrapper``.
+
+    An answer box is the whole answer, as for the wrapper, so joined with
+    spaces they are exactly what its ``run`` returns.
+
+    Args:
+        results (Dict[str, Any]): The response's JSON.
+        k (int, optional): The most organic results used, all if None.
+
+    Returns:
+        List[str]: The snippets, in the response's order.
+    """
+    answer_box = results.get("answerBox") or {}
+    if answer_box.get("answer"):
+        return [answer_box["answer"]]
+    if answer_box.get("snippet"):
+        return [answer_box["snippet"].replace("\n", " ")]
+    if answer_box.get("snippetHighlighted"):
+        return list(answer_box["snippetHighlighted"])
+
+    snippets = []
+    knowledge_graph = results.get("knowledgeGraph") or {}
+    title = knowledge_graph.get("title")
+    if knowledge_graph.get("type"):
+        snippets.append(f"{title}: {knowledge_graph['type']}.")
+    if knowledge_graph.get("description"):
+        snippets.append(knowledge_graph["description"])
+    for attribute, value in knowledge_graph.get("attributes", {}).items():
+        snippets.append(f"{title} {attribute}: {value}.")
+
+    for result in results.get("organic", [])[:k]:
+        if "snippet" in result:
+            snippets.append(result["snippet"])
+        for attribute, value in result.get("attributes", {}).items():
+            snippets.append(f"{attribute}: {value}.")
+    return snippets or [NO_RESULTS]
+
+
+def deduplicate(snippets, overlap=DUPLICATE_OVERLAP):
+    """
+    Drop the snippets repeating an earlier one.
+
+    A snippet repeats another when their words' Jaccard similarity is at
+    least ``overlap``, which catches the same text quoted by two sites with
+    different punctuation or an ellipsis.
+
+    Args:
+        snippets (List[str]): The snippets.
+        overlap (float, optional): The similarity of duplicates.
+
+    Returns:
+        List[str]: The first snippet of each group of duplicates, in order.
+    """
+    kept, kept_words = [], []
+    for snippet in snippets:
+        snippet = " ".join(snippet.split())
+        snippet_words = set(WORD.findall(snippet.lower()))
+        if not snippet_words:
+            continue
+        if any(
+            len(snippet_words & other) >= overlap * len(snippet_words | other)
+            for other in kept_words
+        ):
+            continue
+        kept.append(snippet)
+        kept_words.append(snippet_words)
+    return kept
+
+
+def rank(snippets, question):
+    """
+    Sort the snippets by the question's words they contain, most first.
+
+    Ties keep the search engine's order.
+
+    Args:
+        snippets (List[str]): The snippets.
+        question (str): The question, and the query, whose words are looked for.
+
+    Returns:
+        List[str]: The snippets, most relevant first.
+    """
+    question_words = words(question)
+    overlaps = [len(question_words & words(snippet)) for snippet in snippets]
+    order = sorted(range(len(snippets)), key=lambda index: -overlaps[index])
+    return [snippets[index] for index in order]
+
+
+def truncate(text, budget):
+    """Cut ``text`` on a word bound to at most ``budget`` tokens."""
+    if count_tokens(text) <= budget:
+        return text
+    split = text.split(" ")
+    # The longest prefix of words within the budget
+    low, high = 0, len(split)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(split[:middle]) + " ...") <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(split[:low]) + " ..." if low else ""
+
+
+def compact(snippets, question, budget=DEFAULT_TOOL_TOKEN_BUDGET):
+    """
+    Compact a tool's output before it goes back in the agent's prompt.
+
+    Duplicates are dropped, the rest ranked by overlap with the question and
+    kept, most relevant first, while they fit in ``budget`` tokens; the
+    first one not fitting is cut to the tokens left.
+
+    Args:
+        snippets (List[str]): The output, as snippets.
+        question (str): The question and the tool's query.
+        budget (int, optional): The most tokens of the result.
+
+    Returns:
+        str: The snippets kept, one per line.
+    """
+    kept, used = [], 0
+    for snippet in rank(deduplicate(snippets), question):
+        # And a token for the separator, after the first one
+        tokens = count_tokens(snippet) + bool(kept)
+        if used + tokens > budget:
+            snippet = truncate(snippet, budget - used)
+            if snippet:
+                kept.append(snippet)
+            break
+        kept.append(snippet)
+        used += tokens
+    return SEPARATOR.join(kept) or NO_RESULTS
+
+
+def compacted_search(search, question, budget=DEFAULT_TOOL_TOKEN_BUDGET):
+    """
+    Wrap a search wrapper's results in :func:`compact`, for an agent's tool.
+
+    Results already within ``budget``, e.g. an answer box, are returned as
+    the wrapper's ``run`` would.
+
+    Args:
+        search (GoogleSerperAPIWrapper): Has ``results(query)``, returning
+            Serper's JSON.
+        question (str): The agent's question, which snippets are ranked by.
+        budget (int, optional): The most tokens of each search's output.
+
+    Returns:
+        Callable[[str], str]: The tool's function, taking the query.
+    """
+
+    def run(query):
+        snippets = serper_snippets(search.results(query), getattr(search, "k", None))
+        # What search.run would have returned
+        raw = " ".join(snippets)
+        raw_tokens = count_tokens(raw)
+        if raw_tokens <= budget:
+            output, output_tokens = raw, raw_tokens
+        else:
+            output = compact(snippets, f"{question} {query}", budget)
+            output_tokens = count_tokens(output)
+        if metrics.enabled:
+            metrics.increment("tool_tokens", raw_tokens, "raw")
+            metrics.increment("tool_tokens", output_tokens, "compacted")
+        return output
+
+    return run
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.pydantic_v1 import PrivateAttr
+from langchain.schema import SystemMessage, get_buffer_string
+from langchain.schema.language_model import BaseLanguageModel
+
+from madia.llm.utils import SUMMARY_MAX_WORDS, summarize_messages
+from madia.logger import get_logger
+from madia.utils_string import string_to_md5
+
+logger = get_logger(__name__)
+
+
+class TokenWindow:
+    """
+    The most recent messages of a conversation, bounded by a token budget.
+
+    Each message's tokens are counted once, when it is appended, so building
+    a prompt doesn't re-tokenize the whole history.
+
+    Attributes:
+        llm (BaseLanguageModel): The model used to count tokens.
+        max_tokens (int): The budget for the messages in the window.
+        tokens (int): The tokens currently in the window.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        window = TokenWindow(llm, max_tokens=2000)
+        evicted = window.append(HumanMessage(content="Hi!"))
+        prompt = [*window, HumanMessage(content="How are you?")]
+    """
+
+    def __init__(self, llm, max_tokens):
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.tokens = 0
+        self._messages = deque()
+        self._counts = deque()
+
+    def __iter__(self):
+        return iter(self._messages)
+
+    def __len__(self):
+        return len(self._messages)
+
+    def append(self, message):
+        """
+        Add a message, evicting the oldest ones beyond the token budget.
+
+        The newest message is always kept, even when over budget alone.
+
+        Args:
+            message (BaseMessage): The message to add.
+
+        Returns:
+            List[BaseMessage]: The evicted messages, oldest first.
+        """
+        count = self.llm.get_num_tokens_from_messages([message])
+        self._messages.append(message)
+        self._counts.append(count)
+        self.tokens += count
+
+        evicted = []
+        while self.tokens > self.max_tokens and len(self._messages) > 1:
+            self.tokens -= self._counts.popleft()
+            evicted.append(self._messages.popleft())
+        return evicted
+
+    def clear(self):
+        """Remove all the messages."""
+        self._messages.clear()
+        self._counts.clear()
+        self.tokens = 0
+
+
+class SummaryCache:
+    """
+    Bounded LRU cache of summaries, keyed by the summary and messages folded.
+
+    Replaying or forking a conversation folds the same turns into the same
+    summary again, this skips the model call.
+
+    Args:
+        max_entries (int, optional): Summaries kept.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    @staticmethod
+    def key(summary, messages, max_words):
+        return string_to_md5(max_words, summary, get_buffer_string(messages))
+
+    def get(self, key):
+        with self._lock:
+            summary = self._entries.get(key)
+            if summary is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return summary
+
+    def put(self, key, summary):
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+summary_cache = SummaryCache()
+_summarizer = ThreadPoolExecutor(1, "madia-memory-summarizer")
+
+
+class RollingSummaryMemory(BaseChatMemory):
+    """
+    Chat memory of recent turns plus a summary of the older ones.
+
+    Like ``ConversationTokenBufferMemory``, the recent messages are kept
+    within ``max_token_limit``, but the evicted ones are folded into a
+    summary of at most ``max_summary_words`` words instead of being lost. The
+    prompt therefore stays the same size however long the chat gets.
+
+    Summaries are written in a background thread, off the request path: a
+    turn evicted while the previous summary is being written is folded in the
+    next one. Messages whose summary failed are folded in again with the
+    next evicted turn. Each message's tokens are counted once.
+
+    Attributes:
+        llm (BaseLanguageModel): The model counting tokens.
+        summary_llm (BaseLanguageModel): The model writing the summaries, best
+            without streaming callbacks as it runs in the background.
+        summary (str): Summary of the messages no longer in the window.
+    """
+
+    llm: BaseLanguageModel
+    summary_llm: BaseLanguageModel
+    max_token_limit: int = 2000
+    max_summary_words: int = SUMMARY_MAX_WORDS
+    memory_key: str = "chat_history"
+    summary: str = ""
+    _counted: list = PrivateAttr(default_factory=list)
+    _pending: list = PrivateAttr(default_factory=list)
+    _future: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = list(self.chat_memory.messages)
+        if self.summary:
+            messages.insert(
+                0, SystemMessage(content=f"Conversation summary: {self.summary}")
+            )
+        return {self.memory_key: messages}
+
+    def _token_counts(self):
+        messages = self.chat_memory.messages
+        counted = self._counted
+        # Recount only if the messages were replaced, e.g. by a session resume
+        if len(counted) != len(messages) or any(
+            message is not known for (known, _), message in zip(counted, messages)
+        ):
+            counted[:] = [
+                (message, self.llm.get_num_tokens_from_messages([message]))
+                for message in messages
+            ]
+        return counted
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        counted = self._token_counts()
+        super().save_context(inputs, outputs)
+        messages = self.chat_memory.messages
+        for message in messages[len(counted) :]:
+            counted.append((message, self.llm.get_num_tokens_from_messages([message])))
+
+        tokens = sum(count for _, count in counted)
+        evicted = 0
+        while tokens > self.max_token_limit and len(counted) - evicted > 1:
+            tokens -= counted[evicted][1]
+            evicted += 1
+        if evicted:
+            with self._lock:
+                self._pending.extend(messages[:evicted])
+                if self._future is None:
+                    self._future = _summarizer.submit(self._fold_pending)
+            del messages[:evicted]
+            del counted[:evicted]
+
+    def _fold_pending(self):
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                if not pending:
+                    self._future = None
+                    return
+            key = summary_cache.key(self.summary, pending, self.max_summary_words)
+            summary = summary_cache.get(key)
+            if summary is None:
+                try:
+                    summary = summarize_messages(
+                        self.summary_llm, self.summary, pending, self.max_summary_words
+                    )
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Unable to summarize %d messages", len(pending))
+                    # Kept for the next fold, so the turns aren't lost
+                    with self._lock:
+                        self._pending[:0] = pending
+                        self._future = None
+                    return
+                summary_cache.put(key, summary)
+            self.summary = summary
+
+    def wait(self):
+        """Block until the evicted messages are folded into the summary."""
+        with self._lock:
+            future = self._future
+        if future is not None:
+            future.result()
+
+    def clear(self) -> None:
+        super().clear()
+        self.summary = ""
+        self._counted.clear()
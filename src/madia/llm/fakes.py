@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.chat_models.base import BaseChatModel
+from langchain.pydantic_v1 import Field
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
+from langchain.schema.messages import AIMessageChunk
+from langchain.schema.output import ChatGenerationChunk
+
+from madia.llm.compaction import serper_snippets
+from madia.utils_string import string_to_md5
+
+# A token is a word with the whitespace following it, so joining gives the text
+TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for ``ChatOpenAI``, for tests and benchmarks.
+
+    The answer is picked from ``responses`` by hashing the last message, and
+    streamed word by word with a configurable latency, so the streaming code
+    paths run exactly as with the real model, without network.
+
+    Attributes:
+        responses (List[Union[str, dict]]): The possible answers. A dict is a
+            function call instead, with its ``name`` and ``arguments``, e.g.
+            to script a function-calling agent.
+        first_token_latency (float): Seconds before the first token.
+        latency_fn (Callable[[], float], optional): Returns the first token
+            latency for each call, overriding ``first_token_latency``. Used to
+            simulate latency distributions.
+        tokens_per_second (float): Streaming rate, 0 for no delay.
+        cycle (bool): Answer with ``responses`` in order instead, e.g. to
+            script an agent's steps.
+        calls (int): Number of requests received so far.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        llm = FakeChatModel(responses=["Hello there!"], tokens_per_second=20)
+        for chunk in llm.stream("Hi"):
+            print(chunk.content, end="")
+    """
+
+    responses: List[Union[str, Dict[str, Any]]] = ["This is a fake answer."]
+    first_token_latency: float = 0.0
+    latency_fn: Optional[Callable[[], float]] = None
+    tokens_per_second: float = 0.0
+    model_name: str = "fake-chat"
+    cycle: bool = False
+    calls: int = 0
+    lock: Any = Field(default_factory=threading.Lock, exclude=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def pick_response(
+        self, messages: List[BaseMessage], call: int = 0
+    ) -> Union[str, Dict[str, Any]]:
+        """Return the answer for ``messages``, always the same for a prompt."""
+        if self.cycle:
+            return self.responses[(call - 1) % len(self.responses)]
+        digest = string_to_md5(messages[-1].content if messages else "")
+        return self.responses[int(digest, 16) % len(self.responses)]
+
+    def get_num_tokens(self, text: str) -> int:
+        # Whitespace tokens, tiktoken would need to download its encodings
+        return len(text.split())
+
+    def get_num_tokens_from_messages(self, messages: List[BaseMessage]) -> int:
+        return sum(self.get_num_tokens(m.content) + 3 for m in messages)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        latency = self.latency_fn() if self.latency_fn else self.first_token_latency
+        time.sleep(latency)
+        response = self.pick_response(messages, call)
+        if isinstance(response, dict):
+            arguments = response.get("arguments", {})
+            function_call = {
+                "name": response["name"],
+                "arguments": arguments
+                if isinstance(arguments, str)
+                else json.dumps(arguments),
+            }
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(
+                    content="", additional_kwargs={"function_call": function_call}
+                )
+            )
+            return
+        for i, token in enumerate(TOKEN_PATTERN.findall(response)):
+            if i and self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        contents, additional_kwargs = [], {}
+        for chunk in self._stream(messages, stop, run_manager, **kwargs):
+            contents.append(chunk.message.content)
+            # A function call comes whole, in one chunk
+            additional_kwargs.update(chunk.message.additional_kwargs)
+        message = AIMessage(
+            content="".join(contents), additional_kwargs=additional_kwargs
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class FakeSerper:
+    """
+    Deterministic stand-in for ``GoogleSerperAPIWrapper``.
+
+    Args:
+        snippets (List[str], optional): The possible answers, picked by
+            hashing the query.
+        latency (float, optional): Seconds each search takes.
+        k (int, optional): The results of each search, as Serper's ``num``.
+        answer (str, optional): The answer box of every search, none if None.
+
+    Attributes:
+        queries (List[str]): The queries received so far.
+    """
+
+    def __init__(self, snippets=None, latency=0.0, k=1, answer=None):
+        self.snippets = snippets or ["This is a fake search result."]
+        self.latency = latency
+        self.k = k
+        self.answer = answer
+        self.queries = []
+
+    def _snippet(self, query):
+        return self.snippets[int(string_to_md5(query), 16) % len(self.snippets)]
+
+    def results(self, query: str) -> Dict[str, Any]:
+        """Return a Serper-like JSON response."""
+        self.queries.append(query)
+        time.sleep(self.latency)
+        results = {
+            "searchParameters": {"q": query, "type": "search"},
+            "organic": [
+                {"title": query, "link": "https://example.com", "snippet": snippet}
+                for snippet in [self._snippet(query)]
+                + [self._snippet(f"{query} {index}") for index in range(1, self.k)]
+            ],
+        }
+        if self.answer is not None:
+            results["answerBox"] = {"answer": self.answer}
+        return results
+
+    def run(self, query: str) -> str:
+        """Return the results' snippets joined, as the wrapper does."""
+        return " ".join(serper_snippets(self.results(query), self.k))
+
+
+class _FakeBlipInputs(dict):
+    def to(self, device):  # pylint: disable=invalid-name,unused-argument
+        return self
+
+
+class FakeBlipProcessor:
+    """Stand-in for ``BlipProcessor``, see :func:`fake_blip`."""
+
+    def __init__(self, captions):
+        self.captions = captions
+
+    def __call__(self, image, text="", return_tensors="pt"):
+        digest = hashlib.md5(image.tobytes())
+        digest.update(text.encode("utf-8"))
+        return _FakeBlipInputs(pixel_values=int(digest.hexdigest(), 16))
+
+    def decode(self, ids, skip_special_tokens=True):
+        return self.captions[ids[0] % len(self.captions)]
+
+
+class FakeBlipModel:
+    """Stand-in for ``BlipForConditionalGeneration``, see :func:`fake_blip`."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def generate(self, pixel_values, max_new_tokens=100, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [[pixel_values]]
+
+
+def fake_blip(captions=None, latency=0.0):
+    """
+    Return a fake BLIP ``(processor, model, device)``, as ``load_blip`` does.
+
+    The caption is picked by hashing the image's pixels, so the same image
+    always gets the same caption.
+
+    Args:
+        captions (List[str], optional): The possible captions.
+        latency (float, optional): Seconds each caption takes.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        caption_image_url("photo.jpg", blip=fake_blip(["a cat"]))
+    """
+    processor = FakeBlipProcessor(captions or ["a fake caption"])
+    return processor, FakeBlipModel(latency), "cpu"
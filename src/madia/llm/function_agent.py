@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+from langchain.schema import FunctionMessage, HumanMessage, SystemMessage
+
+from madia.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_TURNS = 4
+SYSTEM_MESSAGE = (
+    "You are a helpful assistant. Call the tools you need with tool_calls, "
+    "several at once when they don't depend on each other, then answer the "
+    "question from their results."
+)
+FINAL_ANSWER_MESSAGE = "Answer the question now, with the results you have."
+
+
+@dataclass(frozen=True)
+class FunctionTool:
+    """
+    A tool the model calls with JSON arguments.
+
+    Attributes:
+        name (str): The tool's name, letters, digits, ``_`` and ``-`` only.
+        description (str): What the tool does, for the model.
+        parameters (Dict[str, Any]): The JSON schema of its arguments.
+        func (Callable[..., str]): Called with the arguments as keywords.
+    """
+
+    name: str
+    description: str
+    parameters: Dict[str, Any]
+    func: Callable[..., str]
+
+    @property
+    def schema(self):
+        """The tool, as an item of the ``tool_calls`` function's array."""
+        return {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string", "enum": [self.name]},
+                "arguments": self.parameters,
+            },
+            "required": ["name", "arguments"],
+        }
+
+
+class FunctionCallingAgent:
+    """
+    An agent using the model's function calling, not parsing its text.
+
+    The model gets one ``tool_calls`` function, whose argument is a list of
+    tool calls, so it can ask for several tools in one turn; they then run
+    concurrently. The tool arguments arrive as JSON: one that doesn't parse,
+    or calls an unknown tool, is answered with the error, for the model to
+    correct, instead of failing the question.
+
+    The agent stops when the model answers without calling a tool, or after
+    ``max_turns`` turns with tools, when the model is asked to answer with
+    what it has, without tools. A question takes at most ``max_turns + 1``
+    model calls.
+
+    Args:
+        llm (BaseChatModel): A chat model supporting OpenAI's functions.
+        tools (List[FunctionTool]): The tools.
+        max_turns (int, optional): The most turns calling tools.
+        system_message (str, optional): The system prompt.
+
+    Attributes:
+        model_calls (int): The model calls of the last question.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        search = FunctionTool(
+            "search",
+            "Search the web",
+            {"type": "object", "properties": {"query": {"type": "string"}}},
+            lambda query: serper.run(query),
+        )
+        FunctionCallingAgent(ChatOpenAI(), [search]).run("Who won in 2022?")
+    """
+
+    def __init__(
+        self,
+        llm,
+        tools,
+        max_turns=DEFAULT_MAX_TURNS,
+        system_message=SYSTEM_MESSAGE,
+    ):
+        self.llm = llm
+        self.tools = {tool.name: tool for tool in tools}
+        self.max_turns = max_turns
+        self.system_message = system_message
+        self.model_calls = 0
+        self.functions = [
+            {
+                "name": "tool_calls",
+                "description": "Call one or more tools.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "calls": {
+                            "type": "array",
+                            "items": {"anyOf": [tool.schema for tool in tools]},
+                        }
+                    },
+                    "required": ["calls"],
+                },
+            }
+        ]
+
+    def _predict(self, messages, callbacks, **kwargs):
+        self.model_calls += 1
+        return self.llm.predict_messages(messages, callbacks=callbacks, **kwargs)
+
+    def run(self, question, callbacks=None):
+        """
+        Answer ``question``, calling the tools as the model asks.
+
+        Args:
+            question (str): The question.
+            callbacks (Callbacks, optional): The model calls' callbacks.
+
+        Returns:
+            str: The model's answer.
+        """
+        self.model_calls = 0
+        messages = [
+            SystemMessage(content=self.system_message),
+            HumanMessage(content=question),
+        ]
+        for _ in range(self.max_turns):
+            message = self._predict(messages, callbacks, functions=self.functions)
+            function_call = message.additional_kwargs.get("function_call")
+            if not function_call:
+                return message.content
+            messages.append(message)
+            messages.extend(self._call_tools(function_call))
+        logger.debug("No answer after %d turns, asking for one", self.max_turns)
+        messages.append(HumanMessage(content=FINAL_ANSWER_MESSAGE))
+        return self._predict(messages, callbacks).content
+
+    def _call_tools(self, function_call):
+        try:
+            calls = json.loads(function_call.get("arguments") or "{}")["calls"]
+            if not isinstance(calls, list):
+                raise TypeError("calls isn't a list")
+        except (ValueError, KeyError, TypeError) as error:
+            return [self._result(function_call.get("name", "tool_calls"), error)]
+        with ThreadPoolExecutor(max(1, len(calls))) as pool:
+            results = list(pool.map(self._call_tool, calls))
+        return results
+
+    def _call_tool(self, call):
+        name = call.get("name") if isinstance(call, dict) else None
+        tool = self.tools.get(name)
+        if tool is None:
+            return self._result(
+                str(name),
+                ValueError(f"Unknown tool {name!r}, use one of {list(self.tools)}"),
+            )
+        try:
+            return self._result(name, tool.func(**call.get("arguments", {})))
+        except Exception as error:  # pylint: disable=broad-except
+            logger.debug("Tool %s failed", name, exc_info=True)
+            return self._result(name, error)
+
+    @staticmethod
+    def _result(name, result):
+        if isinstance(result, Exception):
+            result = f"Error: {type(result).__name__}: {result}"
+        return FunctionMessage(name=name, content=str(result))
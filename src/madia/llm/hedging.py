@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Any, Iterator, List, Optional
+
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.chat_models import ChatOpenAI
+from langchain.schema import BaseMessage
+from langchain.schema.output import ChatGenerationChunk
+
+from madia.config import settings
+from madia.logger import get_logger
+from madia.metrics import Histogram, metrics
+
+logger = get_logger(__name__)
+
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_HEDGE_MIN_DELAY = 0.25
+DEFAULT_HEDGE_MAX_DELAY = 10.0
+DEFAULT_HEDGE_BUDGET = 0.1
+# Hedging on the percentile of a handful of requests would be guesswork
+MIN_SAMPLES = 20
+_DONE = object()
+
+
+class HedgePolicy:
+    """
+    When to send a second, hedged, request and how many of them.
+
+    A request is hedged when its first token takes longer than the
+    ``percentile`` of the first token latencies seen so far, clamped to
+    ``[min_delay, max_delay]``, and ``max_delay`` until enough were seen. So
+    only the slowest few percents are hedged, those that make the tail.
+
+    The budget is a token bucket: each request adds ``budget`` tokens, up to
+    one, and each hedge takes one. At most a ``budget`` fraction of extra
+    requests are sent, even when every request is slow, e.g. during an
+    outage, where hedging would only add to the load.
+
+    Args:
+        percentile (float, optional): The first token latency percentile, 0-100.
+        min_delay (float, optional): The shortest delay, in seconds.
+        max_delay (float, optional): The longest delay, in seconds.
+        budget (float, optional): The most hedges per request.
+        fallback_model (str, optional): The model of the hedged requests, the
+            same model by default.
+    """
+
+    def __init__(
+        self,
+        percentile=DEFAULT_HEDGE_PERCENTILE,
+        min_delay=DEFAULT_HEDGE_MIN_DELAY,
+        max_delay=DEFAULT_HEDGE_MAX_DELAY,
+        budget=DEFAULT_HEDGE_BUDGET,
+        fallback_model=None,
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.fallback_model = fallback_model
+        self.first_token = Histogram()
+        self.tokens = 1.0
+        self.lock = threading.Lock()
+
+    def delay(self):
+        """Return the seconds to wait for a first token before hedging."""
+        with self.lock:
+            if self.first_token.count < MIN_SAMPLES:
+                return self.max_delay
+            delay = self.first_token.percentile(self.percentile)
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def record(self, seconds):
+        """Record a first token latency, and a request against the budget."""
+        with self.lock:
+            self.first_token.record(seconds)
+            self.tokens = min(1.0, self.tokens + self.budget)
+
+    def try_hedge(self):
+        """Take a hedge from the budget, returning whether there was one left."""
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def get_hedge_policy(model):
+    """
+    Return the hedging policy of ``model``, or None when hedging is off.
+
+    Hedging is opt-in, with the ``llm_hedging`` setting. Each model has its
+    own policy, as their latencies differ.
+    """
+    if not settings.get("llm_hedging", False):
+        return None
+    with _policies_lock:
+        policy = _policies.get(model)
+        if policy is None:
+            policy = _policies[model] = HedgePolicy(
+                percentile=settings.get(
+                    "llm_hedge_percentile", DEFAULT_HEDGE_PERCENTILE
+                ),
+                min_delay=settings.get("llm_hedge_min_delay", DEFAULT_HEDGE_MIN_DELAY),
+                max_delay=settings.get("llm_hedge_max_delay", DEFAULT_HEDGE_MAX_DELAY),
+                budget=settings.get("llm_hedge_budget", DEFAULT_HEDGE_BUDGET),
+                fallback_model=settings.get("llm_hedge_fallback_model", None),
+            )
+    return policy
+
+
+def _pump(index, source, events, cancelled):
+    iterator = None
+    try:
+        iterator = iter(source())
+        for item in iterator:
+            if cancelled.is_set():
+                return
+            events.put((index, item, None))
+        events.put((index, _DONE, None))
+    except Exception as error:  # pylint: disable=broad-except
+        events.put((index, _DONE, error))
+    finally:
+        # Drops the losing request's HTTP stream, at its first item after it
+        # lost: a blocking read can't be interrupted from another thread
+        close = getattr(iterator, "close", None)
+        if close:
+            close()
+
+
+def hedged_stream(policy, primary, backup):
+    """
+    Yield the items of ``primary()``, or of ``backup()`` if it starts first.
+
+    ``backup()`` is started when ``primary()`` has no first item after
+    :meth:`HedgePolicy.delay`, or fails before its first item, budget
+    permitting. Whichever yields first wins, and its items are yielded as
+    soon as they arrive.
+
+    The loser isn't interrupted: openai 0.27 reads the stream with blocking
+    ``requests`` calls, which another thread can't abort. Its thread stops
+    and closes its iterator when its next item arrives, usually the first
+    token of the slow request, so it holds a connection until then, not until
+    the whole response was streamed.
+
+    Args:
+        policy (HedgePolicy): When to hedge.
+        primary (Callable[[], Iterable]): Starts the request.
+        backup (Callable[[], Iterable]): Starts the hedged request.
+    """
+    events = queue.Queue()
+    cancelled = (threading.Event(), threading.Event())
+    sources = (primary, backup)
+    started = time.perf_counter()
+    deadline = started + policy.delay()
+    running, hedged, errors = 0, False, []
+
+    def start(index):
+        nonlocal running
+        running += 1
+        threading.Thread(
+            target=_pump,
+            args=(index, sources[index], events, cancelled[index]),
+            daemon=True,
+            name="madia-hedge",
+        ).start()
+
+    def hedge():
+        nonlocal hedged
+        hedged = True
+        if policy.try_hedge():
+            metrics.increment("llm_hedged")
+            start(1)
+
+    start(0)
+    try:
+        while True:
+            try:
+                timeout = None if hedged else max(0.0, deadline - time.perf_counter())
+                index, item, error = events.get(timeout=timeout)
+            except queue.Empty:
+                hedge()
+                continue
+            if item is not _DONE or error is None:
+                break
+            running -= 1
+            errors.append(error)
+            if not hedged:
+                logger.warning("Request failed, hedging it: %s", error)
+                hedge()
+            if not running:
+                raise errors[0]
+
+        winner = index
+        # A lost race still tells the first token took at least this long
+        policy.record(time.perf_counter() - started)
+        cancelled[1 - winner].set()
+        if winner == 1:
+            metrics.increment("llm_hedge_wins")
+        while item is not _DONE:
+            yield item
+            index, item, error = events.get()
+            while index != winner:
+                index, item, error = events.get()
+        if error is not None:
+            raise error
+    finally:
+        cancelled[0].set()
+        cancelled[1].set()
+
+
+class HedgingMixin:
+    """
+    Chat model mixin hedging slow streaming requests, see :func:`hedged_stream`.
+
+    It hedges when the model's ``hedge_policy`` attribute is set, e.g. from
+    :func:`get_hedge_policy`. Only streaming requests are hedged, the first
+    token is what tells a slow request apart.
+    """
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        parent = super()
+        policy = getattr(self, "hedge_policy", None)
+        if policy is None:
+            yield from parent._stream(messages, stop, run_manager, **kwargs)
+            return
+
+        def primary():
+            return parent._stream(messages, stop, None, **kwargs)
+
+        def backup():
+            if policy.fallback_model:
+                from madia.llm.clients import get_chat_client
+
+                fallback = get_chat_client(policy.fallback_model)
+                # The plain stream, the fallback must not hedge in turn
+                return ChatOpenAI._stream(fallback, messages, stop, None, **kwargs)
+            return parent._stream(messages, stop, None, **kwargs)
+
+        for chunk in hedged_stream(policy, primary, backup):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.message.content)
+            yield chunk
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import glob
+import mmap
+import os
+from contextlib import contextmanager
+from io import BytesIO
+
+import requests
+from PIL import Image
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+IMAGE_TIMEOUT = 30
+GLOB_CHARACTERS = "*?["
+
+
+def is_url(source):
+    return source.startswith(("http://", "https://"))
+
+
+def is_image(path):
+    """Return whether the file is read as an image."""
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def is_many(source):
+    """Return whether ``source`` names a directory or a glob, not one image."""
+    if is_url(source):
+        return False
+    source = os.path.expanduser(source)
+    return os.path.isdir(source) or (
+        not os.path.exists(source) and any(c in source for c in GLOB_CHARACTERS)
+    )
+
+
+def iter_images(source):
+    """
+    Yield the images of ``source``, lazily.
+
+    Args:
+        source (str): A URL, a file, a glob such as ``photos/**/*.jpg``, or
+            a directory, walked recursively.
+
+    Yields:
+        str: The URLs or files, in a stable order.
+    """
+    if is_url(source):
+        yield source
+        return
+    source = os.path.expanduser(source)
+    if os.path.isfile(source):
+        yield source
+    elif os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if is_image(name):
+                    yield os.path.join(root, name)
+    else:
+        for path in sorted(glob.iglob(source, recursive=True)):
+            if os.path.isfile(path) and is_image(path):
+                yield path
+
+
+@contextmanager
+def image_data(source):
+    """
+    Give the bytes of an image file, memory-mapped when it's local.
+
+    A local file isn't copied in memory, its pages are read by the decoder
+    straight from the OS page cache.
+
+    Args:
+        source (str): The image's path or URL.
+
+    Yields:
+        Union[mmap.mmap, bytes]: The file's content.
+    """
+    if is_url(source):
+        response = requests.get(source, timeout=IMAGE_TIMEOUT)
+        response.raise_for_status()
+        yield response.content
+        return
+    with open(os.path.expanduser(source), "rb") as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            yield file.read()
+            return
+        with data:
+            yield data
+
+
+def open_image(data):
+    """
+    Open an image from its file's content, without decoding it yet.
+
+    Args:
+        data (Union[mmap.mmap, bytes]): See :func:`image_data`.
+
+    Returns:
+        Image.Image: The image.
+    """
+    if isinstance(data, mmap.mmap):
+        data.seek(0)
+        return Image.open(data)
+    return Image.open(BytesIO(data))
+
+
+def decode_image(data, size=None):
+    """
+    Decode an image in RGB, at a reduced resolution when possible.
+
+    JPEGs are decoded by libjpeg at 1/2, 1/4 or 1/8 scale, the smallest
+    still at least ``size`` pixels wide and high. The other formats are
+    decoded whole.
+
+    Args:
+        data (Union[mmap.mmap, bytes]): See :func:`image_data`.
+        size (int, optional): The size the image is resized to next, full
+            resolution if None.
+
+    Returns:
+        Image.Image: The image, in RGB.
+    """
+    image = open_image(data)
+    if size:
+        image.draft("RGB", (size, size))
+    return image.convert("RGB")
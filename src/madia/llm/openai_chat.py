@@ -8,35 +8,105 @@ from math import ceil
 
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain.chains import LLMChain
-from langchain.chat_models import ChatOpenAI
 from langchain.memory import ConversationTokenBufferMemory
 from langchain.prompts import (ChatPromptTemplate, HumanMessagePromptTemplate,
                                MessagesPlaceholder,
                                SystemMessagePromptTemplate)
+from langchain.schema import AIMessage, HumanMessage, get_buffer_string
 
-from madia.llm.utils import ShortProgressStringsHandler
+from madia.config import settings, subscribe
+from madia.llm.clients import build_chat_client, get_chat_client
+from madia.llm.conversation import RollingSummaryMemory
+from madia.llm.router import estimate_tokens, get_router
+from madia.llm.session_log import format_sessions
+from madia.llm.utils import ShortProgressStringsHandler, metrics_handler
 from madia.logger import get_logger
+from madia.metrics import current_command
 
 logger = get_logger(__name__)
 
+DEFAULT_OPENAI_MODEL = "gpt-3.5-turbo"
+DEFAULT_MEMORY_MAX_TOKEN_LIMIT = 2000
+DEFAULT_MEMORY_MODE = "buffer"
+MEMORY_MODES = ("buffer", "summary")
+
 
 class BufferedWindowMessage:
-    def __init__(self, open_ai_model="gpt-3.5-turbo", streaming=True):
+    def __init__(self, open_ai_model=None, streaming=True, session_store=None):
         self.streaming = streaming
-        self.llm = ChatOpenAI(
-            model=open_ai_model,
+        # When no model is pinned, follow the ``openai_model`` setting
+        self.open_ai_model = open_ai_model
+        self.llm = self._build_llm()
+        # The clients of the other models the router picked, by model
+        self.routed_llms = {}
+        self.memory = self._build_memory()
+        self.chain = None
+        subscribe(
+            self._on_settings_change, keys=("openai_model", "memory_max_token_limit")
+        )
+
+        # Without a store, the conversation only lives in this process
+        self.session_store = session_store
+        self.session = None
+        if session_store is not None:
+            self.resume_session(session_store.current)
+
+    def _build_llm(self, model=None):
+        return build_chat_client(
+            model
+            or self.open_ai_model
+            or settings.get("openai_model", DEFAULT_OPENAI_MODEL),
             temperature=0.3,
             streaming=True,
-            callbacks=[ShortProgressStringsHandler()],
+            callbacks=[ShortProgressStringsHandler(), metrics_handler],
         )
 
-        self.memory = ConversationTokenBufferMemory(
+    def _build_memory(self):
+        max_token_limit = settings.get(
+            "memory_max_token_limit", DEFAULT_MEMORY_MAX_TOKEN_LIMIT
+        )
+        mode = settings.get("memory_mode", DEFAULT_MEMORY_MODE)
+        if mode not in MEMORY_MODES:
+            logger.warning(
+                "Unknown memory_mode %r, using %s", mode, DEFAULT_MEMORY_MODE
+            )
+        if mode == "summary":
+            # Evicted turns are summarized in the background, keeping their gist
+            return RollingSummaryMemory(
+                memory_key="chat_history",
+                return_messages=True,
+                max_token_limit=max_token_limit,
+                llm=self.llm,
+                summary_llm=self._build_summary_llm(),
+            )
+        return ConversationTokenBufferMemory(
             memory_key="chat_history",
             return_messages=True,
-            max_token_limit=2000,
+            max_token_limit=max_token_limit,
             llm=self.llm,
         )
-        self.chain = None
+
+    def _build_summary_llm(self):
+        # No streaming callbacks, it writes summaries while the user types
+        return get_chat_client(self.llm.model_name, streaming=False)
+
+    def _on_settings_change(self, changed, snapshot):
+        """Rebuild only the pieces affected by a settings reload.
+
+        The conversation memory is kept, so a model switch doesn't lose the
+        chat history.
+        """
+        if "openai_model" in changed and not self.open_ai_model:
+            self.llm = self._build_llm()
+            self.routed_llms = {}
+            self.memory.llm = self.llm
+            if isinstance(self.memory, RollingSummaryMemory):
+                self.memory.summary_llm = self._build_summary_llm()
+            logger.info("Switched model to %s", self.llm.model_name)
+        if "memory_max_token_limit" in changed:
+            self.memory.max_token_limit = snapshot.get(
+                "memory_max_token_limit", DEFAULT_MEMORY_MAX_TOKEN_LIMIT
+            )
 
     def get_response(self, input_text, system_message=None, streaming=None):
         streaming = streaming or (streaming is None and self.streaming)
@@ -51,8 +121,18 @@ class BufferedWindowMessage:
         )
         prompt = ChatPromptTemplate(messages=msgs)
 
+        llm, callbacks = self.llm, None
+        router = get_router()
+        if router is not None:
+            decision = router.choose(
+                self._estimate_prompt_tokens(input_text, system_message),
+                current_command(),
+                self.llm.model_name,
+            )
+            llm, callbacks = self._routed_llm(decision.model), [router.handler]
+
         self.chain = LLMChain(
-            llm=self.llm,
+            llm=llm,
             prompt=prompt,
             verbose=False,
             memory=self.memory,
@@ -63,6 +143,89 @@ class BufferedWindowMessage:
         logger.debug(self.chain)
 
         # with temporary_stdout():
-        ret = self.chain({"question": input_text})
+        ret = self.chain({"question": input_text}, callbacks=callbacks)
+        self._save_turn(
+            HumanMessage(content=input_text), AIMessage(content=ret["text"])
+        )
 
         return ret["text"]
+
+    def _estimate_prompt_tokens(self, input_text, system_message):
+        history = get_buffer_string(self.memory.chat_memory.messages)
+        summary = getattr(self.memory, "summary", "")
+        return estimate_tokens(
+            "".join((system_message or "", summary, history, input_text))
+        )
+
+    def _routed_llm(self, model):
+        if model == self.llm.model_name:
+            return self.llm
+        llm = self.routed_llms.get(model)
+        if llm is None:
+            llm = self.routed_llms[model] = self._build_llm(model)
+        return llm
+
+    def _save_turn(self, *messages):
+        if self.session is None:
+            return
+        # Not read back from the memory, which may already have evicted them
+        self.session.append(
+            messages,
+            [self.llm.get_num_tokens_from_messages([message]) for message in messages],
+        )
+
+    def resume_session(self, name):
+        """
+        Continue a saved session, loading only its recent messages.
+
+        The messages fitting in the memory's token limit are loaded, the
+        rest of the session stays on disk. An unknown name starts a new
+        session.
+
+        Args:
+            name (str): The session name, the current one if empty.
+
+        Returns:
+            str: What was resumed.
+        """
+        if self.session_store is None:
+            return "Sessions are disabled."
+        name = name.strip() or self.session_store.current
+        try:
+            self.session = self.session_store.open(name)
+        except ValueError as error:
+            return str(error)
+        self.memory.chat_memory.messages = self.session.tail(
+            self.memory.max_token_limit
+        )
+        self.session_store.current = name
+        return (
+            f"Resumed session '{name}': {len(self.session)} messages, "
+            f"{len(self.memory.chat_memory.messages)} in the window."
+        )
+
+    def fork_session(self, name):
+        """
+        Copy the current session under a new name and switch to the copy.
+
+        Args:
+            name (str): The new session's name.
+
+        Returns:
+            str: What was forked.
+        """
+        if self.session_store is None:
+            return "Sessions are disabled."
+        current = self.session_store.current
+        try:
+            self.session_store.fork(current, name.strip())
+        except ValueError as error:
+            return str(error)
+        self.resume_session(name.strip())
+        return f"Forked session '{current}' into '{name.strip()}'."
+
+    def list_sessions(self, _=""):
+        """Return the saved sessions, the current one marked with ``*``."""
+        if self.session_store is None:
+            return "Sessions are disabled."
+        return format_sessions(self.session_store.list(), self.session_store.current)
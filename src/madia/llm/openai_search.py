@@ -5,29 +5,61 @@ from langchain.chat_models import ChatOpenAI
 from langchain.schema.output_parser import OutputParserException
 from langchain.utilities import GoogleSerperAPIWrapper
 
-from madia.llm.utils import FileLoggerHandler, response_strip
+from madia.config import settings
+from madia.llm.compaction import DEFAULT_TOOL_TOKEN_BUDGET, compacted_search
+from madia.llm.function_agent import FunctionCallingAgent, FunctionTool
+from madia.llm.utils import FileLoggerHandler, metrics_handler, response_strip
 from madia.logger import LoggingMixin, get_logger
 from madia.repl.utils import delete_stdout_content, temporary_stdout
 
 logger = get_logger(__name__)
 
+# "react" parses the model's text, "functions" gets the tool calls as JSON
+SEARCH_AGENTS = ("react", "functions")
+DEFAULT_SEARCH_AGENT = "react"
+
 
 class BufferedSearchWindowMessage(LoggingMixin):
-    def __init__(self, open_ai_model="gpt-3.5-turbo", streaming=True):
+    def __init__(
+        self, open_ai_model="gpt-3.5-turbo", streaming=True, search=None, agent=None
+    ):
         self.streaming = streaming
+        # A search wrapper, e.g. madia.llm.fakes.FakeSerper, instead of Serper
+        self.search = search
+        if agent is None:
+            agent = settings.get("search_agent", DEFAULT_SEARCH_AGENT)
+            # A typo in config.yaml mustn't stop the REPL from starting
+            if agent not in SEARCH_AGENTS:
+                logger.warning(
+                    "Unknown search_agent %r, using %s", agent, DEFAULT_SEARCH_AGENT
+                )
+                agent = DEFAULT_SEARCH_AGENT
+        elif agent not in SEARCH_AGENTS:
+            raise ValueError(f"Unknown search agent {agent!r}, use {SEARCH_AGENTS}")
+        self.agent = agent
         self.llm = ChatOpenAI(
             model=open_ai_model,
             temperature=0.3,
             streaming=streaming,
-            callbacks=[FileLoggerHandler()],
+            callbacks=[FileLoggerHandler(), metrics_handler],
         )
 
+    @staticmethod
+    def _search_tool(search, input_text):
+        # Raw results grow every later prompt of the agent, compact them
+        if not settings.get("search_compaction", True):
+            return search.run
+        budget = settings.get("search_tool_token_budget", DEFAULT_TOOL_TOKEN_BUDGET)
+        return compacted_search(search, input_text, budget)
+
     def get_response(self, input_text, system_message=None):
-        search = GoogleSerperAPIWrapper()
+        search = self.search or GoogleSerperAPIWrapper()
+        if self.agent == "functions":
+            return self._functions_response(search, input_text)
         tools = [
             Tool(
                 name="Intermediate Answer",
-                func=search.run,
+                func=self._search_tool(search, input_text),
                 description="useful for when you need to ask with search",
             )
         ]
@@ -45,3 +77,23 @@ class BufferedSearchWindowMessage(LoggingMixin):
                 return str(err)
 
         return response_strip(ret)
+
+    def _functions_response(self, search, input_text):
+        agent = FunctionCallingAgent(
+            self.llm,
+            [
+                FunctionTool(
+                    name="search",
+                    description="Search the web, for current events and facts",
+                    parameters={
+                        "type": "object",
+                        "properties": {"query": {"type": "string"}},
+                        "required": ["query"],
+                    },
+                    func=self._search_tool(search, input_text),
+                )
+            ],
+        )
+        with temporary_stdout():
+            ret = agent.run(input_text)
+        return response_strip(ret)
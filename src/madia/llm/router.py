@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from madia.config import settings
+from madia.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_ROUTING_LOG = "~/.madia/logs/routing.jsonl"
+# Tokens kept free for the answer when checking a prompt fits the context
+COMPLETION_RESERVE = 512
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+}
+LATENCY_ALPHA = 0.2
+LATENCY_TOLERANCE = 1.5
+# Not picked for this long, a model's latency is tried again
+LATENCY_TTL = 120.0
+
+
+def context_window(model):
+    """Return the context size of ``model`` in tokens, None if unknown."""
+    # e.g. gpt-3.5-turbo-0613 has the context of gpt-3.5-turbo
+    for name in sorted(CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(name):
+            return CONTEXT_WINDOWS[name]
+    return None
+
+
+def estimate_tokens(text):
+    """Estimate the tokens of ``text``, about 4 characters each in English."""
+    return -(-len(text) // 4)
+
+
+@dataclass(frozen=True)
+class Route:
+    """
+    A routing rule, matching requests by command and prompt size.
+
+    Attributes:
+        models (Tuple[str, ...]): The candidate models, preferred first.
+        command (str, optional): Matches this command path and its
+            subcommands, e.g. ``"bots"`` matches ``"bots developer"``.
+        min_prompt_tokens (int): Matches prompts at least this long.
+        max_prompt_tokens (int, optional): Matches prompts at most this long.
+        latency_tolerance (float, optional): Overrides the router's, e.g.
+            higher when the preferred model is slower by design.
+    """
+
+    models: Tuple[str, ...]
+    command: Optional[str] = None
+    min_prompt_tokens: int = 0
+    max_prompt_tokens: Optional[int] = None
+    latency_tolerance: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a route from its ``llm_routes`` setting entry."""
+        models = data.get("models") or [data["model"]]
+        return cls(
+            models=tuple(models),
+            command=data.get("command"),
+            min_prompt_tokens=data.get("min_prompt_tokens", 0),
+            max_prompt_tokens=data.get("max_prompt_tokens"),
+            latency_tolerance=data.get("latency_tolerance"),
+        )
+
+    def matches(self, prompt_tokens, command):
+        if self.command and not (
+            command == self.command or command.startswith(self.command + " ")
+        ):
+            return False
+        if prompt_tokens < self.min_prompt_tokens:
+            return False
+        return self.max_prompt_tokens is None or prompt_tokens <= self.max_prompt_tokens
+
+
+@dataclass(frozen=True)
+class RoutingDecision:
+    """The model picked for a request, and why."""
+
+    model: str
+    reason: str
+    prompt_tokens: int
+    command: str
+
+
+class ModelRouter:
+    """
+    Pick the model of each request from rules, prompt size and latency.
+
+    A per-command override wins, then the first route matching the command
+    and the estimated prompt tokens. Among its candidates, those whose
+    context can't hold the prompt are skipped, and the first one is picked
+    unless its recent first token latency is over ``latency_tolerance``
+    times the fastest candidate's. A model with no latency seen in the last
+    ``LATENCY_TTL`` seconds counts as fast, so a model avoided while it was
+    slow is tried again. Without a match, the caller's default.
+
+    Every decision is appended to ``log_path`` as a JSON line, to analyse
+    the routing offline.
+
+    Args:
+        routes (List[Route]): The rules, in order.
+        overrides (Dict[str, str], optional): Command path to model.
+        log_path (str, optional): The decisions' log, none if None.
+        latency_tolerance (float, optional): How much slower than the
+            fastest candidate the preferred one may be.
+        clock (Callable[[], float], optional): Returns the time in seconds,
+            e.g. simulated in benchmarks.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        router = ModelRouter(
+            [Route(("gpt-4",), command="bots developer", min_prompt_tokens=200)]
+        )
+        router.choose(800, "bots developer", "gpt-3.5-turbo").model  # gpt-4
+    """
+
+    def __init__(
+        self,
+        routes,
+        overrides=None,
+        log_path=None,
+        latency_tolerance=LATENCY_TOLERANCE,
+        clock=time.monotonic,
+    ):
+        self.routes = list(routes)
+        self.overrides = dict(overrides or {})
+        self.log_path = os.path.expanduser(log_path) if log_path else None
+        self.latency_tolerance = latency_tolerance
+        self.clock = clock
+        # Model to the moving average of its first token latency, and when
+        # it was last updated
+        self.latencies = {}
+        self.lock = threading.Lock()
+        self.handler = RouterLatencyHandler(self)
+
+    def observe(self, model, seconds):
+        """Record a first token latency of ``model``, as a moving average."""
+        now = self.clock()
+        with self.lock:
+            previous = self.latencies.get(model)
+            if previous is None or now - previous[1] > LATENCY_TTL:
+                self.latencies[model] = (seconds, now)
+            else:
+                average = previous[0] + LATENCY_ALPHA * (seconds - previous[0])
+                self.latencies[model] = (average, now)
+
+    def latency(self, model):
+        """Return the recent first token latency of ``model``, 0 if unknown."""
+        with self.lock:
+            latency = self.latencies.get(model)
+        if latency is None or self.clock() - latency[1] > LATENCY_TTL:
+            return 0.0
+        return latency[0]
+
+    def _pick(self, models, prompt_tokens, latency_tolerance):
+        fitting = [
+            model
+            for model in models
+            if (context_window(model) or float("inf"))
+            >= prompt_tokens + COMPLETION_RESERVE
+        ]
+        if not fitting:
+            # Nothing fits, the largest context has the best chance
+            return max(models, key=lambda m: context_window(m) or 0), "too long"
+        # A model never tried counts as fast, so it gets tried
+        latencies = {model: self.latency(model) for model in fitting}
+        fastest = min(latencies.values())
+        # The fastest one passes, so there is always a pick
+        model = next(
+            model
+            for model in fitting
+            if latencies[model] <= fastest * latency_tolerance
+        )
+        if model == models[0]:
+            return model, "preferred"
+        return model, "fits" if model == fitting[0] else "faster"
+
+    def choose(self, prompt_tokens, command, default_model):
+        """
+        Return the :class:`RoutingDecision` of a request.
+
+        Args:
+            prompt_tokens (int): The estimated tokens of the whole prompt.
+            command (str): The command path, e.g. ``"bots joker"``.
+            default_model (str): The model when no route matches.
+        """
+        command = command or ""
+        if command in self.overrides:
+            model, reason = self.overrides[command], "override"
+        else:
+            for index, route in enumerate(self.routes):
+                if route.matches(prompt_tokens, command):
+                    model, reason = self._pick(
+                        route.models,
+                        prompt_tokens,
+                        route.latency_tolerance or self.latency_tolerance,
+                    )
+                    reason = f"route {index}: {reason}"
+                    break
+            else:
+                model, reason = default_model, "default"
+        decision = RoutingDecision(model, reason, prompt_tokens, command)
+        self._log(decision)
+        return decision
+
+    def _log(self, decision):
+        logger.debug(
+            "Routed %r to %s (%s)", decision.command, decision.model, decision.reason
+        )
+        if not self.log_path:
+            return
+        with self.lock:
+            record = {
+                "time": time.time(),
+                **decision.__dict__,
+                "latencies": {
+                    model: latency for model, (latency, _) in self.latencies.items()
+                },
+            }
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record) + "\n")
+        except OSError:
+            logger.exception("Unable to log the routing decision to %s", self.log_path)
+
+
+class RouterLatencyHandler(BaseCallbackHandler):
+    """A callback handler feeding the first token latencies to a router."""
+
+    def __init__(self, router):
+        self.router = router
+        self._runs = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id=None, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model")
+        if model:
+            self._runs[run_id] = (model, time.perf_counter())
+
+    def on_llm_new_token(self, token, *, run_id=None, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            self.router.observe(run[0], time.perf_counter() - run[1])
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs):
+        # Not streamed, the whole answer is the first token
+        self.on_llm_new_token("", run_id=run_id)
+
+    def on_llm_error(self, error, *, run_id=None, **kwargs):
+        self._runs.pop(run_id, None)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """
+    Return the router configured in the settings, or None when it's off.
+
+    Routing is opt-in, with the ``llm_routing`` setting. The rules come from
+    ``llm_routes``, a list of :class:`Route` fields, and ``llm_route_overrides``
+    maps command paths to models, e.g. in ``config.yaml``:
+
+    .. code-block:: yaml
+
+        llm_routing: true
+        llm_routes:
+          - command: bots developer
+            min_prompt_tokens: 200
+            models: [gpt-4, gpt-3.5-turbo-16k]
+          - models: [gpt-3.5-turbo, gpt-3.5-turbo-16k]
+        llm_route_overrides:
+          bots joker: gpt-3.5-turbo
+
+    The router, and the latencies it learned, are kept while its settings,
+    ``llm_routing_log`` included, don't change.
+    """
+    global _router  # pylint: disable=global-statement
+    if not settings.get("llm_routing", False):
+        return None
+    routes = [Route.from_dict(route) for route in settings.get("llm_routes", [])]
+    overrides = dict(settings.get("llm_route_overrides", {}))
+    log_path = settings.get("llm_routing_log", DEFAULT_ROUTING_LOG)
+    log_path = os.path.expanduser(log_path) if log_path else None
+    with _router_lock:
+        if (
+            _router is None
+            or _router.routes != routes
+            or _router.overrides != overrides
+            or _router.log_path != log_path
+        ):
+            if log_path:
+                # A bare file name is in the current directory
+                os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+            _router = ModelRouter(routes, overrides, log_path)
+        return _router
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from langchain.schema import messages_from_dict, messages_to_dict
+
+from madia.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows, writers aren't serialized across processes
+    fcntl = None
+
+logger = get_logger(__name__)
+
+DEFAULT_SESSIONS_PATH = "~/.madia/sessions"
+DEFAULT_SESSION = "default"
+CURRENT_FILE = "CURRENT"
+SESSION_NAME_PATTERN = re.compile(r"^[\w.-]{1,64}$")
+# Index entry: offset and length of the record in the log, message tokens
+INDEX_ENTRY = struct.Struct("<QII")
+COMPRESSED, RAW = b"z", b"j"
+# Shorter messages don't get smaller with zlib
+COMPRESS_MIN_BYTES = 128
+
+
+def _encode(message):
+    data = json.dumps(messages_to_dict([message])[0]).encode("utf-8")
+    if len(data) >= COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            return COMPRESSED + compressed
+    return RAW + data
+
+
+def _decode(record):
+    data = record[1:]
+    if record[:1] == COMPRESSED:
+        data = zlib.decompress(data)
+    return messages_from_dict([json.loads(data)])[0]
+
+
+class SessionLog:
+    """
+    The messages of a conversation, in an append-only compressed log.
+
+    Each message is a record of ``<name>.log``, zlib-compressed when that
+    saves space, and ``<name>.idx`` holds one fixed-size entry per message:
+    the record's offset and length, and the message's tokens. Resuming a
+    session reads the index backwards to find how many recent messages fit
+    the token window, then reads only those records, however long the
+    session is.
+
+    Args:
+        path (str): The log's path without extension.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.index_path = f"{path}.idx"
+        self.lock = threading.Lock()
+        self._repair()
+
+    def _repair(self):
+        """Drop index entries left half-written by an interrupted append."""
+        if not os.path.exists(self.index_path):
+            return
+        size = os.path.getsize(self.index_path)
+        entries = size // INDEX_ENTRY.size
+        log_size = (
+            os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        )
+        with open(self.index_path, "r+b") as index:
+            while entries:
+                index.seek((entries - 1) * INDEX_ENTRY.size)
+                offset, length, _ = INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size))
+                if offset + length <= log_size:
+                    break
+                entries -= 1
+            if entries * INDEX_ENTRY.size != size:
+                logger.warning("Truncating the session log %s", self.path)
+                index.truncate(entries * INDEX_ENTRY.size)
+
+    def __len__(self):
+        if not os.path.exists(self.index_path):
+            return 0
+        return os.path.getsize(self.index_path) // INDEX_ENTRY.size
+
+    @contextmanager
+    def _locked(self, file):
+        with self.lock:
+            if fcntl:
+                fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+    def append(self, messages, tokens):
+        """
+        Append messages to the session.
+
+        Args:
+            messages (List[BaseMessage]): The messages.
+            tokens (List[int]): The tokens of each message.
+        """
+        records = [_encode(message) for message in messages]
+        with open(self.log_path, "ab") as log, self._locked(log):
+            offset = log.seek(0, os.SEEK_END)
+            entries = []
+            for record, count in zip(records, tokens):
+                entries.append(INDEX_ENTRY.pack(offset, len(record), count))
+                offset += len(record)
+            log.write(b"".join(records))
+            log.flush()
+            # Log first, an index entry never points past the log's end
+            with open(self.index_path, "ab") as index:
+                index.write(b"".join(entries))
+
+    def _entries(self, start, stop):
+        with open(self.index_path, "rb") as index:
+            index.seek(start * INDEX_ENTRY.size)
+            data = index.read((stop - start) * INDEX_ENTRY.size)
+        return list(INDEX_ENTRY.iter_unpack(data))
+
+    def _read(self, entries):
+        if not entries:
+            return []
+        start = entries[0][0]
+        end = entries[-1][0] + entries[-1][1]
+        with open(self.log_path, "rb") as log:
+            log.seek(start)
+            data = log.read(end - start)
+        return [
+            _decode(data[offset - start : offset - start + length])
+            for offset, length, _ in entries
+        ]
+
+    def read(self, start=0, stop=None):
+        """Return the messages from ``start`` to ``stop``, all by default."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        return self._read(self._entries(start, stop)) if start < stop else []
+
+    def tail(self, max_tokens, batch=64):
+        """
+        Return the most recent messages fitting in ``max_tokens``.
+
+        The most recent message is always returned, even when over budget.
+
+        Args:
+            max_tokens (int): The token budget.
+            batch (int, optional): Index entries read at once, going backwards.
+
+        Returns:
+            List[BaseMessage]: The messages, oldest first.
+        """
+        stop = len(self)
+        kept, tokens = [], 0
+        while stop > 0:
+            start = max(0, stop - batch)
+            for entry in reversed(self._entries(start, stop)):
+                if kept and tokens + entry[2] > max_tokens:
+                    return self._read(kept[::-1])
+                kept.append(entry)
+                tokens += entry[2]
+            stop = start
+        return self._read(kept[::-1])
+
+
+class SessionLogStore:
+    """
+    The named conversation sessions, saved under a directory.
+
+    Args:
+        path (str): The sessions' directory, created if missing.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        store = SessionLogStore("~/.madia/sessions")
+        log = store.open("work")
+        log.append([HumanMessage(content="Hi!")], [4])
+        store.fork("work", "work-experiment")
+    """
+
+    def __init__(self, path=DEFAULT_SESSIONS_PATH):
+        self.path = os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self._logs = {}
+        self._lock = threading.Lock()
+
+    def _validate(self, name):
+        if not SESSION_NAME_PATTERN.match(name or ""):
+            raise ValueError(
+                f"Invalid session name {name!r}, use letters, digits, '.', '-' or '_'"
+            )
+        return name
+
+    def open(self, name):
+        """Return the log of a session, created on its first message."""
+        with self._lock:
+            log = self._logs.get(name)
+            if log is None:
+                log = self._logs[name] = SessionLog(
+                    os.path.join(self.path, self._validate(name))
+                )
+        return log
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.path, f"{name}.idx"))
+
+    def list(self):
+        """
+        Return the saved sessions, most recently used first.
+
+        Returns:
+            List[Tuple[str, int, float]]: Each session's name, number of
+            messages and last modification time.
+        """
+        sessions = []
+        for file_name in os.listdir(self.path):
+            name, extension = os.path.splitext(file_name)
+            if extension == ".idx":
+                index_path = os.path.join(self.path, file_name)
+                sessions.append(
+                    (
+                        name,
+                        os.path.getsize(index_path) // INDEX_ENTRY.size,
+                        os.path.getmtime(index_path),
+                    )
+                )
+        return sorted(sessions, key=lambda session: -session[2])
+
+    def fork(self, source, target):
+        """
+        Copy a session under a new name, to continue it in another direction.
+
+        Raises:
+            ValueError: If the target already exists.
+        """
+        self._validate(target)
+        if self.exists(target):
+            raise ValueError(f"The session {target!r} already exists")
+        log = self.open(source)
+        # The index last, a copy interrupted midway has no valid entries
+        if len(log):
+            shutil.copyfile(log.log_path, os.path.join(self.path, f"{target}.log"))
+            shutil.copyfile(log.index_path, os.path.join(self.path, f"{target}.idx"))
+        return self.open(target)
+
+    @property
+    def current(self):
+        """The name of the session resumed at startup."""
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE), encoding="utf-8") as file:
+                return file.read().strip() or DEFAULT_SESSION
+        except FileNotFoundError:
+            return DEFAULT_SESSION
+
+    @current.setter
+    def current(self, name):
+        tmp_path = os.path.join(self.path, f"{CURRENT_FILE}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(self._validate(name))
+        os.replace(tmp_path, os.path.join(self.path, CURRENT_FILE))
+
+
+def format_sessions(sessions, current=None):
+    """Format :meth:`SessionLogStore.list` as one line per session."""
+    if not sessions:
+        return "No saved sessions yet."
+    return "\n".join(
+        f"{'*' if name == current else ' '} {name:<24} {count:>7} messages  "
+        f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(modified))}"
+        for name, count, modified in sessions
+    )
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import json
+import threading
+from typing import Any, Iterator, List, Optional
+
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.schema import BaseMessage, messages_to_dict
+from langchain.schema.output import ChatGenerationChunk, ChatResult
+
+from madia.logger import get_logger
+from madia.metrics import metrics
+from madia.utils_string import string_to_md5
+
+logger = get_logger(__name__)
+
+
+class Flight:
+    """
+    One in-flight request, and what it produced so far.
+
+    Every caller of the request replays the chunks from the start, at its
+    own pace, and then gets the same result or error.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.condition = threading.Condition()
+
+    def publish(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self.condition:
+            self.result, self.error, self.done = result, error, True
+            self.condition.notify_all()
+
+    def replay(self):
+        """Yield every chunk, waiting for the next ones until the request ends."""
+        position = 0
+        while True:
+            with self.condition:
+                while position >= len(self.chunks) and not self.done:
+                    self.condition.wait()
+                chunks = self.chunks[position:]
+                if not chunks:
+                    if self.error is not None:
+                        raise self.error
+                    return
+            position += len(chunks)
+            yield from chunks
+
+    def wait(self):
+        """Return the result once the request ends, raising its error."""
+        with self.condition:
+            while not self.done:
+                self.condition.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent requests into one.
+
+    The first caller of a key starts the request, the callers arriving while
+    it's in flight attach to it instead of starting their own. Once it ends
+    the key is forgotten: this isn't a cache, a later caller starts anew.
+
+    Attributes:
+        coalesced (int): The number of callers that attached to a request.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        flights = SingleFlight()
+        # Concurrent callers with the same key share one download
+        page = flights.call(url, lambda: requests.get(url).text)
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._flights)
+
+    def _join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                metrics.increment("llm_coalesced")
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def _land(self, key, flight, result=None, error=None):
+        with self._lock:
+            del self._flights[key]
+        flight.finish(result, error)
+
+    def call(self, key, fn):
+        """
+        Return ``fn()``, or the result of the identical call in flight.
+
+        The first caller runs ``fn`` itself, the others wait for its result.
+        """
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                result = fn()
+            except BaseException as error:
+                self._land(key, flight, error=error)
+                raise
+            self._land(key, flight, result=result)
+            return result
+        return flight.wait()
+
+    def stream(self, key, source):
+        """
+        Yield the items of ``source()``, or of the identical stream in flight.
+
+        The stream is consumed by a background thread, so a slow or gone
+        caller doesn't hold back the others, and each caller replays it from
+        its first item.
+        """
+        flight, leader = self._join(key)
+        if leader:
+
+            def run():
+                try:
+                    for item in source():
+                        flight.publish(item)
+                except Exception as error:  # pylint: disable=broad-except
+                    self._land(key, flight, error=error)
+                else:
+                    self._land(key, flight)
+
+            threading.Thread(target=run, daemon=True, name="madia-flight").start()
+        return flight.replay()
+
+
+flights = SingleFlight()
+
+
+class SingleFlightMixin:
+    """
+    Chat model mixin sharing identical concurrent requests, see :class:`SingleFlight`.
+
+    Requests are identical when the model's parameters, the messages and the
+    stop words are, hashed with :func:`madia.utils_string.string_to_md5`.
+    Streaming callers each get their own callbacks for every token, those
+    received before they attached included. Setting the model's
+    ``single_flight`` attribute to False turns it off.
+    """
+
+    def _flight_key(self, kind, messages, stop, kwargs):
+        return string_to_md5(
+            kind,
+            self._llm_type,
+            json.dumps(
+                [self._identifying_params, messages_to_dict(messages), stop, kwargs],
+                sort_keys=True,
+                default=str,
+            ),
+        )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        parent = super()
+        if not getattr(self, "single_flight", True):
+            yield from parent._stream(messages, stop, run_manager, **kwargs)
+            return
+
+        def source():
+            # The callbacks are the subscribers', below
+            return parent._stream(messages, stop, None, **kwargs)
+
+        for chunk in flights.stream(
+            self._flight_key("stream", messages, stop, kwargs), source
+        ):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.message.content)
+            yield chunk
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        parent = super()
+        streaming = kwargs.get("stream")
+        if streaming is None:
+            streaming = getattr(self, "streaming", False)
+        if streaming or not getattr(self, "single_flight", True):
+            # Streams go through _stream, so each caller gets its tokens
+            return parent._generate(messages, stop, run_manager, **kwargs)
+        return flights.call(
+            self._flight_key("generate", messages, stop, kwargs),
+            lambda: parent._generate(messages, stop, run_manager, **kwargs),
+        )
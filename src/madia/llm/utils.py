@@ -1,16 +1,31 @@
 from __future__ import annotations
 
-import os
 import string
 import sys
-from math import ceil
+import threading
+import time
 
 from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import get_buffer_string
 
 from madia.logger import get_logger
+from madia.metrics import command_started, metrics, record_llm_usage
+from madia.repl.terminal import (RESTORE_CURSOR, SAVE_CURSOR,
+                                 erase_below_sequence, rows_for_length,
+                                 terminal_columns)
 
 logger = get_logger(__name__)
 
+SUMMARY_MAX_WORDS = 150
+SUMMARY_PROMPT = (
+    "Progressively summarize the lines of conversation provided, adding onto "
+    "the previous summary and returning a new summary of at most {max_words} "
+    "words.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New lines of conversation:\n{lines}\n\n"
+    "New summary:"
+)
+
 
 class ShortProgressStringsHandler(BaseCallbackHandler):
     """
@@ -53,14 +68,12 @@ class ShortProgressStringsHandler(BaseCallbackHandler):
             lines_count (int): The number of lines to be cleared.
         """
 
-        sys.stdout.write("\x1b[2K")  # Clear current line
-        for _ in range(1, lines_count):
-            # sys.stdout.write("\x1b[1A")  # Move Cursor up 1 line
-            sys.stdout.write("\x1b[1B")  # Move Cursor down 1 line
-            sys.stdout.write("\x1b[2K")  # Clear current line
-        sys.stdout.write("\x1b[u")  # Restore cursor position
+        sys.stdout.write(erase_below_sequence(lines_count) + RESTORE_CURSOR)
         sys.stdout.flush()
 
+    def _printed_rows(self):
+        return rows_for_length(len(self.printing_line), terminal_columns())
+
     def on_llm_new_token(self, token: str, **kwargs) -> None:
         """
         Update and display the progress upon processing a new token.
@@ -71,17 +84,14 @@ class ShortProgressStringsHandler(BaseCallbackHandler):
         """
         self.banner_lines.append(token.replace("\n", ""))
 
-        lines_count = ceil((len(self.printing_line)) / os.get_terminal_size().columns)
-
-        sys.stdout.write("\x1b[s")  # Save Cursor position
-        self._clear_lines_below(lines_count)
-
-        # Printing
+        # Erase the previous line and print the new one in a single write
+        erase = erase_below_sequence(self._printed_rows())
         self.printing_line = (
             f"{self.prepend} [{self.progress_bar}] {' '.join(self.banner_lines)}"
         )
-        sys.stdout.write(self.printing_line)
-        sys.stdout.write("\x1b[u")  # Restore cursor position
+        sys.stdout.write(
+            SAVE_CURSOR + erase + RESTORE_CURSOR + self.printing_line + RESTORE_CURSOR
+        )
         sys.stdout.flush()
 
         # Processing Progress Bar
@@ -98,10 +108,8 @@ class ShortProgressStringsHandler(BaseCallbackHandler):
             response: The response after processing tokens.
             **kwargs: Additional keyword arguments.
         """
-        sys.stdout.write("\x1b[s")  # Save Cursor position
-        lines_count = ceil((len(self.printing_line)) / os.get_terminal_size().columns)
-
-        self._clear_lines_below(lines_count)
+        sys.stdout.write(SAVE_CURSOR)
+        self._clear_lines_below(self._printed_rows())
 
 
 class FileLoggerHandler(BaseCallbackHandler):
@@ -139,6 +147,100 @@ class FileLoggerHandler(BaseCallbackHandler):
         logger.debug(outputs)
 
 
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    A callback handler recording the model calls into :mod:`madia.metrics`.
+
+    For each call it records the time to first token and the total
+    generation time, and counts the tokens and their cost, attributed to the
+    command running the call. The time from the command's start to its first
+    call is recorded as the prompt build time.
+
+    Streaming responses carry no token usage, so the streamed tokens are
+    counted and the prompt tokens estimated at 4 characters per token.
+
+    One handler can be shared by any number of clients and threads, calls are
+    told apart by their run id.
+    """
+
+    def __init__(self):
+        self._runs = {}
+        self._lock = threading.Lock()
+        self._last_command = None
+        self._last_run = (None, None)
+
+    def _start(self, run_id, model, prompts):
+        if not metrics.enabled:
+            return
+        now = time.perf_counter()
+        started = command_started()
+        with self._lock:
+            # Commands are told apart by their start time
+            first_call = started is not None and started != self._last_command
+            if first_call:
+                self._last_command = started
+            self._runs[run_id] = [now, None, 0, model, prompts]
+        if first_call:
+            metrics.observe("prompt_build", now - started)
+
+    def _model(self, serialized, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        return params.get("model_name") or params.get("model") or ""
+
+    def on_llm_start(self, serialized, prompts, *, run_id=None, **kwargs) -> None:
+        self._start(run_id, self._model(serialized, kwargs), prompts)
+
+    def on_chat_model_start(
+        self, serialized, messages, *, run_id=None, **kwargs
+    ) -> None:
+        self._start(run_id, self._model(serialized, kwargs), messages)
+
+    def on_llm_new_token(self, token: str, *, run_id=None, **kwargs) -> None:
+        # Hashing the UUID for every token costs more than the rest
+        last_id, run = self._last_run
+        if last_id is not run_id:
+            run = self._runs.get(run_id)
+            if run is None:
+                return
+            self._last_run = (run_id, run)
+        if run[1] is None:
+            run[1] = time.perf_counter()
+            metrics.observe("llm_ttft", run[1] - run[0])
+        run[2] += 1
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs) -> None:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            if self._last_run[0] is run_id:
+                self._last_run = (None, None)
+        if run is None:
+            return
+        start, _, streamed, model, prompts = run
+        metrics.observe("llm_generation", time.perf_counter() - start)
+        usage = ((response and response.llm_output) or {}).get("token_usage")
+        if usage:
+            record_llm_usage(
+                model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+            )
+        else:
+            # Only now, and only without usage, the prompts are measured
+            prompt_chars = sum(
+                len(prompt if isinstance(prompt, str) else get_buffer_string(prompt))
+                for prompt in prompts
+            )
+            record_llm_usage(model, -(-prompt_chars // 4), streamed)
+
+    def on_llm_error(self, error, *, run_id=None, **kwargs) -> None:
+        with self._lock:
+            self._runs.pop(run_id, None)
+        metrics.increment("llm_errors")
+
+
+# Shared by every client: calls in flight are keyed by run id, and the last
+# command seen is kept for prompt_build, all guarded by its _lock
+metrics_handler = MetricsCallbackHandler()
+
+
 def response_strip(text):
     """
     Strip leading and trailing whitespace and control characters from a string.
@@ -154,3 +256,29 @@ def response_strip(text):
             and control characters removed.
     """
     return text.strip(string.whitespace + "".join(chr(i) for i in range(32)))
+
+
+def summarize_messages(llm, summary, messages, max_words=SUMMARY_MAX_WORDS):
+    """
+    Fold messages into a running conversation summary.
+
+    The summary is capped at ``max_words`` words, so folding in more turns
+    doesn't make it grow.
+
+    Args:
+        llm (BaseLanguageModel): The model writing the summary.
+        summary (str): The current summary, may be empty.
+        messages (List[BaseMessage]): The messages to add to the summary.
+        max_words (int, optional): Maximum length of the new summary.
+
+    Returns:
+        str: The new summary.
+    """
+    new_summary = llm.predict(
+        SUMMARY_PROMPT.format(
+            max_words=max_words,
+            summary=summary or "(empty)",
+            lines=get_buffer_string(messages),
+        )
+    )
+    return " ".join(response_strip(new_summary).split()[:max_words])
@@ -6,7 +6,7 @@ import os
 from logging.handlers import MemoryHandler, RotatingFileHandler
 from typing import Iterator
 
-from madia.config import settings
+from madia.config import settings, subscribe
 
 LOG_FILENAME = os.path.expanduser(
     os.path.join(settings.log_path, settings.log_filename)
@@ -48,6 +48,51 @@ logging.getLogger().addHandler(file_handler_full_fp)
 logging.getLogger().removeHandler(logging.getLogger().handlers[0])
 
 
+def _rebuild_file_handlers(changed, snapshot):
+    """
+    Point the file handlers at the new log paths after a settings reload.
+
+    Args:
+        changed (frozenset): The settings keys that changed.
+        snapshot (Mapping): The new settings.
+    """
+    global LOG_FILENAME, LOG_FILENAME_FULL_FP, file_handler, file_handler_full_fp
+
+    log_path = snapshot["log_path"]
+    new_filename = os.path.expanduser(os.path.join(log_path, snapshot["log_filename"]))
+    new_filename_full_fp = os.path.expanduser(
+        os.path.join(log_path, snapshot["log_filename_full_fp"])
+    )
+    os.makedirs(os.path.dirname(new_filename), exist_ok=True)
+    root_logger = logging.getLogger()
+
+    if new_filename != LOG_FILENAME:
+        new_handler = RotatingFileHandler(
+            new_filename, maxBytes=5 * 1024 * 1024, backupCount=5
+        )
+        new_handler.setFormatter(logging.Formatter(FORMATTER))
+        with memory_handler.lock:
+            memory_handler.flush()
+            memory_handler.setTarget(new_handler)
+        file_handler.close()
+        file_handler, LOG_FILENAME = new_handler, new_filename
+
+    if new_filename_full_fp != LOG_FILENAME_FULL_FP:
+        new_handler = RotatingFileHandler(
+            new_filename_full_fp, maxBytes=5 * 1024 * 1024, backupCount=5
+        )
+        new_handler.setFormatter(logging.Formatter(FORMATTER_FULL_FP))
+        root_logger.addHandler(new_handler)
+        root_logger.removeHandler(file_handler_full_fp)
+        file_handler_full_fp.close()
+        file_handler_full_fp, LOG_FILENAME_FULL_FP = new_handler, new_filename_full_fp
+
+
+subscribe(
+    _rebuild_file_handlers, keys=("log_path", "log_filename", "log_filename_full_fp")
+)
+
+
 # Define a function to get the logger. This is what other modules will use.
 def get_logger(name: str) -> logging.Logger:
     """
@@ -0,0 +1,374 @@
+from __future__ import annotations
+
+import atexit
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from madia.config import settings, subscribe
+from madia.logger import get_logger
+
+logger = get_logger(__name__)
+
+SUB_BUCKET_BITS = 7  # 128 sub-buckets per power of two, under 1% error
+PROMETHEUS_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+TEXTFILE_INTERVAL = 10.0
+DEFAULT_COMMAND = "<default>"
+STARTUP_COMMAND = "<startup>"
+# USD per 1k prompt and completion tokens
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+}
+
+_command = ContextVar("madia_command", default=None)
+
+
+class Histogram:
+    """
+    Latency histogram with HDR-style log-linear buckets.
+
+    Values are recorded in microseconds into buckets 1/128th of a power of
+    two wide, so any percentile is within 1% of the exact value, recording
+    is O(1) and the memory is bounded whatever the number of values.
+
+    Attributes:
+        count (int): The number of values recorded.
+        total (float): Their sum, in seconds.
+        max (float): The largest, in seconds.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Record a duration, in seconds."""
+        micros = max(1, int(seconds * 1e6))
+        shift = max(0, micros.bit_length() - SUB_BUCKET_BITS)
+        index = (shift << SUB_BUCKET_BITS) | (micros >> shift)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @staticmethod
+    def _bucket_value(index):
+        shift = index >> SUB_BUCKET_BITS
+        lowest = (index & ((1 << SUB_BUCKET_BITS) - 1)) << shift
+        # The middle of the bucket, in seconds
+        return (lowest + (1 << shift) / 2) / 1e6 if shift else lowest / 1e6
+
+    def percentile(self, q):
+        """
+        Return the ``q`` (0-100) percentile, in seconds.
+
+        Returns:
+            float: The percentile, 0 if nothing was recorded.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q / 100 * self.count))
+        if rank >= self.count:
+            return self.max
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        """Return how many values are at most each bound, in seconds."""
+        counts = [0] * len(bounds)
+        for index, count in self.buckets.items():
+            value = self._bucket_value(index)
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    counts[i] += count
+        return counts
+
+
+class Metrics:
+    """
+    Latency histograms and counters, labelled by command path.
+
+    Attributes:
+        enabled (bool): Whether anything is recorded.
+        histograms (Dict[Tuple[str, str], Histogram]): By metric and command.
+        counters (Dict[Tuple[str, str, str], float]): By metric, command and
+            kind, e.g. ``("tokens", "ai", "completion")``.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def observe(self, metric, seconds, command=None):
+        """Record a duration of the current, or given, command."""
+        if not self.enabled:
+            return
+        key = (metric, command or current_command())
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.record(seconds)
+
+    def increment(self, metric, value=1, kind="", command=None):
+        """Add to a counter of the current, or given, command."""
+        if not self.enabled:
+            return
+        key = (metric, command or current_command(), kind)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, metric):
+        """Time the block into the ``metric`` histogram of the current command."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(metric, time.perf_counter() - start)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+metrics = Metrics(settings.get("metrics", True))
+# Read once and on changes, settings.get() would cost more than the recording
+_textfile = settings.get("metrics_textfile", None)
+
+
+def _on_settings_change(changed, snapshot):
+    global _textfile  # pylint: disable=global-statement
+    metrics.enabled = snapshot.get("metrics", True)
+    _textfile = snapshot.get("metrics_textfile", None)
+
+
+subscribe(_on_settings_change, keys=("metrics", "metrics_textfile"))
+
+
+def set_command(command):
+    """
+    Make ``command`` the current one, labelling what is recorded next.
+
+    It stays current until the next command, so rendering its result and
+    the model callbacks are attributed to it.
+
+    Args:
+        command (Command, optional): The resolved command, None for the
+            REPL's default function.
+    """
+    label = DEFAULT_COMMAND if command is None else " ".join(command.path)
+    _command.set((label, time.perf_counter()))
+
+
+def current_command():
+    """Return the current command's path, e.g. ``"openai search"``."""
+    current = _command.get()
+    return DEFAULT_COMMAND if current is None else current[0]
+
+
+def command_started():
+    """Return the ``time.perf_counter()`` the current command started at, or None."""
+    current = _command.get()
+    return None if current is None else current[1]
+
+
+def record_llm_usage(model, prompt_tokens, completion_tokens):
+    """Count the tokens of a model call, and their cost when the price is known."""
+    metrics.increment("tokens", prompt_tokens, "prompt")
+    metrics.increment("tokens", completion_tokens, "completion")
+    # e.g. gpt-3.5-turbo-0613 is priced as gpt-3.5-turbo
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model and model.startswith(name):
+            prompt_price, completion_price = MODEL_PRICES[name]
+            metrics.increment(
+                "cost_usd",
+                (prompt_tokens * prompt_price + completion_tokens * completion_price)
+                / 1000,
+            )
+            break
+
+
+def format_stats(registry=None):
+    """
+    Format the recorded metrics as a table, one line per command.
+
+    Returns:
+        str: The table.
+    """
+    registry = registry or metrics
+    with registry.lock:
+        histograms = dict(registry.histograms)
+        counters = dict(registry.counters)
+    # A command only warmed up was never run
+    commands = sorted(
+        {
+            command
+            for metric, command in histograms
+            if command != STARTUP_COMMAND and metric != "warmup"
+        }
+    )
+    startup = histograms.get(("startup", STARTUP_COMMAND))
+    if not commands and startup is None:
+        return "No metrics recorded yet."
+
+    def latency(metric, command):
+        histogram = histograms.get((metric, command))
+        if histogram is None:
+            return "-"
+        return (
+            f"{histogram.percentile(50) * 1000:.1f}/"
+            f"{histogram.percentile(99) * 1000:.1f}"
+        )
+
+    lines = [
+        f"{'command':<24} {'n':>5} {'execute':>13} {'prompt':>11} {'ttft':>11} "
+        f"{'generate':>11} {'render':>11} {'tokens':>9} {'cost $':>8}",
+    ]
+    for command in commands:
+        executed = histograms.get(("execute", command))
+        tokens = sum(
+            value
+            for (metric, label, _), value in counters.items()
+            if metric == "tokens" and label == command
+        )
+        lines.append(
+            f"{command:<24} {executed.count if executed else 0:>5} "
+            f"{latency('execute', command):>13} "
+            f"{latency('prompt_build', command):>11} "
+            f"{latency('llm_ttft', command):>11} "
+            f"{latency('llm_generation', command):>11} "
+            f"{latency('render', command):>11} {tokens:>9.0f} "
+            f"{counters.get(('cost_usd', command, ''), 0):>8.4f}"
+        )
+    saved = {
+        command: histogram
+        for (metric, command), histogram in histograms.items()
+        if metric == "warmup_saved"
+    }
+    if saved:
+        lines.append(
+            "Warm-up saved: "
+            + ", ".join(
+                f"{command} {histogram.total * 1000:.0f} ms"
+                for command, histogram in sorted(saved.items())
+            )
+        )
+    if startup is not None:
+        lines.append(f"Startup: {startup.max * 1000:.0f} ms")
+    lines.append("Latencies in ms, p50/p99.")
+    return "\n".join(lines)
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(registry=None):
+    """
+    Render the metrics in the Prometheus text exposition format.
+
+    Returns:
+        str: The metrics, e.g. for node_exporter's textfile collector.
+    """
+    registry = registry or metrics
+    with registry.lock:
+        histograms = dict(registry.histograms)
+        counters = dict(registry.counters)
+
+    lines = []
+    for metric in sorted({metric for metric, _ in histograms}):
+        name = f"madia_{metric}_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for (other, command), histogram in sorted(histograms.items()):
+            if other != metric:
+                continue
+            label = f'command="{_label(command)}"'
+            counts = histogram.cumulative(PROMETHEUS_BUCKETS)
+            for bound, count in zip(PROMETHEUS_BUCKETS, counts):
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f"{name}_sum{{{label}}} {histogram.total}")
+            lines.append(f"{name}_count{{{label}}} {histogram.count}")
+    for metric in sorted({metric for metric, _, _ in counters}):
+        name = f"madia_{metric}_total"
+        lines.append(f"# TYPE {name} counter")
+        for (other, command, kind), value in sorted(counters.items()):
+            if other != metric:
+                continue
+            labels = f'command="{_label(command)}"'
+            if kind:
+                labels += f',kind="{_label(kind)}"'
+            lines.append(f"{name}{{{labels}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+_last_export = 0.0
+
+
+def write_textfile(path=None, force=False):
+    """
+    Write the metrics to the ``metrics_textfile`` setting's path, if set.
+
+    Writes at most every 10 seconds unless ``force``, atomically so the
+    collector never reads a partial file.
+
+    Args:
+        path (str, optional): Overrides the setting.
+        force (bool, optional): Write even if the last write is recent.
+    """
+    global _last_export  # pylint: disable=global-statement
+    path = path or _textfile
+    if not path or not metrics.enabled:
+        return
+    now = time.monotonic()
+    if not force and now - _last_export < TEXTFILE_INTERVAL:
+        return
+    _last_export = now
+    path = os.path.expanduser(path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(prometheus_text())
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.exception("Unable to write the metrics to %s", path)
+
+
+atexit.register(write_textfile, force=True)
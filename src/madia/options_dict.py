@@ -3,12 +3,29 @@ from __future__ import annotations
 from functools import partial
 from pprint import pformat
 
+from madia.config import settings
 from madia.gradio.chatbot_v1 import cb_fn
-from madia.llm.blip_caption import caption_image_url
+from madia.llm.blip_caption import (DEFAULT_BLIP_MODEL, caption_image_url,
+                                    load_blip)
+from madia.llm.clients import warm_up_connection
 from madia.llm.openai_chat import BufferedWindowMessage
 from madia.llm.openai_search import BufferedSearchWindowMessage
+from madia.llm.session_log import DEFAULT_SESSIONS_PATH, SessionLogStore
 from madia.logger import show_logs_to_user
+from madia.metrics import format_stats
 from madia.repl.base_repl import BaseRepl
+from madia.repl.plugins import (DEFAULT_MANIFEST_PATH, PluginManifest,
+                                add_plugin_commands)
+from madia.retrieval.docs import ask_command, ingest_command, search_command
+
+# ``ai`` and ``openai single_message`` are the same conversation, saved as a session
+chat = BufferedWindowMessage(
+    session_store=SessionLogStore(
+        settings.get("chat_sessions_path", DEFAULT_SESSIONS_PATH)
+    )
+    if settings.get("chat_sessions", True)
+    else None
+)
 
 main_loop_options = {
     "hardcoded_print": {
@@ -70,6 +87,16 @@ main_loop_options = {
                 "description": "Show logs",
                 "child": {},
             },
+            "stats": {
+                "cmd": lambda x: format_stats(),
+                "help": (
+                    "Shows the latency percentiles, tokens and cost of each "
+                    "command since startup"
+                ),
+                "short_help": "Displays command metrics",
+                "description": "Show per-command latency and token metrics",
+                "child": {},
+            },
         },
     },
     "tree_test": {
@@ -103,7 +130,8 @@ main_loop_options = {
         },
     },
     "ai": {
-        "cmd": BufferedWindowMessage().get_response,
+        "cmd": chat.get_response,
+        "warmup": warm_up_connection,
         "help": "AI response generator",
         "short_help": "AI response",
         "description": "Generates a response using AI",
@@ -116,7 +144,8 @@ main_loop_options = {
         "description": "Base command for all openai related commands",
         "child": {
             "single_message": {
-                "cmd": BufferedWindowMessage().get_response,
+                "cmd": chat.get_response,
+                "warmup": warm_up_connection,
                 "help": "Get a single message from openai",
                 "short_help": "Single message",
                 "description": "Retrieve a single message from openai",
@@ -129,9 +158,11 @@ main_loop_options = {
                 "help": "Opens a REPL for single messages",
                 "short_help": "Open REPL",
                 "description": "REPL for single message retrieval",
+                "interactive": True,
             },
             "search": {
                 "cmd": BufferedSearchWindowMessage().get_response,
+                "warmup": warm_up_connection,
                 "help": "Searches messages from openai",
                 "short_help": "Search messages",
                 "description": "Search messages in openai",
@@ -148,6 +179,7 @@ main_loop_options = {
                 "help": "Get a single message from openai",
                 "short_help": "Single message",
                 "description": "Retrieve a single message from openai",
+                "interactive": True,
             },
         },
     },
@@ -157,11 +189,66 @@ main_loop_options = {
         "child": {
             "caption": {
                 "cmd": caption_image_url,
-                "help": "Return caption from a image url",
+                # Loads the BLIP weights while the image URL is being typed
+                "warmup": partial(load_blip, DEFAULT_BLIP_MODEL),
+                "help": (
+                    "Return the caption of an image URL or file, or of every "
+                    "image of a directory or glob"
+                ),
                 "short_help": "Caption Image URL",
             },
         },
     },
+    "session": {
+        "cmd": lambda x: "session base command",
+        "help": "Saved conversations of the 'ai' command",
+        "short_help": "Sessions base",
+        "description": "List, resume and fork the saved conversation sessions",
+        "child": {
+            "list": {
+                "cmd": chat.list_sessions,
+                "help": "List the saved sessions, * marks the current one",
+                "short_help": "List sessions",
+            },
+            "resume": {
+                "cmd": chat.resume_session,
+                "help": "Continue a session, or start a new one with that name",
+                "short_help": "Resume session",
+            },
+            "fork": {
+                "cmd": chat.fork_session,
+                "help": "Copy the current session under a new name and switch to it",
+                "short_help": "Fork session",
+            },
+        },
+    },
+    "docs": {
+        "cmd": lambda x: "docs base command",
+        "help": "Chat with your documents",
+        "short_help": "Documents base",
+        "description": "Ingest PDFs and text files, then ask questions about them",
+        "child": {
+            "ingest": {
+                "cmd": ingest_command,
+                "help": "Ingest a PDF, a text file or a directory of them",
+                "short_help": "Ingest documents",
+                "description": (
+                    "Incrementally add documents to the local index, "
+                    "only new chunks are embedded"
+                ),
+            },
+            "search": {
+                "cmd": search_command,
+                "help": "Show the passages most relevant to a query",
+                "short_help": "Search documents",
+            },
+            "ask": {
+                "cmd": ask_command,
+                "help": "Answer a question from the ingested documents",
+                "short_help": "Ask documents",
+            },
+        },
+    },
     "bots": {
         "cmd": lambda x: "bots base command",
         "help": "Base for bot commands",
@@ -178,6 +265,7 @@ main_loop_options = {
                         "Return every message with a joke related to the message"
                     ),
                 ),
+                "warmup": warm_up_connection,
                 "help": "Interact with Joker bot",
                 "short_help": "Joker bot",
                 "description": (
@@ -194,6 +282,7 @@ main_loop_options = {
                         "documentation and following the best practices."
                     ),
                 ),
+                "warmup": warm_up_connection,
                 "help": "Interact with Joker bot",
                 "short_help": "Joker bot",
                 "description": (
@@ -204,3 +293,11 @@ main_loop_options = {
         },
     },
 }
+
+# Commands of the installed plugins, from the cached manifest: no plugin is
+# imported until one of its commands runs
+if settings.get("plugins", True):
+    add_plugin_commands(
+        main_loop_options,
+        PluginManifest(settings.get("plugins_manifest_path", DEFAULT_MANIFEST_PATH)),
+    )
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+from madia.config import settings
+from madia.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_PROFILES_PATH = "~/.madia/profiles"
+PROFILE_PREFIX = "profile "
+# The GIL switch interval, sampling more often only queues up behind it
+SAMPLE_INTERVAL = 0.005
+TOP_FUNCTIONS = 15
+IMPORT_TIME_MODULE = "madia.options_dict"
+# "import time:  self [us] | cumulative | imported package", indented by depth
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profiles_path():
+    """Return the directory profiles are written to, created if missing."""
+    path = os.path.expanduser(settings.get("profiles_path", DEFAULT_PROFILES_PATH))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _file_stem(name):
+    slug = re.sub(r"[^\w.-]+", "_", name).strip("_")[:48] or "repl"
+    return os.path.join(profiles_path(), f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}")
+
+
+def _method_qualname(frame):
+    # Code objects have no co_qualname before Python 3.11, a method's class
+    # is found on its instance
+    code = frame.f_code
+    if code.co_argcount and code.co_varnames[0] == "self":
+        instance = frame.f_locals.get("self")
+        for cls in type(instance).__mro__:
+            function = cls.__dict__.get(code.co_name)
+            if getattr(function, "__code__", None) is code:
+                return f"{cls.__qualname__}.{code.co_name}"
+    return code.co_name
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = code.co_filename
+    if not module.startswith("<"):  # e.g. <frozen importlib._bootstrap>
+        module = os.path.splitext(os.path.basename(module))[0]
+    return f"{module}:{getattr(code, 'co_qualname', None) or _method_qualname(frame)}"
+
+
+def write_collapsed(path, stacks):
+    """
+    Write stacks in the collapsed format of flamegraph.pl and speedscope.
+
+    Args:
+        path (str): The file to write.
+        stacks (Dict[Tuple[str, ...], int]): The count of each stack, root first.
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        for stack, count in sorted(stacks.items()):
+            file.write(f"{';'.join(stack)} {count}\n")
+
+
+class StackSampler(threading.Thread):
+    """
+    Thread sampling the stack of another thread at a fixed interval.
+
+    Unlike cProfile it sees whole stacks, which is what flamegraphs show, and
+    its overhead depends on the interval, not on the number of calls.
+
+    Args:
+        thread_id (int): The ``threading.get_ident()`` of the sampled thread.
+        interval (float, optional): Seconds between samples.
+
+    Attributes:
+        stacks (Counter): The number of samples of each stack, root first.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True, name="madia-stack-sampler")
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        # code objects are shared by every sample of a function, and a
+        # method's code by its defining class only
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            # pylint: disable=protected-access
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = _frame_name(frame)
+                stack.append(name)
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profiler:
+    """
+    Profile a block with cProfile and a stack sampler, and save the results.
+
+    On exit, ``<profiles_path>/<timestamp>-<name>.pstats`` holds the cProfile
+    statistics, for ``python -m pstats`` or snakeviz, and ``.collapsed`` the
+    sampled stacks, for flamegraph.pl or speedscope.
+
+    Args:
+        name (str): Names the files, e.g. the profiled command.
+        interval (float, optional): Seconds between stack samples.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        with Profiler("ai hello") as profiler:
+            repl.present_result(repl.execute_command("ai hello"))
+        print(profiler.summary())
+    """
+
+    def __init__(self, name, interval=SAMPLE_INTERVAL):
+        self.name = name
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.sampler = None
+        self.stem = None
+        self.elapsed = 0.0
+
+    @property
+    def pstats_path(self):
+        return f"{self.stem}.pstats"
+
+    @property
+    def collapsed_path(self):
+        return f"{self.stem}.collapsed"
+
+    def __enter__(self):
+        self.sampler = StackSampler(threading.get_ident(), self.interval)
+        self.sampler.start()
+        self._start = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        self.elapsed = time.perf_counter() - self._start
+        self.sampler.stop()
+        self.stem = _file_stem(self.name)
+        try:
+            self.profile.dump_stats(self.pstats_path)
+            write_collapsed(self.collapsed_path, self.sampler.stacks)
+        except OSError:
+            logger.exception("Unable to write the profile of %s", self.name)
+            self.stem = None
+        return False
+
+    def summary(self, top=TOP_FUNCTIONS):
+        """Return the functions taking the most cumulative time, and the files."""
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        lines = [
+            f"Profiled {self.name!r} in {self.elapsed * 1000:.1f} ms",
+            stream.getvalue().strip(),
+        ]
+        if self.stem:
+            lines += [f"pstats: {self.pstats_path}", f"stacks: {self.collapsed_path}"]
+        return "\n".join(lines)
+
+
+def parse_import_time(output):
+    """
+    Parse the ``python -X importtime`` output into import stacks.
+
+    Args:
+        output (str): What the interpreter wrote to stderr.
+
+    Returns:
+        Tuple[Dict[Tuple[str, ...], int], List[Tuple[str, int, int]]]: The
+        self time of each import stack, root first, and each module's self
+        and cumulative time, in microseconds.
+    """
+    imports = []
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((module, len(indent) // 2, int(self_us), int(cumulative_us)))
+
+    # Modules are listed after their own imports, reversed a parent comes first
+    stacks, path = {}, []
+    for module, depth, self_us, _ in reversed(imports):
+        del path[depth:]
+        path.append(module)
+        stacks[tuple(path)] = stacks.get(tuple(path), 0) + self_us
+    return stacks, [(module, s, c) for module, _, s, c in imports]
+
+
+def profile_imports(module=IMPORT_TIME_MODULE, top=TOP_FUNCTIONS):
+    """
+    Break down the import time of the startup path, in a fresh interpreter.
+
+    The import stacks are written to ``<timestamp>-import-time.collapsed``.
+
+    Args:
+        module (str, optional): The module to import, the command tree by
+            default, as the CLI and the REPL import it at startup.
+        top (int, optional): The number of modules listed.
+
+    Returns:
+        str: The slowest modules by cumulative import time, and the file.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    stacks, imports = parse_import_time(result.stderr)
+    if not imports:
+        return f"Unable to import {module}:\n{result.stderr}"
+    path = f"{_file_stem('import-time')}.collapsed"
+    write_collapsed(path, stacks)
+
+    total = sum(self_us for _, self_us, _ in imports)
+    lines = [
+        f"Importing {module} took {total / 1000:.1f} ms",
+        f"{'cumulative ms':>14} {'self ms':>9}  module",
+    ]
+    for name, self_us, cumulative_us in sorted(imports, key=lambda i: -i[2])[:top]:
+        lines.append(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+    lines.append(f"stacks: {path}")
+    return "\n".join(lines)
@@ -2,24 +2,49 @@ from __future__ import annotations
 
 import os
 import shlex
+import time
 from functools import lru_cache
 
 from prompt_toolkit import PromptSession
 from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
 from prompt_toolkit.completion import Completer, Completion
-from prompt_toolkit.history import FileHistory, InMemoryHistory
+from prompt_toolkit.history import InMemoryHistory, ThreadedHistory
 
 from madia.config import settings
 from madia.logger import LoggingMixin, get_logger
+from madia.metrics import metrics, set_command, write_textfile
+from madia.profiling import PROFILE_PREFIX, Profiler
+from madia.repl.commands import CommandTable
+from madia.repl.history import (DEFAULT_MAX_ENTRIES, CompactFileHistory,
+                                IndexedAutoSuggest)
 from madia.repl.utils import delete_stdout_content
 from madia.repl.utils import \
     detect_and_highlight_code as detect_and_highlight_code_fn
 from madia.repl.utils import safe_shlex_split
+from madia.repl.warmup import WarmupRunner
 from madia.utils_string import string_to_md5
 
 logger = get_logger(__name__)
 
 
+def _stable_fn_name(fn):
+    """
+    Name a function in a way that is stable across runs.
+
+    Unlike ``repr``, this doesn't include memory addresses, so it can be used
+    to key files that should survive a restart.
+
+    :param fn: The function, bound method or :func:`functools.partial`.
+    :type fn: callable, optional
+    :return: The dotted path of the function.
+    :rtype: str
+    """
+    if fn is None:
+        return ""
+    fn = getattr(fn, "func", fn)  # functools.partial
+    return f"{getattr(fn, '__module__', '')}.{getattr(fn, '__qualname__', repr(fn))}"
+
+
 class BaseRepl(LoggingMixin):
     """
     A base class for creating interactive REPL (Read-Eval-Print Loop) environments.
@@ -67,9 +92,26 @@ class BaseRepl(LoggingMixin):
     """
 
     class CustomCompleter(Completer):
-        def __init__(self, completion_tree):
+        """
+        Complete the commands of a completion tree.
+
+        :param completion_tree: The command tree.
+        :type completion_tree: dict
+        :param warmups: Fires the ``warmup`` of a command as soon as the typed
+            text resolves to it alone, before it's entered.
+        :type warmups: madia.repl.warmup.WarmupRunner, optional
+        """
+
+        def __init__(self, completion_tree, warmups=None):
             super().__init__()
             self.completion_tree = completion_tree
+            self.warmups = warmups
+
+        def _fire_warmup(self, path, node):
+            if self.warmups is not None and path and isinstance(node, dict):
+                warmup = node.get("warmup")
+                if warmup is not None:
+                    self.warmups.fire(" ".join(path), warmup)
 
         @lru_cache(maxsize=128)
         def _safe_shlex_split_cache(self, text):
@@ -87,6 +129,7 @@ class BaseRepl(LoggingMixin):
 
             # Traverse the completion tree based on parsed arguments.
             cur_tree = self.completion_tree
+            path = []
             for arg in arguments[:-1]:
                 if callable(cur_tree):
                     continue
@@ -96,8 +139,10 @@ class BaseRepl(LoggingMixin):
                 )
                 if isinstance(cur_tree.get("child", cur_tree), dict) and matching_key:
                     cur_tree = cur_tree.get("child", cur_tree)[matching_key]
+                    path.append(matching_key)
                 else:
                     return
+            self._fire_warmup(path, cur_tree)
 
             # Get the prefix for suggestions at the current level.
             prefix = arguments[-1]
@@ -122,6 +167,11 @@ class BaseRepl(LoggingMixin):
                     for o in cur_tree.get("child", cur_tree)
                     if prefix in str(o).lower()
                 ]
+                if prefix and len(options) == 1:
+                    # The command is known before it's entered, warm it up
+                    self._fire_warmup(
+                        [*path, options[0]], cur_tree.get("child", cur_tree)[options[0]]
+                    )
                 for option in options:
                     yield Completion(str(option), start_position=-len(prefix))
 
@@ -151,23 +201,57 @@ class BaseRepl(LoggingMixin):
         self.print_fn_return = print_fn_return or True
         self.delete_stdout_content = delete_stdout_content or False
         self.completion_dict = completion_dict or {}
+        self.commands = CommandTable(self.completion_dict, self.default_fn)
+        self.warmups = WarmupRunner() if settings.get("repl_warmup", True) else None
+        self._session = None
+
+    @property
+    def session(self):
+        """
+        The prompt_toolkit session, created on first use.
 
+        Running a single command never needs it, so it doesn't pay for the
+        history file and prompt setup.
+
+        :rtype: prompt_toolkit.PromptSession
+        """
+        if self._session is None:
+            self._session = self._build_session()
+        return self._session
+
+    def _build_session(self):
         if settings.rep_hist and settings.rep_hist_path:
-            history_fn = FileHistory
-            history_fn_args = os.path.join(
-                os.path.expanduser(settings.rep_hist_path),
-                f"{string_to_md5(self.prompt_message, self.default_fn)}.txt",
+            history = CompactFileHistory(
+                os.path.join(
+                    os.path.expanduser(settings.rep_hist_path),
+                    f"{self.history_key}.jsonl",
+                ),
+                max_entries=settings.get("rep_hist_max_entries", DEFAULT_MAX_ENTRIES),
             )
+            auto_suggest = IndexedAutoSuggest(history)
+            # Load the history file in the background, not before the first prompt
+            history_fn, history_fn_args = ThreadedHistory, (history,)
         else:
-            history_fn = InMemoryHistory
+            history_fn, history_fn_args = InMemoryHistory, ()
+            auto_suggest = AutoSuggestFromHistory()
 
-        self.session = PromptSession(
-            completer=self.CustomCompleter(self.completion_dict),
-            history=history_fn(history_fn_args),
-            auto_suggest=AutoSuggestFromHistory(),
+        return PromptSession(
+            completer=self.CustomCompleter(self.completion_dict, self.warmups),
+            history=history_fn(*history_fn_args),
+            auto_suggest=auto_suggest,
             # multiline=True,
         )
 
+    @property
+    def history_key(self):
+        """
+        Key naming this REPL's history file, stable across runs.
+
+        :return: MD5 of the prompt message and the default function's name.
+        :rtype: str
+        """
+        return string_to_md5(self.prompt_message, _stable_fn_name(self.default_fn))
+
     def print_help(self, ob, key="", i=1):
         """
         Print help information about a command.
@@ -191,48 +275,75 @@ class BaseRepl(LoggingMixin):
 
     def execute_command(self, command):
         """
-        Execute the provided command.
+        Execute the provided command, recording its latency in
+        :mod:`madia.metrics` under its command path.
 
         :param command: The input command to execute.
         :type command: str
         :return: The result of the executed command.
         :rtype: str
         """
-        command_arr = safe_shlex_split(command)
-        if not command_arr:
-            return None
-        cur_tree = self.completion_dict
-        cur_obj = None
-        prev_obj, prev_key = None, None
-        fn = None  # Placeholder for our function
-
-        # Loop until we either find a callable or exhaust the commands list
-        for i, cur_level in enumerate(command_arr):
-            if cur_level == "?":
-                self.print_help(prev_obj, prev_key)
-                return
-
-            if cur_level not in cur_tree:
-                break
+        start = time.perf_counter()
+        resolved = False
+
+        def on_resolve(found):
+            nonlocal resolved
+            resolved = True
+            set_command(found)
+            metrics.observe("dispatch", time.perf_counter() - start)
+            if self.warmups is not None and found is not None:
+                self.warmups.settle(" ".join(found.path))
+
+        try:
+            return self.commands.execute(
+                command, help_fn=self._print_command_help, on_resolve=on_resolve
+            )
+        except Exception:
+            if resolved:
+                metrics.increment("errors")
+            raise
+        finally:
+            # Empty input never resolves, there is no command to record
+            if resolved:
+                metrics.observe("execute", time.perf_counter() - start)
+                write_textfile()
+
+    def run_command(self, command):
+        """
+        Execute a command and present its result, under the profiler when it
+        starts with ``profile``.
 
-            cur_obj = cur_tree[cur_level]
-            cur_tree = cur_obj.get("child", cur_tree)
-            fn = cur_obj if callable(cur_obj) else cur_obj.get("cmd", None)
-            prev_obj, prev_key = cur_obj, cur_level
+        :param command: The input command to run.
+        :type command: str
+        """
+        if command.startswith(PROFILE_PREFIX):
+            self.profile_command(command[len(PROFILE_PREFIX) :])
+            return
 
-        if fn:
-            pass
-        elif self.default_fn:
-            i = i - 1
-            fn = self.default_fn
-        else:
-            return f"Invalid command: {cur_level}"
+        result = self.execute_command(command)
+        self.logger.debug(f"Command result pre formatter: {result}")
+        self.present_result(result)
+
+    def profile_command(self, command):
+        """
+        Execute and present a command under the profiler.
 
-        if not fn:
-            return f"'{command}' does not map to a valid function."
+        The pstats and collapsed stacks are written under ``~/.madia/profiles``
+        and the slowest functions printed after the result.
 
-        args = command_arr[i:]  # Extract the remaining commands as arguments
-        return fn(" ".join(args))
+        :param command: The input command to profile, without ``profile``.
+        :type command: str
+        """
+        with Profiler(command) as profiler:
+            self.present_result(self.execute_command(command))
+        print(profiler.summary())
+
+    def _print_command_help(self, command):
+        if command is None:
+            for key, ob in self.completion_dict.items():
+                self.print_help(ob if isinstance(ob, dict) else {}, key)
+        else:
+            self.print_help(command.node, command.key)
 
     def present_result(
         self,
@@ -257,14 +368,15 @@ class BaseRepl(LoggingMixin):
             print_fn_return is None and self.print_fn_return
         )
 
-        if detect_and_highlight_code:
-            result = detect_and_highlight_code_fn(result)
+        with metrics.timer("render"):
+            if detect_and_highlight_code:
+                result = detect_and_highlight_code_fn(result)
 
-        if print_fn_return:
-            if result:
-                print(result)
-            else:
-                print("The function didn't output any text.")
+            if print_fn_return:
+                if result:
+                    print(result)
+                else:
+                    print("The function didn't output any text.")
 
     def loop(
         self,
@@ -289,17 +401,24 @@ class BaseRepl(LoggingMixin):
         while True:
             try:
                 command = self.session.prompt(self.prompt_message)
+                self._cancel_warmups()
 
                 if command.lower() in ("exit", "quit"):
                     print("Exiting REPL. See Ya!")
                     break
 
-                result = self.execute_command(command)
-                self.logger.debug(f"Command result pre formatter: {result}")
-                self.present_result(result)
+                self.run_command(command)
 
             except KeyboardInterrupt:
+                self._cancel_warmups()
                 print("\n🎹🎹Interrupt, opsie, let's move on!")
             except EOFError:
+                self._cancel_warmups()
                 print("\nExiting REPL. Bye 👋🏻\n")
                 break
+
+    def _cancel_warmups(self):
+        # Once a line is entered or abandoned, the pending warm-ups are for
+        # prefixes the user deleted, the entered command settles its own
+        if self.warmups is not None:
+            self.warmups.cancel()
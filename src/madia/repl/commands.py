@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+from madia.repl.utils import safe_shlex_split
+
+
+@dataclass(frozen=True)
+class Command:
+    """
+    A command of the tree, as compiled by :class:`CommandTable`.
+
+    :param path: The words leading to the command, e.g. ``("config", "logs")``.
+    :type path: tuple[str, ...]
+    :param handler: The function called with the remaining arguments.
+    :type handler: callable, optional
+    :param node: The command's node in the completion tree.
+    :type node: dict
+    """
+
+    path: tuple
+    handler: object = None
+    node: dict = field(default_factory=dict, repr=False, compare=False)
+
+    @property
+    def key(self):
+        """The last word of the command's path."""
+        return self.path[-1] if self.path else ""
+
+
+class CommandTable:
+    """
+    A command tree compiled into a flat ``path -> Command`` table.
+
+    Alongside the table, each word maps directly to its ``(Command,
+    children)`` pair, so resolving a command is one dict lookup per word with
+    no ``child``/``cmd`` key handling or callable checks at dispatch time.
+
+    :param completion_dict: The command tree, as used by
+        :class:`madia.repl.base_repl.BaseRepl`.
+    :type completion_dict: dict
+    :param default_fn: Function called with the whole input when it doesn't
+        start with a known command.
+    :type default_fn: callable, optional
+
+    Usage Example:
+
+    .. code-block:: python
+
+        table = CommandTable({"hello": {"cmd": lambda x: f"Hello {x}!"}})
+        table.execute("hello world")  # "Hello world!"
+    """
+
+    def __init__(self, completion_dict, default_fn=None):
+        self.completion_dict = completion_dict
+        self.default_fn = default_fn
+        self.commands = {}
+        self._root = self._compile(completion_dict, ())
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __contains__(self, path):
+        return tuple(path) in self.commands
+
+    def _compile(self, tree, prefix):
+        compiled = {}
+        for key, node in tree.items():
+            path = (*prefix, key)
+            if callable(node):
+                command, children = Command(path, node), {}
+            else:
+                command = Command(path, node.get("cmd"), node)
+                child = node.get("child")
+                children = self._compile(child, path) if isinstance(child, dict) else {}
+            self.commands[path] = command
+            compiled[key] = (command, children)
+        return compiled
+
+    def resolve(self, arguments):
+        """
+        Find the longest command the arguments start with.
+
+        :param arguments: The tokenized input.
+        :type arguments: list[str]
+        :return: The command, or None, and the number of arguments it used.
+        :rtype: tuple[Command, int]
+        """
+        command, depth = None, 0
+        level = self._root
+        for argument in arguments:
+            found = level.get(argument)
+            if found is None:
+                break
+            command, level = found
+            depth += 1
+        return command, depth
+
+    def execute(self, command, help_fn=None, on_resolve=None):
+        """
+        Execute the provided command.
+
+        :param command: The input command to execute.
+        :type command: str
+        :param help_fn: Called with the :class:`Command` (None for the root)
+            when the input ends with ``?`` right after a command.
+        :type help_fn: callable, optional
+        :param on_resolve: Called with the resolved :class:`Command`, or None,
+            before it runs.
+        :type on_resolve: callable, optional
+        :return: The result of the executed command.
+        :rtype: str
+        """
+        arguments = safe_shlex_split(command)
+        if not arguments:
+            return None
+
+        found, depth = self.resolve(arguments)
+        if on_resolve:
+            on_resolve(found)
+        if depth < len(arguments) and arguments[depth] == "?" and help_fn:
+            return help_fn(found)
+
+        if found and found.handler:
+            return found.handler(" ".join(arguments[depth:]))
+        if self.default_fn:
+            return self.default_fn(" ".join(arguments))
+        if found:
+            return f"'{command}' does not map to a valid function."
+        return f"Invalid command: {arguments[0]}"
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from bisect import bisect_left
+
+from prompt_toolkit.auto_suggest import AutoSuggest, Suggestion
+from prompt_toolkit.history import History
+
+from madia.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_ENTRIES = 10_000
+# Rewrite the file once it holds this many times more lines than live entries
+COMPACT_RATIO = 2
+# Session entries scanned linearly before they are merged into the sorted index
+REINDEX_THRESHOLD = 1024
+
+
+class PrefixIndex:
+    """
+    Find the most recent history entry starting with a given prefix.
+
+    Entries are kept in a sorted list, so the ones sharing a prefix form a
+    contiguous range found with :func:`bisect.bisect_left`. A segment tree over
+    the entries' recency then returns the newest entry of that range, making a
+    lookup ``O(log n)`` instead of a scan of the whole history.
+
+    Entries added after the last rebuild are kept in a small list that is
+    checked first (they are the most recent anyway), and merged into the
+    sorted index once it grows past ``reindex_threshold``.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        index = PrefixIndex(["git status", "git log", "ls"])
+        index.lookup("git")  # "git log"
+    """
+
+    def __init__(self, entries=(), reindex_threshold=REINDEX_THRESHOLD):
+        self.reindex_threshold = reindex_threshold
+        self._lock = threading.Lock()
+        self._recent = []
+        self.rebuild(entries)
+
+    def __len__(self):
+        return len(self._keys) + len(self._recent)
+
+    def rebuild(self, entries):
+        """
+        Replace the indexed entries.
+
+        :param entries: The entries, oldest first. Duplicates keep the recency
+            of their last occurrence.
+        :type entries: Iterable[str]
+        """
+        recency = {string: rank for rank, string in enumerate(entries)}
+        keys = sorted(recency)
+        size = len(keys)
+        ranks = [recency[key] for key in keys]
+
+        # tree[size + i] is leaf i, tree[i] the position of the newest entry
+        # below node i.
+        tree = [0] * size + list(range(size))
+        for node in range(size - 1, 0, -1):
+            left, right = tree[2 * node], tree[2 * node + 1]
+            tree[node] = left if ranks[left] > ranks[right] else right
+
+        with self._lock:
+            self._keys, self._ranks, self._tree = keys, ranks, tree
+            self._recent = []
+
+    def add(self, string):
+        """
+        Add a new, most recent, entry.
+
+        :param string: The entry to add.
+        :type string: str
+        """
+        with self._lock:
+            self._recent.append(string)
+            reindex = len(self._recent) > self.reindex_threshold
+            if reindex:
+                merged = sorted(range(len(self._keys)), key=self._ranks.__getitem__)
+                entries = [self._keys[i] for i in merged] + self._recent
+        if reindex:
+            self.rebuild(entries)
+
+    def lookup(self, prefix):
+        """
+        Return the most recent entry starting with ``prefix``.
+
+        :param prefix: The text typed so far.
+        :type prefix: str
+        :return: The matching entry, or None when nothing matches.
+        :rtype: str, optional
+        """
+        with self._lock:
+            keys, ranks, tree = self._keys, self._ranks, self._tree
+            for string in reversed(self._recent):
+                if string.startswith(prefix):
+                    return string
+
+        size = len(keys)
+        lower = bisect_left(keys, prefix)
+        # Every string starting with prefix sorts before prefix + max char
+        upper = bisect_left(keys, prefix + "\U0010ffff", lower)
+        best = None
+        lower, upper = lower + size, upper + size
+        while lower < upper:
+            if lower & 1:
+                if best is None or ranks[tree[lower]] > ranks[best]:
+                    best = tree[lower]
+                lower += 1
+            if upper & 1:
+                upper -= 1
+                if best is None or ranks[tree[upper]] > ranks[best]:
+                    best = tree[upper]
+            lower >>= 1
+            upper >>= 1
+        return None if best is None else keys[best]
+
+
+class CompactFileHistory(History):
+    """
+    Append-only file history with deduplication and a size cap.
+
+    Each entry is stored as one JSON encoded line, so multi-line commands
+    don't need a custom framing. Writing only ever appends; when loading, the
+    entries are deduplicated (keeping the most recent occurrence), capped to
+    ``max_entries``, and the file is rewritten once it holds too many stale
+    lines.
+
+    :param filename: The file to store the history in.
+    :type filename: str
+    :param max_entries: Maximum number of unique entries to keep.
+    :type max_entries: int, optional
+    """
+
+    def __init__(self, filename, max_entries=DEFAULT_MAX_ENTRIES):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.index = PrefixIndex()
+        super().__init__()
+
+    def _read_entries(self):
+        entries = []
+        if not os.path.exists(self.filename):
+            return entries
+        with open(self.filename, encoding="utf-8", errors="replace") as history:
+            for line in history:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    logger.debug("Skipping corrupted history line: %r", line)
+        return entries
+
+    def _compact(self, entries):
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as history:
+            history.writelines(f"{json.dumps(entry)}\n" for entry in entries)
+        os.replace(tmp_filename, self.filename)
+
+    def load_history_strings(self):
+        lines = self._read_entries()
+        # dict keeps the insertion order, re-inserting moves an entry last
+        unique = {}
+        for entry in lines:
+            unique.pop(entry, None)
+            unique[entry] = None
+        entries = list(unique)[-self.max_entries :]
+
+        if len(lines) > COMPACT_RATIO * len(entries):
+            logger.debug("Compacting %s: %d lines", self.filename, len(lines))
+            self._compact(entries)
+
+        self.index.rebuild(entries)
+        return reversed(entries)
+
+    def store_string(self, string):
+        with open(self.filename, "a", encoding="utf-8") as history:
+            history.write(f"{json.dumps(string)}\n")
+        self.index.add(string)
+
+
+class IndexedAutoSuggest(AutoSuggest):
+    """
+    Suggest the most recent matching entry of a :class:`CompactFileHistory`.
+
+    Unlike :class:`prompt_toolkit.auto_suggest.AutoSuggestFromHistory`, which
+    scans the whole history on every keystroke, this asks the history's
+    :class:`PrefixIndex`.
+
+    :param history: The history to get suggestions from.
+    :type history: CompactFileHistory
+    """
+
+    def __init__(self, history):
+        self.history = history
+
+    def get_suggestion(self, buffer, document):
+        # Consider only the last line for the suggestion.
+        text = document.text.rsplit("\n", 1)[-1]
+        if not text.strip():
+            return None
+        match = self.history.index.lookup(text)
+        if match is None or match == text:
+            return None
+        return Suggestion(match[len(text) :])
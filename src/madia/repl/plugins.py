@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+from importlib.metadata import EntryPoint, entry_points
+
+from madia.logger import get_logger
+from madia.utils_string import string_to_md5
+
+logger = get_logger(__name__)
+
+ENTRY_POINT_GROUP = "madia.commands"
+DEFAULT_MANIFEST_PATH = "~/.madia/cache/plugins.json"
+# Bump when the manifest's layout changes, older manifests are rebuilt
+MANIFEST_VERSION = 1
+METADATA_SUFFIXES = (".dist-info", ".egg-info")
+# Marks a handler in the manifest, the value is its path in the plugin's tree
+LAZY_KEY = "__lazy__"
+
+
+class LazyHandler:
+    """
+    A plugin's command handler, imported the first time it's called.
+
+    :param value: The entry point's object reference, ``module:attribute``.
+    :type value: str
+    :param path: The keys leading from the entry point's object to the
+        handler, e.g. ``("child", "now", "cmd")``.
+    :type path: tuple[str, ...]
+    """
+
+    def __init__(self, value, path=()):
+        self.value = value
+        self.path = tuple(path)
+        self._handler = None
+
+    def resolve(self):
+        """
+        Import the plugin and return the handler.
+
+        :return: The handler.
+        :rtype: callable
+        """
+        if self._handler is None:
+            target = EntryPoint("", self.value, ENTRY_POINT_GROUP).load()
+            for key in self.path:
+                target = target[key]
+            self._handler = target
+        return self._handler
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"LazyHandler({self.value!r}, {self.path!r})"
+
+
+def metadata_fingerprint(paths=None):
+    """
+    Fingerprint the installed distributions, without reading their metadata.
+
+    Installing, upgrading or removing a distribution adds, replaces or
+    deletes its ``.dist-info`` directory, which changes its name or mtime.
+    Listing the directories of ``sys.path`` is much cheaper than reading
+    every distribution's ``entry_points.txt``.
+
+    :param paths: The directories to look in, ``sys.path`` by default.
+    :type paths: list[str], optional
+    :return: A digest of the metadata directories' names and mtimes.
+    :rtype: str
+    """
+    parts = [str(MANIFEST_VERSION)]
+    for path in sys.path if paths is None else paths:
+        try:
+            with os.scandir(path or ".") as entries:
+                found = sorted(
+                    (entry.name, entry.stat().st_mtime_ns)
+                    for entry in entries
+                    if entry.name.endswith(METADATA_SUFFIXES)
+                )
+        except OSError:
+            # Zip files, or directories that don't exist
+            continue
+        parts.append(f"{path}\0{found}")
+    return string_to_md5(*parts)
+
+
+def _manifest_node(value, path):
+    if callable(value):
+        return {LAZY_KEY: list(path)}
+    if isinstance(value, dict):
+        return {
+            str(key): _manifest_node(child, (*path, key))
+            for key, child in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [
+            _manifest_node(item, (*path, index)) for index, item in enumerate(value)
+        ]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _command_node(value, entry_point):
+    if isinstance(value, dict):
+        if LAZY_KEY in value:
+            return LazyHandler(entry_point, value[LAZY_KEY])
+        return {key: _command_node(child, entry_point) for key, child in value.items()}
+    if isinstance(value, list):
+        return [_command_node(item, entry_point) for item in value]
+    return value
+
+
+def _group_entry_points(group):
+    if sys.version_info >= (3, 10):
+        return entry_points(group=group)
+    # A dict of the groups before Python 3.10
+    return entry_points().get(group, [])
+
+
+def discover_plugins(group=ENTRY_POINT_GROUP):
+    """
+    Import the plugins and describe their commands, for the manifest.
+
+    Each entry point of ``group`` names a top-level command, and its object
+    is the command's node, as in :data:`madia.options_dict.main_loop_options`,
+    or its handler alone. A plugin failing to import is left out.
+
+    :param group: The entry point group.
+    :type group: str
+    :return: The manifest's commands, handlers replaced by their path.
+    :rtype: list[dict]
+    """
+    commands = []
+    for entry_point in _group_entry_points(group):
+        try:
+            node = entry_point.load()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Unable to load the plugin %s", entry_point.value)
+            continue
+        commands.append(
+            {
+                "name": entry_point.name,
+                "value": entry_point.value,
+                "node": _manifest_node(node, ()),
+            }
+        )
+    return commands
+
+
+class PluginManifest:
+    """
+    The plugins' commands, cached in a JSON file.
+
+    Discovering the plugins means reading the entry points of every installed
+    distribution and importing each plugin, too slow for every start. The
+    manifest keeps their command paths, help texts and handler references,
+    so completion and ``?`` help work without importing any plugin, and a
+    handler's module is only imported when the command runs. It's rebuilt
+    when :func:`metadata_fingerprint` changes, i.e. a distribution was
+    installed, upgraded or removed.
+
+    :param path: The manifest file.
+    :type path: str, optional
+    :param group: The entry point group of the commands.
+    :type group: str, optional
+
+    Usage Example:
+
+    .. code-block:: python
+
+        # In the plugin's pyproject.toml:
+        # [project.entry-points."madia.commands"]
+        # weather = "madia_weather:command"
+
+        commands = PluginManifest().commands()
+        commands["weather"]["cmd"]("Dublin")  # imports madia_weather
+    """
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH, group=ENTRY_POINT_GROUP):
+        self.path = os.path.expanduser(path)
+        self.group = group
+
+    def load(self):
+        """
+        Return the manifest's commands, rebuilding it if it's out of date.
+
+        :return: The commands, as stored in the manifest.
+        :rtype: list[dict]
+        """
+        fingerprint = metadata_fingerprint()
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                manifest = json.load(file)
+            if (
+                manifest.get("fingerprint") == fingerprint
+                and manifest.get("group") == self.group
+            ):
+                return manifest["commands"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, AttributeError):
+            logger.warning("Rebuilding the unreadable plugin manifest %s", self.path)
+        return self.rebuild(fingerprint)
+
+    def rebuild(self, fingerprint=None):
+        """
+        Discover the plugins and write the manifest.
+
+        :param fingerprint: The installed distributions' fingerprint.
+        :type fingerprint: str, optional
+        :return: The commands.
+        :rtype: list[dict]
+        """
+        commands = discover_plugins(self.group)
+        manifest = {
+            "fingerprint": fingerprint or metadata_fingerprint(),
+            "group": self.group,
+            "commands": commands,
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(manifest, file)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.exception("Unable to write the plugin manifest %s", self.path)
+        return commands
+
+    def commands(self):
+        """
+        Return the plugins' command tree, with lazy handlers.
+
+        :return: The top-level commands, by name.
+        :rtype: dict
+        """
+        return {
+            command["name"]: _command_node(command["node"], command["value"])
+            for command in self.load()
+        }
+
+
+def add_plugin_commands(options, manifest=None):
+    """
+    Add the plugins' commands to a command tree.
+
+    The built-in commands win over a plugin's command of the same name.
+
+    :param options: The command tree, changed in place.
+    :type options: dict
+    :param manifest: The manifest, the default file if None.
+    :type manifest: PluginManifest, optional
+    :return: The tree.
+    :rtype: dict
+    """
+    manifest = manifest or PluginManifest()
+    for name, node in manifest.commands().items():
+        if name in options:
+            logger.warning("The plugin command %r is already a command", name)
+            continue
+        options[name] = node
+    return options
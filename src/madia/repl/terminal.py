@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+import time
+from math import ceil
+
+SAVE_CURSOR = "\x1b[s"
+RESTORE_CURSOR = "\x1b[u"
+CLEAR_LINE = "\x1b[2K"
+CURSOR_UP = "\x1b[1A"
+CURSOR_DOWN = "\x1b[1B"
+
+# Seconds the terminal size is cached for, querying it is a syscall
+TERMINAL_SIZE_TTL = 0.5
+_size_cache = (0.0, os.terminal_size((80, 24)))
+
+
+def terminal_size():
+    """
+    Return the terminal size, cached for :data:`TERMINAL_SIZE_TTL` seconds.
+
+    Falls back to the ``COLUMNS`` and ``LINES`` environment variables, then
+    80x24, when stdout isn't a terminal.
+
+    :return: The number of columns and lines.
+    :rtype: os.terminal_size
+    """
+    global _size_cache
+
+    expires, size = _size_cache
+    now = time.monotonic()
+    if now >= expires:
+        size = shutil.get_terminal_size()
+        _size_cache = (now + TERMINAL_SIZE_TTL, size)
+    return size
+
+
+def reset_terminal_size():
+    """Forget the cached terminal size, e.g. after ``COLUMNS`` changed."""
+    global _size_cache
+
+    _size_cache = (0.0, _size_cache[1])
+
+
+def terminal_columns():
+    """
+    Return the terminal width, see :func:`terminal_size`.
+
+    :return: The number of columns.
+    :rtype: int
+    """
+    return terminal_size().columns or 80
+
+
+def rows_for_length(length, columns):
+    """
+    Return how many terminal rows a line of ``length`` characters takes.
+
+    :param length: The number of characters in the line, without the newline.
+    :type length: int
+    :param columns: The terminal width.
+    :type columns: int
+    :rtype: int
+    """
+    return max(1, ceil(length / columns))
+
+
+class RowCounter:
+    """
+    Count the terminal rows above the cursor as text is written.
+
+    Wrapped lines are accounted for, so the count can be used to erase
+    everything that was printed. Feeding text is linear in its length.
+
+    :param columns: The terminal width, defaults to :func:`terminal_columns`.
+    :type columns: int, optional
+    """
+
+    def __init__(self, columns=None):
+        self.columns = columns or terminal_columns()
+        self.reset()
+
+    def reset(self):
+        """Forget the text fed so far."""
+        self._completed_rows = 0
+        self._line_length = 0
+
+    def feed(self, text):
+        """
+        Account for ``text`` being written at the cursor.
+
+        :param text: The text written.
+        :type text: str
+        :return: This counter, for chaining.
+        :rtype: RowCounter
+        """
+        if "\n" not in text:
+            self._line_length += len(text)
+            return self
+        lines = text.split("\n")
+        self._line_length += len(lines[0])
+        for line_length in [self._line_length, *map(len, lines[1:-1])]:
+            self._completed_rows += rows_for_length(line_length, self.columns)
+        self._line_length = len(lines[-1])
+        return self
+
+    @property
+    def rows(self):
+        """Rows above the cursor's row taken by the text fed so far."""
+        return (
+            self._completed_rows + rows_for_length(self._line_length, self.columns) - 1
+        )
+
+
+def count_rows(text, columns=None):
+    """
+    Return the rows above the cursor taken by ``text`` once printed.
+
+    :param text: The printed text.
+    :type text: str
+    :param columns: The terminal width, defaults to :func:`terminal_columns`.
+    :type columns: int, optional
+    :rtype: int
+    """
+    return RowCounter(columns).feed(text).rows
+
+
+def erase_above_sequence(rows):
+    """
+    Build the escape sequence erasing the cursor's row and ``rows`` above it.
+
+    The cursor ends at the start of the topmost erased row. Rows scrolled
+    off the screen can't be reached, so at most a screen's height is erased.
+
+    :param rows: Rows to erase above the cursor's row.
+    :type rows: int
+    :rtype: str
+    """
+    rows = min(rows, terminal_size().lines)
+    return "\r" + CLEAR_LINE + (CURSOR_UP + CLEAR_LINE) * rows
+
+
+def erase_below_sequence(rows):
+    """
+    Build the escape sequence erasing ``rows`` rows from the cursor's row down.
+
+    The cursor is left on the last erased row, callers usually restore a
+    saved position afterwards.
+
+    :param rows: Rows to erase, including the cursor's row.
+    :type rows: int
+    :rtype: str
+    """
+    return CLEAR_LINE + (CURSOR_DOWN + CLEAR_LINE) * (rows - 1)
+
+
+def erase_text_above(text, stream=None):
+    """
+    Erase ``text`` that was just printed, with a single write and flush.
+
+    :param text: The printed text, the cursor being right after it.
+    :type text: str
+    :param stream: The stream to write to, defaults to ``sys.stdout``.
+    :type stream: TextIO, optional
+    """
+    stream = stream or sys.stdout
+    stream.write(erase_above_sequence(count_rows(text)))
+    stream.flush()
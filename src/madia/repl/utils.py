@@ -5,11 +5,18 @@ import re
 import shlex
 import sys
 import threading
+from collections import deque
 
 from pygments import highlight
 from pygments.formatters import TerminalFormatter
 from pygments.lexers import get_all_lexers, get_lexer_by_name
 
+from madia.repl.terminal import (RowCounter, erase_above_sequence,
+                                 erase_text_above)
+
+# Characters making shlex.split behave differently from str.split
+SHLEX_SPECIAL_CHARS = re.compile(r"[\"'\\]|(?![ \t\r\n])\s")
+
 
 def detect_and_highlight_code(text):
     """
@@ -78,55 +85,27 @@ def detect_and_highlight_code(text):
 
 def delete_stdout_content(content):
     """
-    Import statement for this module.
-
-    .. code-block:: python
-
-        import shlex
+    Erase content that was just printed to stdout.
 
-    Split a string into tokens in a shell-like manner. This is a wrapper around
-    the shlex.split function that handles unmatched quotes more gracefully.
+    The rows taken by the content are computed once, accounting for lines
+    wrapped by the terminal, and the whole erase sequence is emitted with a
+    single write.
 
     Parameters
     ----------
-    text : str
-        The string to split into tokens.
-
-    Returns
-    -------
-    list of str
-        A list of tokens from splitting the input text.
-
-    Raises
-    ------
-    ValueError
-        If there is still an unmatched quote after attempting to fix
-        unclosed quotes.
+    content : str
+        The printed content, the cursor being right after it.
 
     Examples
     --------
-    >>> text = "This is a 'string' with unmatched quote"
-    >>> safe_shlex_split(text)
-    ['This', 'is', 'a', "'string'", 'with', 'unmatched', 'quote']
+    >>> text = "Thinking...\n"
+    >>> print(text, end="")
+    >>> delete_stdout_content(text)
 
     """
     if not content:
         return
-    number_of_lines = content.count("\n")
-
-    for line_no in range(number_of_lines):
-        # Move cursor up one line
-        sys.stdout.write("\x1b[1A")
-        sys.stdout.flush()
-
-        # Erase current line
-        sys.stdout.write(
-            "\r" + " " * len(content.split("\n")[number_of_lines - 1 - line_no]) + "\r"
-        )
-        sys.stdout.flush()
-    if number_of_lines == 0:
-        sys.stdout.write("\r")
-    sys.stdout.flush()
+    erase_text_above(content)
 
 
 def safe_shlex_split(text):
@@ -164,6 +143,10 @@ def safe_shlex_split(text):
     ['This', 'is', 'a', "'string'", 'with', 'unmatched', 'quote']
 
     """
+    # Without quotes, escapes or unusual whitespace, shlex splits exactly like
+    # str.split, which is much faster.
+    if not SHLEX_SPECIAL_CHARS.search(text):
+        return text.split()
     try:
         return shlex.split(text)
     except ValueError as err:
@@ -183,33 +166,116 @@ def safe_shlex_split(text):
 class StreamWrapper:
     """
     Wrapper class for a stream (e.g., stdout) that supports buffering and flushing.
+
+    Only a running count of the terminal rows written is kept, which is all
+    :meth:`clear` needs, plus the most recent ``max_captured`` characters for
+    :meth:`getvalue`. Writes are forwarded to the original stream in batches,
+    once ``flush_size`` characters are pending or ``flush_interval`` seconds
+    after the first pending write, whichever comes first.
+
+    :param original_stream: The stream to forward the writes to.
+    :type original_stream: TextIO
+    :param quiet: Capture the writes without echoing them.
+    :type quiet: bool, optional
+    :param flush_interval: Maximum seconds a write waits before being flushed.
+    :type flush_interval: float, optional
+    :param flush_size: Number of pending characters that triggers a flush.
+    :type flush_size: int, optional
+    :param max_captured: Number of characters kept for :meth:`getvalue`.
+    :type max_captured: int, optional
     """
 
-    def __init__(self, original_stream):
+    FLUSH_INTERVAL = 0.05
+    FLUSH_SIZE = 64 * 1024
+    MAX_CAPTURED = 64 * 1024
+
+    def __init__(
+        self,
+        original_stream,
+        quiet=False,
+        flush_interval=FLUSH_INTERVAL,
+        flush_size=FLUSH_SIZE,
+        max_captured=MAX_CAPTURED,
+    ):
         self.original_stream = original_stream
+        self.quiet = quiet
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_captured = max_captured
         self.lock = threading.Lock()
-        self.buffer = ""
+        self.rows = RowCounter()
+        self._captured = deque()
+        self._captured_size = 0
+        self._pending = []
+        self._pending_size = 0
+        self._timer = None
+
+    def __getattr__(self, name):
+        # isatty, encoding, fileno... come from the wrapped stream
+        if name == "original_stream":
+            raise AttributeError(name)
+        return getattr(self.original_stream, name)
+
+    def _capture(self, data):
+        self._captured.append(data)
+        self._captured_size += len(data)
+        while self._captured_size - len(self._captured[0]) >= self.max_captured:
+            self._captured_size -= len(self._captured.popleft())
+
+    def _flush_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            self.original_stream.write("".join(self._pending))
+            self._pending, self._pending_size = [], 0
+        self.original_stream.flush()
 
     def write(self, data):
         with self.lock:
-            self.buffer += data
-            self.original_stream.write(data)
-            self.original_stream.flush()
+            self._capture(data)
+            if self.quiet:
+                return len(data)
+            self.rows.feed(data)
+
+            self._pending.append(data)
+            self._pending_size += len(data)
+            if self._pending_size >= self.flush_size:
+                self._flush_pending()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return len(data)
 
     def flush(self):
         with self.lock:
-            self.original_stream.flush()
+            self._flush_pending()
+
+    def getvalue(self):
+        """
+        Return the most recent captured output.
+
+        :return: Up to the last ``max_captured`` characters written (a bit
+            more when a single write is larger).
+        :rtype: str
+        """
+        with self.lock:
+            return "".join(self._captured)
 
     def clear(self):
         with self.lock:
-            print("\033[F\033[K" * self.buffer.count("\n"), end="")
-            self.buffer = ""
+            self._flush_pending()
+            if not self.quiet:
+                self.original_stream.write(erase_above_sequence(self.rows.rows))
+            self.rows.reset()
+            self._captured.clear()
+            self._captured_size = 0
             self.original_stream.flush()
-            # print("")
 
 
 @contextlib.contextmanager
-def temporary_stdout():
+def temporary_stdout(quiet=False):
     """
     Context manager for temporarily redirecting stdout.
 
@@ -217,6 +283,11 @@ def temporary_stdout():
     stream wrapper. It allows capturing and manipulating printed content
     within the context, which can be useful for testing and capturing output.
 
+    Parameters
+    ----------
+    quiet : bool, optional
+        Capture the output without echoing it to the terminal.
+
     Example
     -------
     >>> from madia.repl.utils import temporary_stdout
@@ -228,10 +299,10 @@ def temporary_stdout():
 
     """
     original_stdout = sys.stdout
-    custom_stream = StreamWrapper(original_stdout)
+    custom_stream = StreamWrapper(original_stdout, quiet=quiet)
     sys.stdout = custom_stream
     try:
-        yield
+        yield custom_stream
     finally:
         sys.stdout = original_stdout
         custom_stream.flush()
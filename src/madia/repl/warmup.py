@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+
+from madia.logger import get_logger
+from madia.metrics import metrics
+
+logger = get_logger(__name__)
+
+PENDING, RUNNING, DONE, FAILED, CANCELLED = (
+    "pending",
+    "running",
+    "done",
+    "failed",
+    "cancelled",
+)
+
+
+class Warmup:
+    """
+    The warm-up of one command, e.g. loading the model it needs.
+
+    :param key: The command path, e.g. ``"image caption"``.
+    :type key: str
+    :param fn: The warm-up, called without arguments.
+    :type fn: callable
+    """
+
+    def __init__(self, key, fn):
+        self.key = key
+        self.fn = fn
+        self.state = PENDING
+        self.started = self.finished = None
+        self.settled = False
+        self.finished_event = threading.Event()
+
+    def run(self):
+        self.started = time.perf_counter()
+        try:
+            self.fn()
+        except Exception:  # pylint: disable=broad-except
+            # The command will hit the same error, and report it
+            logger.exception("Warm-up of %r failed", self.key)
+            self.state = FAILED
+        else:
+            self.state = DONE
+        self.finished = time.perf_counter()
+        metrics.observe("warmup", self.finished - self.started, command=self.key)
+        self.finished_event.set()
+
+
+class WarmupRunner:
+    """
+    Run the warm-up hooks of commands in a background thread.
+
+    :meth:`fire` only queues the warm-up, so it can be called on every
+    keystroke: each command is warmed up at most once, one at a time, in the
+    order they were fired. A warm-up not started yet can be cancelled, one
+    already running goes on until it ends.
+
+    Before a command runs, :meth:`settle` waits for its running warm-up, so
+    the command doesn't load the same thing twice, and records in
+    :mod:`madia.metrics` the ``warmup_saved`` seconds: how long the warm-up
+    ran before the command was entered.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        warmups = WarmupRunner()
+        warmups.fire("image caption", partial(load_blip, DEFAULT_BLIP_MODEL))
+        # ... the user finishes typing the command ...
+        warmups.settle("image caption")
+    """
+
+    def __init__(self):
+        self.warmups = {}
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def fire(self, key, fn):
+        """
+        Queue the warm-up of a command, unless it was already.
+
+        :param key: The command path.
+        :type key: str
+        :param fn: The warm-up, called without arguments.
+        :type fn: callable
+        :return: Whether the warm-up was queued.
+        :rtype: bool
+        """
+        with self._lock:
+            warmup = self.warmups.get(key)
+            if warmup is not None and (warmup.settled or warmup.state != CANCELLED):
+                return False
+            warmup = self.warmups[key] = Warmup(key, fn)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._work, daemon=True, name="madia-warmup"
+                )
+                self._thread.start()
+        self._queue.put(warmup)
+        return True
+
+    def cancel(self, key=None):
+        """
+        Cancel the warm-up of a command, or all of them, if not started yet.
+
+        A cancelled warm-up can be fired again, until its command ran.
+
+        :param key: The command path, all commands if None.
+        :type key: str, optional
+        """
+        with self._lock:
+            for warmup in self.warmups.values():
+                if warmup.state == PENDING and key in (None, warmup.key):
+                    warmup.state = CANCELLED
+                    warmup.finished_event.set()
+
+    def settle(self, key):
+        """
+        Get a command's warm-up out of its way, before it runs.
+
+        A pending warm-up is cancelled, the command does the work itself, and
+        a running one is waited for. Once a command ran, its warm-up isn't
+        fired anymore. Only the first run of the command is
+        measured, the later ones would have been fast anyway.
+
+        :param key: The command path.
+        :type key: str
+        """
+        with self._lock:
+            warmup = self.warmups.get(key)
+            if warmup is None:
+                # The command warms itself up, no need to do it later
+                warmup = self.warmups[key] = Warmup(key, None)
+                warmup.state = CANCELLED
+            if warmup.settled:
+                return
+            warmup.settled = True
+            if warmup.state in (PENDING, CANCELLED):
+                warmup.state = CANCELLED
+                warmup.finished_event.set()
+                return
+        entered = time.perf_counter()
+        warmup.finished_event.wait()
+        if warmup.state == DONE:
+            # Up to the command being entered, later it was waited for anyway
+            saved = min(warmup.finished, entered) - warmup.started
+            metrics.observe("warmup_saved", max(saved, 0.0), command=key)
+
+    def _work(self):
+        while True:
+            warmup = self._queue.get()
+            with self._lock:
+                if warmup.state != PENDING:
+                    continue
+                warmup.state = RUNNING
+            warmup.run()
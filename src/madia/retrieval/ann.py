@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from madia.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_NPROBE = 16
+KMEANS_ITERATIONS = 10
+# Training on every vector barely improves the centroids, a sample is enough
+KMEANS_SAMPLES_PER_LIST = 64
+ASSIGN_BLOCK_ROWS = 16384
+
+
+def default_nlist(rows):
+    """Number of inverted lists for ``rows`` vectors, about ``sqrt(rows)``."""
+    return max(1, min(rows, round(math.sqrt(rows))))
+
+
+def assign(vectors, centroids, workers=None):
+    """
+    Return the index of the most similar centroid of each vector.
+
+    Vectors are processed in blocks spread over a thread pool: NumPy releases
+    the GIL in the matrix products, so the blocks run on all cores, and a
+    memory-mapped input is never loaded whole.
+
+    Args:
+        vectors (np.ndarray): The ``(n, dim)`` vectors, possibly memory-mapped.
+        centroids (np.ndarray): The ``(nlist, dim)`` centroids.
+        workers (int, optional): Threads, defaults to the number of CPUs.
+
+    Returns:
+        np.ndarray: The ``(n,)`` centroid indexes.
+    """
+
+    def assign_block(start):
+        block = np.asarray(vectors[start : start + ASSIGN_BLOCK_ROWS])
+        return (block @ centroids.T).argmax(axis=1)
+
+    starts = range(0, len(vectors), ASSIGN_BLOCK_ROWS)
+    if len(starts) <= 1:
+        return assign_block(0) if len(vectors) else np.zeros(0, dtype=np.int64)
+    with ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+        return np.concatenate(list(pool.map(assign_block, starts)))
+
+
+def train_centroids(vectors, nlist, workers=None, seed=0):
+    """
+    Spherical k-means: centroids of unit vectors, compared by dot product.
+
+    Args:
+        vectors (np.ndarray): The ``(n, dim)`` unit vectors.
+        nlist (int): The number of centroids.
+        workers (int, optional): Threads used to assign vectors.
+        seed (int, optional): Seed of the sampling and initialization.
+
+    Returns:
+        np.ndarray: The ``(nlist, dim)`` unit centroids.
+    """
+    rng = np.random.default_rng(seed)
+    rows = len(vectors)
+    sample_size = min(rows, nlist * KMEANS_SAMPLES_PER_LIST)
+    # Sorted, so a memory-mapped input is read sequentially
+    sample = np.asarray(vectors[np.sort(rng.choice(rows, sample_size, replace=False))])
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(KMEANS_ITERATIONS):
+        labels = assign(sample, centroids, workers)
+        order = np.argsort(labels, kind="stable")
+        used, starts = np.unique(labels[order], return_index=True)
+        sums = np.add.reduceat(sample[order], starts, axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids[used] = sums / np.maximum(norms, 1e-12)
+        # Restart empty lists from random samples
+        empty = np.setdiff1d(np.arange(nlist), used)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample_size, len(empty))]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted file index: approximate nearest neighbours over NumPy arrays.
+
+    The vectors are clustered around ``nlist`` centroids, and a query is only
+    compared with the vectors of its ``nprobe`` most similar clusters, a
+    fraction of the index. ``nprobe`` trades recall for speed.
+
+    Vectors added after the index was built aren't in any list, they are
+    compared exactly until the index is rebuilt.
+
+    Attributes:
+        centroids (np.ndarray): The ``(nlist, dim)`` centroids.
+        order (np.ndarray): The vector rows, grouped by list.
+        offsets (np.ndarray): List ``i`` is ``order[offsets[i]:offsets[i + 1]]``.
+        rows (int): The number of vectors indexed.
+    """
+
+    def __init__(self, centroids, order, offsets, rows):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.rows = rows
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors, nlist=None, workers=None, seed=0):
+        """
+        Build the index of ``vectors``.
+
+        Args:
+            vectors (np.ndarray): The ``(n, dim)`` unit vectors.
+            nlist (int, optional): The number of lists, see :func:`default_nlist`.
+            workers (int, optional): Threads, defaults to the number of CPUs.
+            seed (int, optional): Seed of the clustering.
+
+        Returns:
+            IVFIndex: The index.
+        """
+        rows = len(vectors)
+        nlist = min(nlist or default_nlist(rows), rows)
+        centroids = train_centroids(vectors, nlist, workers, seed)
+        labels = assign(vectors, centroids, workers)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+        logger.info("Built an IVF index of %d vectors in %d lists", rows, nlist)
+        return cls(centroids, order, offsets, rows)
+
+    def candidates(self, query, nprobe=DEFAULT_NPROBE, total_rows=None):
+        """
+        Return the rows to compare with the query.
+
+        Args:
+            query (np.ndarray): The ``(dim,)`` query vector.
+            nprobe (int, optional): The number of lists searched.
+            total_rows (int, optional): Rows currently stored, those past
+                :attr:`rows` are always candidates.
+
+        Returns:
+            np.ndarray: The candidate rows.
+        """
+        nprobe = min(nprobe, self.nlist)
+        probed = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        parts = [self.order[self.offsets[i] : self.offsets[i + 1]] for i in probed]
+        if total_rows and total_rows > self.rows:
+            parts.append(np.arange(self.rows, total_rows))
+        # Sorted, so a memory-mapped store is read in order
+        return np.sort(np.concatenate(parts))
+
+    def save(self, path):
+        """Save the index to an ``.npz`` file, atomically."""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            order=self.order,
+            offsets=self.offsets,
+            rows=self.rows,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved by :meth:`save`."""
+        with np.load(path) as data:
+            return cls(
+                data["centroids"], data["order"], data["offsets"], int(data["rows"])
+            )
@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from langchain.schema import HumanMessage, SystemMessage
+
+from madia.config import settings
+from madia.logger import get_logger
+from madia.retrieval.ann import DEFAULT_NPROBE
+from madia.retrieval.embeddings import DEFAULT_EMBEDDING, get_embedding
+from madia.retrieval.loaders import (DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE,
+                                     DEFAULT_CHUNK_UNIT, ParallelChunker,
+                                     iter_documents)
+from madia.retrieval.store import VectorStore
+
+logger = get_logger(__name__)
+
+DEFAULT_INDEX_PATH = "~/.madia/docs"
+DEFAULT_TOP_K = 4
+DEFAULT_EMBED_BATCH_SIZE = 256
+# Below this many chunks, exact search is fast enough
+DEFAULT_ANN_MIN_ROWS = 50_000
+# Rebuild the ANN index once this fraction of the rows was added since
+ANN_REBUILD_RATIO = 0.2
+ASK_SYSTEM_PROMPT = (
+    "Answer the question using only the numbered passages below. Cite the "
+    "passages you use as [1], [2]... If they don't contain the answer, say so.\n\n"
+    "{context}"
+)
+
+
+@dataclass
+class IngestStats:
+    """Counters of an ingestion run."""
+
+    documents: int = 0
+    unchanged: int = 0
+    chunks: int = 0
+    embedded: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return (
+            f"Ingested {self.documents} documents ({self.unchanged} unchanged): "
+            f"{self.chunks} chunks, {self.embedded} newly embedded, "
+            f"in {self.seconds:.1f}s"
+        )
+
+
+class DocsIndex:
+    """
+    Local retrieval index over PDFs and text files.
+
+    Documents are chunked in a process pool and embedded in batches as chunks
+    arrive, so ingesting a large corpus uses bounded memory. Unchanged
+    documents are skipped by size and modification time, and chunks already
+    in the index, e.g. from a previous version of an edited document, are not
+    embedded again.
+
+    Args:
+        path (str): The index directory.
+        embedding (Callable[[List[str]], np.ndarray]): The embedding function,
+            see :func:`madia.retrieval.embeddings.get_embedding`.
+        chunk_size (int, optional): The chunks' maximum length.
+        chunk_overlap (int, optional): Length shared by consecutive chunks.
+        chunk_unit (str, optional): ``"characters"`` or ``"tokens"``.
+        workers (int, optional): Chunking processes, defaults to the CPUs.
+        batch_size (int, optional): Chunks per embedding request.
+        ann_min_rows (int, optional): Chunks from which searches use an IVF
+            index, built and kept up to date by :meth:`ingest`.
+        nprobe (int, optional): IVF lists searched per query.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        index = DocsIndex("~/.madia/docs", get_embedding("hashing"))
+        index.ingest("data/WizardLM.pdf")
+        index.search("How are instructions evolved?")
+    """
+
+    def __init__(
+        self,
+        path,
+        embedding,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        chunk_overlap=DEFAULT_CHUNK_OVERLAP,
+        chunk_unit=DEFAULT_CHUNK_UNIT,
+        workers=None,
+        batch_size=DEFAULT_EMBED_BATCH_SIZE,
+        ann_min_rows=DEFAULT_ANN_MIN_ROWS,
+        nprobe=DEFAULT_NPROBE,
+    ):
+        self.embedding = embedding
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunk_unit = chunk_unit
+        self.workers = workers
+        self.batch_size = batch_size
+        self.ann_min_rows = ann_min_rows
+        self.nprobe = nprobe
+        self.store = VectorStore(
+            os.path.expanduser(path), embedding.dim, embedding.name
+        )
+        self.lock = threading.Lock()
+
+    def ingest(self, path):
+        """
+        Add or update the documents at ``path``, a file or a directory.
+
+        Args:
+            path (str): The document, or a directory walked recursively.
+
+        Returns:
+            IngestStats: What was done.
+        """
+        stats = IngestStats()
+        start = time.perf_counter()
+        chunker = ParallelChunker(
+            self.workers, self.chunk_size, self.chunk_overlap, self.chunk_unit
+        )
+        with self.lock, chunker:
+            for document in iter_documents(os.path.expanduser(path)):
+                source = os.path.abspath(document)
+                status = os.stat(source)
+                fingerprint = [status.st_size, status.st_mtime_ns]
+                stats.documents += 1
+                if self.store.fingerprint(source) == fingerprint:
+                    stats.unchanged += 1
+                    continue
+                ids = self._ingest_document(chunker, source, stats)
+                self.store.set_source(source, fingerprint, ids)
+                logger.info("Ingested %s, %d chunks", source, len(ids))
+            self._update_ann()
+        stats.seconds = time.perf_counter() - start
+        return stats
+
+    def _ingest_document(self, chunker, source, stats):
+        ids, pending = [], {}
+        for chunk in chunker.iter_chunks(source):
+            ids.append(chunk.id)
+            stats.chunks += 1
+            if chunk.id not in self.store and chunk.id not in pending:
+                pending[chunk.id] = chunk
+                if len(pending) >= self.batch_size:
+                    stats.embedded += self._embed(pending)
+        stats.embedded += self._embed(pending)
+        return ids
+
+    def _update_ann(self):
+        store = self.store
+        if len(store) < self.ann_min_rows:
+            return
+        if store.ann is None or store.unindexed > ANN_REBUILD_RATIO * store.ann.rows:
+            store.build_ann()
+
+    def _embed(self, pending):
+        chunks = list(pending.values())
+        if chunks:
+            self.store.add(chunks, self.embedding([chunk.text for chunk in chunks]))
+        pending.clear()
+        return len(chunks)
+
+    def search(self, query, k=DEFAULT_TOP_K):
+        """
+        Return the chunks most relevant to ``query``.
+
+        Args:
+            query (str): The question or search terms.
+            k (int, optional): The number of chunks.
+
+        Returns:
+            List[Tuple[float, dict]]: Scores and chunk records, best first.
+        """
+        return self.store.search(self.embedding([query])[0], k, self.nprobe)
+
+    def ask(self, llm, question, k=DEFAULT_TOP_K, callbacks=None):
+        """
+        Answer a question from the most relevant chunks.
+
+        Args:
+            llm (BaseChatModel): The chat model writing the answer.
+            question (str): The question.
+            k (int, optional): The number of chunks given as context.
+            callbacks (List[BaseCallbackHandler], optional): Callbacks of the
+                model call.
+
+        Returns:
+            str: The answer, followed by its numbered sources.
+        """
+        hits = self.search(question, k)
+        if not hits:
+            return "No documents ingested yet, see 'docs ingest'."
+        context = "\n\n".join(
+            f"[{number}] {record['text']}" for number, (_, record) in enumerate(hits, 1)
+        )
+        answer = llm(
+            [
+                SystemMessage(content=ASK_SYSTEM_PROMPT.format(context=context)),
+                HumanMessage(content=question),
+            ],
+            callbacks=callbacks,
+        )
+        return f"{answer.content}\n\n{format_sources(hits)}"
+
+
+def format_sources(hits):
+    """Format search hits as numbered ``source, page`` lines."""
+    return "\n".join(
+        f"[{number}] {os.path.basename(record['source'])}, page {record['page']} "
+        f"({score:.2f})"
+        for number, (score, record) in enumerate(hits, 1)
+    )
+
+
+_docs_index = None
+_docs_index_lock = threading.Lock()
+
+
+def get_docs_index():
+    """Return the index configured by the ``docs_*`` settings, opened once."""
+    global _docs_index  # pylint: disable=global-statement
+    with _docs_index_lock:
+        if _docs_index is None:
+            _docs_index = DocsIndex(
+                settings.get("docs_index_path", DEFAULT_INDEX_PATH),
+                get_embedding(settings.get("docs_embedding", DEFAULT_EMBEDDING)),
+                chunk_size=settings.get("docs_chunk_size", DEFAULT_CHUNK_SIZE),
+                chunk_overlap=settings.get("docs_chunk_overlap", DEFAULT_CHUNK_OVERLAP),
+                chunk_unit=settings.get("docs_chunk_unit", DEFAULT_CHUNK_UNIT),
+                workers=settings.get("docs_ingest_workers", None),
+                batch_size=settings.get(
+                    "docs_embed_batch_size", DEFAULT_EMBED_BATCH_SIZE
+                ),
+                ann_min_rows=settings.get("docs_ann_min_rows", DEFAULT_ANN_MIN_ROWS),
+                nprobe=settings.get("docs_ann_nprobe", DEFAULT_NPROBE),
+            )
+    return _docs_index
+
+
+def ingest_command(path):
+    """``docs ingest <path>``: ingest a document or a directory."""
+    if not path:
+        return "Usage: docs ingest <file or directory>"
+    if not os.path.exists(os.path.expanduser(path)):
+        return f"No such file or directory: {path}"
+    try:
+        return str(get_docs_index().ingest(path))
+    except ValueError as error:
+        return str(error)
+
+
+def search_command(query):
+    """``docs search <query>``: show the most relevant chunks."""
+    hits = get_docs_index().search(query, settings.get("docs_top_k", DEFAULT_TOP_K))
+    if not hits:
+        return "No documents ingested yet, see 'docs ingest'."
+    return "\n\n".join(
+        f"{line}\n{record['text']}"
+        for line, (_, record) in zip(format_sources(hits).splitlines(), hits)
+    )
+
+
+def ask_command(question):
+    """``docs ask <question>``: answer a question from the ingested documents."""
+    from madia.llm.clients import get_chat_client
+    from madia.llm.openai_chat import DEFAULT_OPENAI_MODEL
+    from madia.llm.utils import ShortProgressStringsHandler
+
+    llm = get_chat_client(settings.get("openai_model", DEFAULT_OPENAI_MODEL))
+    return get_docs_index().ask(
+        llm,
+        question,
+        settings.get("docs_top_k", DEFAULT_TOP_K),
+        callbacks=[ShortProgressStringsHandler()],
+    )
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import re
+import zlib
+
+import numpy as np
+
+DEFAULT_EMBEDDING = "hashing"
+WORD_PATTERN = re.compile(r"\w+")
+# Too frequent to tell passages apart, they'd dominate lexical vectors
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that "
+    "the this to was were what when which who why will with".split()
+)
+
+
+class HashingEmbedding:
+    """
+    Offline embedding hashing words and word pairs into a fixed-size vector.
+
+    No model and no network: each unigram and bigram, stop words aside, is
+    hashed with CRC32 to a dimension and a sign, and the counts are
+    L2-normalized, so the dot product of two vectors is their cosine
+    similarity. It's a lexical embedding, good
+    enough to find the passages sharing the question's words.
+
+    Args:
+        dim (int, optional): The vector size.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        embed = HashingEmbedding()
+        vectors = embed(["first chunk", "second chunk"])  # shape (2, 384)
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self._buckets = {}
+
+    def _bucket(self, term):
+        bucket = self._buckets.get(term)
+        if bucket is None:
+            digest = zlib.crc32(term.encode("utf-8"))
+            bucket = self._buckets[term] = (
+                digest % self.dim,
+                1.0 if digest & 0x80000000 else -1.0,
+            )
+        return bucket
+
+    def embed_one(self, text):
+        """Return the embedding of a single text."""
+        words = [
+            word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS
+        ]
+        terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if terms:
+            indexes, signs = zip(*map(self._bucket, terms))
+            vector += np.bincount(indexes, weights=signs, minlength=self.dim)
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector /= norm
+        return vector
+
+    def __call__(self, texts):
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self.embed_one(text) for text in texts])
+
+
+class OpenAIEmbedding:
+    """
+    OpenAI embeddings, through ``langchain``'s ``OpenAIEmbeddings``.
+
+    Args:
+        model (str, optional): The OpenAI embedding model.
+        dim (int, optional): The model's vector size.
+    """
+
+    name = "openai"
+
+    def __init__(self, model="text-embedding-ada-002", dim=1536):
+        # Only needs the OpenAI key once actually used
+        from langchain.embeddings import OpenAIEmbeddings
+
+        self.dim = dim
+        self.client = OpenAIEmbeddings(model=model)
+
+    def __call__(self, texts):
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.asarray(self.client.embed_documents(list(texts)), dtype=np.float32)
+
+
+EMBEDDINGS = {
+    HashingEmbedding.name: HashingEmbedding,
+    OpenAIEmbedding.name: OpenAIEmbedding,
+}
+
+
+def get_embedding(name=DEFAULT_EMBEDDING, **kwargs):
+    """
+    Build an embedding function by name.
+
+    An embedding function is any callable taking a list of texts and returning
+    a ``(len(texts), dim)`` float32 array, with a ``dim`` attribute and a
+    ``name`` identifying it. Register new ones in :data:`EMBEDDINGS`.
+
+    Args:
+        name (str, optional): The embedding name, e.g. ``"hashing"``.
+        **kwargs: Passed to the embedding's constructor.
+
+    Returns:
+        Callable[[List[str]], np.ndarray]: The embedding function.
+
+    Raises:
+        ValueError: If no embedding has that name.
+    """
+    try:
+        factory = EMBEDDINGS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown embedding {name!r}, available: {', '.join(sorted(EMBEDDINGS))}"
+        ) from None
+    return factory(**kwargs)
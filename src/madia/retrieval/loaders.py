@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+
+from madia.utils_string import string_to_md5
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 100
+DEFAULT_CHUNK_UNIT = "characters"
+DEFAULT_PAGES_PER_TASK = 16
+TOKEN_ENCODING = "cl100k_base"
+TEXT_EXTENSIONS = {".txt", ".md", ".rst"}
+PDF_EXTENSIONS = {".pdf"}
+# Pages of text documents are separated by form feeds, as in pdftotext's output
+PAGE_BREAK = "\f"
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """
+    A piece of a document, the unit that is embedded and retrieved.
+
+    Attributes:
+        id (str): MD5 of the text, identical chunks share an id.
+        source (str): Path of the document.
+        page (int): Page number, starting at 1.
+        text (str): The chunk's text.
+    """
+
+    id: str
+    source: str
+    page: int
+    text: str
+
+
+def is_supported(path):
+    """Return whether :func:`iter_pages` can read the file."""
+    extension = os.path.splitext(path)[1].lower()
+    return extension in TEXT_EXTENSIONS or extension in PDF_EXTENSIONS
+
+
+def iter_documents(path):
+    """
+    Yield the supported files at ``path``, a file or a directory.
+
+    Args:
+        path (str): A file or a directory, walked recursively.
+
+    Yields:
+        str: The files' paths, in a stable order.
+
+    Raises:
+        ValueError: If ``path`` is a file :func:`iter_pages` can't read.
+    """
+    if os.path.isfile(path):
+        if not is_supported(path):
+            extensions = ", ".join(sorted(TEXT_EXTENSIONS | PDF_EXTENSIONS))
+            raise ValueError(f"Unsupported document {path}, not one of {extensions}")
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if is_supported(name):
+                yield os.path.join(root, name)
+
+
+@lru_cache(maxsize=1)
+def _pdf_reader(path, mtime_ns):
+    from pypdf import PdfReader
+
+    # Keyed by mtime too, so an edited PDF is parsed again
+    return PdfReader(path)
+
+
+def is_pdf(path):
+    """Return whether the file is read as a PDF."""
+    return os.path.splitext(path)[1].lower() in PDF_EXTENSIONS
+
+
+def count_pages(path):
+    """Return the number of pages of a PDF."""
+    return len(_pdf_reader(path, os.stat(path).st_mtime_ns).pages)
+
+
+def iter_pages(path, start=0, stop=None):
+    """
+    Yield the text of each page of a document, one page in memory at a time.
+
+    Args:
+        path (str): A PDF or text file.
+        start (int, optional): Index of the first PDF page to read.
+        stop (int, optional): Index after the last PDF page to read, all
+            pages by default. Text files are always read whole.
+
+    Yields:
+        Tuple[int, str]: The page number, starting at 1, and its text.
+    """
+    if is_pdf(path):
+        pages = _pdf_reader(path, os.stat(path).st_mtime_ns).pages
+        for index in range(start, len(pages) if stop is None else stop):
+            yield index + 1, pages[index].extract_text() or ""
+        return
+
+    with open(path, encoding="utf-8", errors="replace") as file:
+        number, buffer = 1, []
+        for line in file:
+            # A line may hold several page breaks
+            *ended, line = line.split(PAGE_BREAK)
+            for end in ended:
+                buffer.append(end)
+                yield number, "".join(buffer)
+                number, buffer = number + 1, []
+            buffer.append(line)
+        if any(buffer):
+            yield number, "".join(buffer)
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    import tiktoken
+
+    return tiktoken.get_encoding(TOKEN_ENCODING)
+
+
+def token_length(text):
+    """Return the number of ``cl100k_base`` tokens of ``text``."""
+    return len(_encoding().encode(text))
+
+
+CHUNK_UNITS = {"characters": len, "tokens": token_length}
+
+
+def split_text(
+    text,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    chunk_overlap=DEFAULT_CHUNK_OVERLAP,
+    length_function=len,
+):
+    """
+    Split text into chunks of about ``chunk_size``, on word bounds.
+
+    Consecutive chunks share up to ``chunk_overlap`` of words, so a sentence
+    cut in two is still found whole in one of them. Sizes are measured by
+    ``length_function``, characters by default: pass :func:`token_length` to
+    size chunks in tokens, as the embedding and chat models count them.
+
+    Args:
+        text (str): The text to split.
+        chunk_size (int, optional): The maximum chunk length, unless a single
+            word is longer.
+        chunk_overlap (int, optional): Length repeated from the previous chunk.
+        length_function (Callable[[str], int], optional): Measures a word
+            with its leading space.
+
+    Returns:
+        List[str]: The chunks.
+    """
+    costs = {}
+    chunks, words, length = [], [], 0
+    for word in text.split():
+        cost = costs.get(word)
+        if cost is None:
+            cost = costs[word] = length_function(" " + word)
+        if words and length + cost > chunk_size:
+            chunks.append(" ".join(words))
+            # Keep the trailing words fitting in the overlap
+            kept, kept_length = [], 0
+            for previous in reversed(words):
+                if kept_length + costs[previous] > chunk_overlap:
+                    break
+                kept.append(previous)
+                kept_length += costs[previous]
+            words, length = kept[::-1], kept_length
+        words.append(word)
+        length += cost
+    if words:
+        chunks.append(" ".join(words))
+    return chunks
+
+
+def iter_chunks(
+    path,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    chunk_overlap=DEFAULT_CHUNK_OVERLAP,
+    unit=DEFAULT_CHUNK_UNIT,
+    start=0,
+    stop=None,
+):
+    """
+    Yield the chunks of a document, page by page.
+
+    Args:
+        path (str): A PDF or text file.
+        chunk_size (int, optional): See :func:`split_text`.
+        chunk_overlap (int, optional): See :func:`split_text`.
+        unit (str, optional): How chunks are measured, a :data:`CHUNK_UNITS`
+            key.
+        start (int, optional): See :func:`iter_pages`.
+        stop (int, optional): See :func:`iter_pages`.
+
+    Yields:
+        Chunk: The document's chunks.
+    """
+    length_function = CHUNK_UNITS[unit]
+    for page, text in iter_pages(path, start, stop):
+        for chunk in split_text(text, chunk_size, chunk_overlap, length_function):
+            yield Chunk(string_to_md5(chunk), path, page, chunk)
+
+
+def _chunk_pages(path, start, stop, chunk_size, chunk_overlap, unit):
+    # Runs in a worker process, which keeps the PDF parsed between tasks
+    return list(iter_chunks(path, chunk_size, chunk_overlap, unit, start, stop))
+
+
+class ParallelChunker:
+    """
+    Chunk PDFs in a process pool, yielding chunks as soon as they are ready.
+
+    Pages are extracted by ranges of ``pages_per_task`` in worker processes,
+    as pypdf's text extraction is pure Python and holds the GIL. Chunks are
+    yielded in page order, and at most ``max_pending`` ranges are extracted
+    ahead of the consumer, which caps the memory held by unconsumed chunks
+    however large the PDF. Text files, cheap to read, are chunked in-process.
+
+    Args:
+        workers (int, optional): Worker processes, defaults to the CPUs.
+        chunk_size (int, optional): See :func:`split_text`.
+        chunk_overlap (int, optional): See :func:`split_text`.
+        unit (str, optional): See :func:`iter_chunks`.
+        pages_per_task (int, optional): Pages extracted per task.
+        max_pending (int, optional): Tasks in flight, twice the workers by
+            default.
+
+    Usage Example:
+
+    .. code-block:: python
+
+        with ParallelChunker(workers=4) as chunker:
+            for chunk in chunker.iter_chunks("data/WizardLM.pdf"):
+                print(chunk.page, chunk.text[:40])
+    """
+
+    def __init__(
+        self,
+        workers=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        chunk_overlap=DEFAULT_CHUNK_OVERLAP,
+        unit=DEFAULT_CHUNK_UNIT,
+        pages_per_task=DEFAULT_PAGES_PER_TASK,
+        max_pending=None,
+    ):
+        if unit not in CHUNK_UNITS:
+            raise ValueError(
+                f"Unknown chunk unit {unit!r}, available: {', '.join(CHUNK_UNITS)}"
+            )
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.unit = unit
+        self.pages_per_task = pages_per_task
+        self.max_pending = max_pending or 2 * self.workers
+        self._pool = None
+        self._pending = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._pool is not None:
+            # shutdown(cancel_futures=True) needs Python 3.9
+            for future in list(self._pending):
+                future.cancel()
+            self._pool.shutdown()
+            self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            # Spawned, forking a process with threads (e.g. the daemon) is unsafe
+            self._pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def iter_chunks(self, path):
+        """
+        Yield the chunks of a document, in order.
+
+        Args:
+            path (str): A PDF or text file.
+
+        Yields:
+            Chunk: The document's chunks.
+        """
+        options = (self.chunk_size, self.chunk_overlap, self.unit)
+        pages = count_pages(path) if is_pdf(path) else 0
+        if self.workers == 1 or pages <= self.pages_per_task:
+            yield from iter_chunks(path, *options)
+            return
+
+        pending = deque()
+        try:
+            for start in range(0, pages, self.pages_per_task):
+                stop = min(start + self.pages_per_task, pages)
+                future = self.pool.submit(_chunk_pages, path, start, stop, *options)
+                pending.append(future)
+                self._pending.add(future)
+                future.add_done_callback(self._pending.discard)
+                if len(pending) >= self.max_pending:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            # The caller stopped early, don't chunk pages nobody will read
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import json
+import os
+
+import numpy as np
+
+from madia.logger import get_logger
+from madia.retrieval.ann import DEFAULT_NPROBE, IVFIndex
+
+logger = get_logger(__name__)
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.f32"
+CHUNKS_FILE = "chunks.jsonl"
+SOURCES_FILE = "sources.json"
+ANN_FILE = "ivf.npz"
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+class VectorStore:
+    """
+    Append-only vector store persisted in a directory.
+
+    Vectors are appended as raw float32 rows to ``vectors.f32`` and read back
+    through a ``numpy.memmap``, so the OS page cache holds the vectors, not
+    the Python heap. Only the vectors are memory-mapped: the chunks live in
+    ``chunks.jsonl``, one line per vector row, parsed into memory with their
+    text when the index is opened, and ``sources.json`` maps each ingested
+    document to its chunk ids.
+
+    A chunk's id is the hash of its text, so a chunk is stored once however
+    many documents contain it. Rows of chunks no longer in any document are
+    kept on disk but never returned.
+
+    Searches are exact until :meth:`build_ann` builds an
+    :class:`madia.retrieval.ann.IVFIndex`, saved as ``ivf.npz``.
+
+    Args:
+        path (str): The index directory, created if missing.
+        dim (int): The vector size.
+        embedding (str): Name of the embedding that produced the vectors.
+
+    Raises:
+        ValueError: If the index was built with another embedding or size.
+    """
+
+    def __init__(self, path, dim, embedding):
+        self.path = path
+        self.dim = dim
+        self.embedding = embedding
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as file:
+                meta = json.load(file)
+            if (meta["embedding"], meta["dim"]) != (embedding, dim):
+                raise ValueError(
+                    f"The index at {path} was built with the {meta['embedding']} "
+                    f"embedding ({meta['dim']} dims), not {embedding} ({dim} dims)"
+                )
+        else:
+            _write_json(meta_path, {"embedding": embedding, "dim": dim})
+
+        self.records = self._load_records()
+        self.rows = {record["id"]: row for row, record in enumerate(self.records)}
+        self.sources = self._load_sources()
+        self._vectors = None
+        self._live = None
+        self.ann = None
+        if os.path.exists(self._file(ANN_FILE)):
+            ann = IVFIndex.load(self._file(ANN_FILE))
+            # Stale if the vectors it indexes were truncated away
+            if ann.rows <= len(self.records):
+                self.ann = ann
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load_records(self):
+        records = []
+        if os.path.exists(self._file(CHUNKS_FILE)):
+            with open(self._file(CHUNKS_FILE), encoding="utf-8") as file:
+                for line in file:
+                    if not line.endswith("\n"):
+                        break  # torn write
+                    records.append(json.loads(line))
+
+        # An interrupted ingestion may leave more rows in one file than the other
+        row_size = self.dim * 4
+        vectors_size = (
+            os.path.getsize(self._file(VECTORS_FILE))
+            if os.path.exists(self._file(VECTORS_FILE))
+            else 0
+        )
+        rows = min(len(records), vectors_size // row_size)
+        if rows != len(records) or rows * row_size != vectors_size:
+            logger.warning("Truncating the index at %s to %d rows", self.path, rows)
+            records = records[:rows]
+            with open(self._file(VECTORS_FILE), "ab") as file:
+                file.truncate(rows * row_size)
+            with open(self._file(CHUNKS_FILE), "w", encoding="utf-8") as file:
+                file.writelines(json.dumps(record) + "\n" for record in records)
+        return records
+
+    def _load_sources(self):
+        if not os.path.exists(self._file(SOURCES_FILE)):
+            return {}
+        with open(self._file(SOURCES_FILE), encoding="utf-8") as file:
+            return json.load(file)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.rows
+
+    @property
+    def vectors(self):
+        """The ``(len(self), dim)`` memory-mapped vectors."""
+        if self._vectors is None or len(self._vectors) != len(self.records):
+            if self.records:
+                self._vectors = np.memmap(
+                    self._file(VECTORS_FILE),
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(len(self.records), self.dim),
+                )
+            else:
+                self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        return self._vectors
+
+    @property
+    def live(self):
+        """Boolean mask of the rows belonging to at least one document."""
+        if self._live is None or len(self._live) != len(self.records):
+            live = np.zeros(len(self.records), dtype=bool)
+            for source in self.sources.values():
+                live[[self.rows[chunk_id] for chunk_id in source["ids"]]] = True
+            self._live = live
+        return self._live
+
+    def add(self, chunks, vectors):
+        """
+        Append chunks and their vectors.
+
+        Args:
+            chunks (List[Chunk]): New chunks, whose ids aren't stored yet.
+            vectors (np.ndarray): Their ``(len(chunks), dim)`` vectors.
+        """
+        if not chunks:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(chunks), self.dim):
+            raise ValueError(
+                f"Expected vectors of shape {(len(chunks), self.dim)}, "
+                f"got {vectors.shape}"
+            )
+        # Vectors first: a torn write leaves extra vectors, trimmed on load
+        with open(self._file(VECTORS_FILE), "ab") as file:
+            file.write(vectors.tobytes())
+        with open(self._file(CHUNKS_FILE), "a", encoding="utf-8") as file:
+            for chunk in chunks:
+                record = {
+                    "id": chunk.id,
+                    "source": chunk.source,
+                    "page": chunk.page,
+                    "text": chunk.text,
+                }
+                self.rows[chunk.id] = len(self.records)
+                self.records.append(record)
+                file.write(json.dumps(record) + "\n")
+
+    def fingerprint(self, source):
+        """Return the stored ``[size, mtime_ns]`` of a document, or None."""
+        entry = self.sources.get(source)
+        return entry and entry["fingerprint"]
+
+    def set_source(self, source, fingerprint, chunk_ids):
+        """
+        Record the chunks of a document, replacing its previous version.
+
+        Args:
+            source (str): The document's path.
+            fingerprint (List[int]): Its ``[size, mtime_ns]``.
+            chunk_ids (List[str]): The ids of its chunks, all stored.
+        """
+        self.sources[source] = {
+            "fingerprint": fingerprint,
+            "ids": list(dict.fromkeys(chunk_ids)),
+        }
+        self._live = None
+        _write_json(self._file(SOURCES_FILE), self.sources)
+
+    def build_ann(self, nlist=None, workers=None):
+        """
+        Build and save the approximate nearest neighbours index.
+
+        Args:
+            nlist (int, optional): The number of IVF lists.
+            workers (int, optional): Threads, defaults to the number of CPUs.
+        """
+        self.ann = IVFIndex.build(self.vectors, nlist, workers)
+        self.ann.save(self._file(ANN_FILE))
+
+    @property
+    def unindexed(self):
+        """The number of rows added since the ANN index was built."""
+        return len(self.records) - (self.ann.rows if self.ann else 0)
+
+    def search(self, query, k=4, nprobe=DEFAULT_NPROBE, exact=False):
+        """
+        Return the ``k`` chunks most similar to the query vector.
+
+        Args:
+            query (np.ndarray): The ``(dim,)`` query vector.
+            k (int, optional): The number of chunks to return.
+            nprobe (int, optional): IVF lists searched, when there's an index.
+            exact (bool, optional): Compare with every vector, even if there's
+                an ANN index.
+
+        Returns:
+            List[Tuple[float, dict]]: The scores and chunk records, best first.
+        """
+        if not self.records:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        if self.ann is None or exact:
+            rows = None
+            scores = self.vectors @ query
+            scores[~self.live] = -np.inf
+        else:
+            rows = self.ann.candidates(query, nprobe, len(self.records))
+            scores = self.vectors[rows] @ query
+            scores[~self.live[rows]] = -np.inf
+
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (float(scores[i]), self.records[i if rows is None else rows[i]])
+            for i in top
+        ]
@@ -0,0 +1,135 @@
+"""Tests for the perceptual-hash caption cache."""
+from __future__ import annotations
+
+import random
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from madia.llm import caption_cache
+from madia.llm.blip_caption import caption_image_url
+from madia.llm.caption_cache import (CaptionCache, ImageKey, caption_params,
+                                     dhash)
+from madia.llm.fakes import fake_blip
+
+PARAMS = caption_params("blip", max_new_tokens=100)
+
+
+def picture(seed, size=256):
+    """A smooth random picture, as photos are at the hash's scale."""
+    rng = random.Random(seed)
+    small = Image.new("RGB", (6, 6))
+    small.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(36)])
+    return small.resize((size, size), Image.BICUBIC)
+
+
+def encode(image, format="JPEG", **kwargs):
+    buffer = BytesIO()
+    image.save(buffer, format, **kwargs)
+    return buffer.getvalue()
+
+
+def test_resized_and_reencoded_copies_hit():
+    cache = CaptionCache(":memory:")
+    original = picture(1)
+    cache.put(PARAMS, encode(original, quality=95), "a picture")
+
+    for copy in (
+        encode(original, quality=95),
+        encode(original.resize((120, 120)), quality=60),
+        encode(original.resize((400, 400)), "PNG"),
+    ):
+        assert cache.get(PARAMS, copy) == "a picture"
+    assert cache.get(PARAMS, encode(picture(2))) is None
+    assert (
+        cache.get(caption_params("blip", max_new_tokens=20), encode(original)) is None
+    )
+    assert (cache.hits, cache.misses) == (3, 2)
+
+
+def test_images_are_hashed_once(monkeypatch):
+    hashed = []
+    monkeypatch.setattr(
+        caption_cache, "dhash", lambda image: hashed.append(image) or dhash(image)
+    )
+    cache = CaptionCache(":memory:")
+    original, copy = encode(picture(1)), encode(picture(1).resize((120, 120)))
+
+    key = ImageKey(original)
+    assert cache.get(PARAMS, key) is None
+    cache.put(PARAMS, key, "a picture")
+    assert len(hashed) == 1
+
+    # Found by its hash, then by its bytes
+    assert cache.get(PARAMS, copy) == "a picture"
+    assert cache.get(PARAMS, copy) == "a picture"
+    assert len(hashed) == 2
+
+
+def test_flat_pictures_only_hit_by_their_bytes():
+    cache = CaptionCache(":memory:")
+    cache.put(PARAMS, encode(Image.new("RGB", (64, 64), "red")), "red")
+
+    assert dhash(Image.open(BytesIO(encode(Image.new("RGB", (64, 64), "blue"))))) == 0
+    assert cache.get(PARAMS, encode(Image.new("RGB", (64, 64), "blue"))) is None
+    assert cache.get(PARAMS, encode(Image.new("RGB", (64, 64), "red"))) == "red"
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    cache = CaptionCache(str(tmp_path / "captions.sqlite3"), max_entries=2)
+    images = [encode(picture(seed)) for seed in range(3)]
+    cache.put(PARAMS, images[0], "zero")
+    cache.put(PARAMS, images[1], "one")
+    cache.get(PARAMS, images[0])
+    cache.put(PARAMS, images[2], "two")
+    cache.close()
+
+    cache = CaptionCache(str(tmp_path / "captions.sqlite3"), max_entries=2)
+    assert len(cache) == 2
+    assert cache.get(PARAMS, images[1]) is None
+    assert cache.get(PARAMS, images[0]) == "zero"
+
+
+def test_caption_image_url_uses_the_cache(tmp_path):
+    path, resized = tmp_path / "photo.jpg", tmp_path / "thumbnail.png"
+    picture(3).save(path, quality=90)
+    picture(3).resize((100, 100)).save(resized)
+    blip = fake_blip(["a caption"])
+    cache = CaptionCache(":memory:")
+
+    assert caption_image_url(str(path), blip=blip, cache=cache) == "a caption"
+    assert caption_image_url(str(resized), blip=blip, cache=cache) == "a caption"
+    assert blip[1].calls == 1
+
+
+def test_hashes_at_the_max_distance_hit_across_bands(monkeypatch):
+    original = 0x0F0F_0F0F_0F0F_0F0F
+    # One bit flipped in each of the first 4 bands
+    hashes = {
+        b"original": original,
+        b"copy": original ^ (1 | 1 << 13 | 1 << 26 | 1 << 39),
+        b"other": original ^ (1 | 1 << 13 | 1 << 26 | 1 << 39 | 1 << 52),
+    }
+    monkeypatch.setattr(caption_cache, "open_image", lambda data: data)
+    monkeypatch.setattr(caption_cache, "dhash", hashes.get)
+    cache = CaptionCache(":memory:")
+    cache.put(PARAMS, b"original", "a picture")
+
+    assert cache.get(PARAMS, b"copy") == "a picture"
+    assert cache.get(PARAMS, b"other") is None
+    with pytest.raises(ValueError):
+        CaptionCache(":memory:", max_distance=caption_cache.BANDS)
+
+
+def test_bands_of_an_older_layout_are_rebuilt(tmp_path):
+    path = str(tmp_path / "captions.sqlite3")
+    cache = CaptionCache(path)
+    cache.put(PARAMS, encode(picture(1)), "a picture")
+    with cache.db:
+        cache.db.execute("UPDATE bands SET value = -1")
+        cache.db.execute("PRAGMA user_version = 0")
+    cache.close()
+
+    copy = encode(picture(1).resize((120, 120)), quality=60)
+    assert CaptionCache(path).get(PARAMS, copy) == "a picture"
@@ -0,0 +1,84 @@
+"""Tests for the compaction of search results fed back to agents."""
+from __future__ import annotations
+
+from madia.llm.compaction import (NO_RESULTS, compact, compacted_search,
+                                  count_tokens, deduplicate, rank,
+                                  serper_snippets)
+from madia.llm.fakes import FakeSerper
+from madia.metrics import metrics
+
+
+def test_serper_snippets_as_the_wrapper():
+    results = {
+        "knowledgeGraph": {"title": "Madia", "type": "Software"},
+        "organic": [
+            {"snippet": "Madia is a REPL.", "attributes": {"License": "MIT"}},
+            {"snippet": "Past k."},
+        ],
+    }
+
+    assert serper_snippets(results, k=1) == [
+        "Madia: Software.",
+        "Madia is a REPL.",
+        "License: MIT.",
+    ]
+    # The answer box is the whole answer
+    assert serper_snippets({**results, "answerBox": {"answer": "42"}}) == ["42"]
+    assert serper_snippets({}) == [NO_RESULTS]
+
+
+def test_deduplicate_drops_near_copies():
+    snippets = [
+        "Madia is a REPL for language models.",
+        "Madia is a REPL for language models ...",
+        "  Madia is a  REPL, for language models. ",
+        "It runs in a terminal.",
+    ]
+
+    assert deduplicate(snippets) == [
+        "Madia is a REPL for language models.",
+        "It runs in a terminal.",
+    ]
+
+
+def test_rank_by_overlap_with_the_question_keeps_ties_in_order():
+    snippets = ["Weather is fine.", "Python was released in 1991.", "Other news."]
+
+    assert rank(snippets, "When was Python released?") == [
+        "Python was released in 1991.",
+        "Weather is fine.",
+        "Other news.",
+    ]
+
+
+def test_compact_fits_the_budget():
+    snippets = [f"snippet {index} about python " + "word " * 30 for index in range(10)]
+
+    output = compact(snippets, "python", budget=50)
+
+    assert count_tokens(output) <= 50
+    assert output.startswith("snippet 0 about python")
+    assert output.endswith("...")
+    assert compact([], "python") == NO_RESULTS
+
+
+def test_compacted_search_ranks_by_question_and_query():
+    serper = FakeSerper(
+        ["Unrelated text.", "Python was released in 1991.", "Other text."], k=6
+    )
+    run = compacted_search(serper, "When was Python released?", budget=10)
+
+    assert run("python").splitlines()[0] == "Python was released in 1991."
+    assert serper.queries == ["python"]
+
+
+def test_short_results_are_returned_as_the_wrapper(monkeypatch):
+    counted = []
+    monkeypatch.setattr(
+        metrics, "increment", lambda *args, **kwargs: counted.append(args)
+    )
+    serper = FakeSerper(["A long snippet " + "word " * 100] * 3, k=10, answer="1991")
+    run = compacted_search(serper, "When was Python released?", budget=50)
+
+    assert run("python") == serper.run("python") == "1991"
+    assert counted == [("tool_tokens", 1, "raw"), ("tool_tokens", 1, "compacted")]
@@ -0,0 +1,57 @@
+"""Tests for the settings hot reload in madia.config."""
+from __future__ import annotations
+
+import pytest
+
+from madia import config
+
+
+@pytest.fixture
+def settings_file(tmp_path, monkeypatch):
+    path = tmp_path / "config.yaml"
+    path.write_text("dev:\n  openai_model: gpt-4\n")
+    monkeypatch.setattr(config, "ABS_SETTINGS_PATH", str(path))
+    # The app's subscribers, e.g. the logger's, aren't told of the test's reloads
+    monkeypatch.setattr(config, "_subscribers", [])
+    # Restored on teardown, instead of reloading the developer's real config
+    monkeypatch.setattr(config, "_snapshot", config.settings_snapshot())
+    before = config._normalize(config.settings.as_dict())
+    yield path
+    after = config._normalize(config.settings.as_dict())
+    for key in after.keys() - before.keys():
+        config.settings.unset(key)
+    for key, value in before.items():
+        if after.get(key) != value:
+            config.settings.set(key, value)
+
+
+def test_reload_settings_notifies_subscribers(settings_file):
+    calls = []
+    unsubscribe = config.subscribe(
+        lambda changed, snapshot: calls.append((changed, snapshot["openai_model"])),
+        keys=["openai_model"],
+    )
+
+    changed = config.reload_settings()
+
+    assert "openai_model" in changed
+    assert calls == [(changed, "gpt-4")]
+    assert config.settings.get("openai_model") == "gpt-4"
+    # Defaults are kept for keys missing from the file
+    assert config.settings_snapshot()["log_path"] == config.DEFAULT_SETTINGS["log_path"]
+
+    # Nothing changed on disk, so nobody is notified again
+    assert not config.reload_settings()
+    unsubscribe()
+    settings_file.write_text("dev:\n  openai_model: gpt-3.5-turbo\n")
+    config.reload_settings()
+    assert len(calls) == 1
+
+
+def test_reload_settings_keeps_snapshot_on_parse_error(settings_file):
+    config.reload_settings()
+    snapshot = config.settings_snapshot()
+    settings_file.write_text("dev: [unclosed\n")
+
+    assert not config.reload_settings()
+    assert config.settings_snapshot() is snapshot
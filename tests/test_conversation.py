@@ -0,0 +1,81 @@
+"""Tests for the conversation memories."""
+from __future__ import annotations
+
+from langchain.schema import HumanMessage, SystemMessage
+
+from madia.llm.conversation import RollingSummaryMemory, summary_cache
+from madia.llm.fakes import FakeChatModel
+
+
+def make_memory(summarizer, max_token_limit=40):
+    return RollingSummaryMemory(
+        llm=FakeChatModel(),
+        summary_llm=summarizer,
+        return_messages=True,
+        max_token_limit=max_token_limit,
+    )
+
+
+def chat(memory, turns, prefix="turn"):
+    for i in range(turns):
+        memory.save_context(
+            {"question": f"{prefix} {i} question words"},
+            {"text": f"{prefix} {i} answer words"},
+        )
+        # One turn at a time, so each summary folds the same messages
+        memory.wait()
+
+
+def test_evicted_turns_are_summarized():
+    summarizer = FakeChatModel(responses=["the gist so far"])
+    memory = make_memory(summarizer)
+    chat(memory, 20)
+
+    history = memory.load_memory_variables({})["chat_history"]
+    assert history[0] == SystemMessage(content="Conversation summary: the gist so far")
+    # 7 tokens per message with the fake model's counting
+    assert len(history) - 1 == 40 // 7
+    assert history[-1].content == "turn 19 answer words"
+    assert 1 <= summarizer.calls <= 20
+
+
+class FailingOnceChatModel(FakeChatModel):
+    prompts: list = []
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages[-1].content)
+        if len(self.prompts) == 1:
+            raise ConnectionError("API unavailable")
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+def test_turns_are_summarized_after_a_failed_summary():
+    summarizer = FailingOnceChatModel(responses=["the gist after a retry"])
+    memory = make_memory(summarizer)
+    chat(memory, 5, prefix="retried")
+    assert len(summarizer.prompts) >= 2
+
+    # The turns whose summary failed are in the next one
+    assert "retried 0 question words" in summarizer.prompts[0]
+    assert "retried 0 question words" in summarizer.prompts[1]
+    assert memory.summary == "the gist after a retry"
+
+
+def test_replayed_conversation_reuses_cached_summaries():
+    summarizer = FakeChatModel(responses=["cached gist"])
+    chat(make_memory(summarizer), 10, prefix="replayed")
+    calls, hits = summarizer.calls, summary_cache.hits
+
+    replay = make_memory(summarizer)
+    chat(replay, 10, prefix="replayed")
+    assert replay.summary == "cached gist"
+    assert summarizer.calls == calls
+    assert summary_cache.hits > hits
+
+
+def test_replaced_messages_are_recounted():
+    memory = make_memory(FakeChatModel(), max_token_limit=10)
+    memory.chat_memory.messages = [HumanMessage(content="a b c d e f g h")] * 2
+    memory.save_context({"question": "new"}, {"text": "answer"})
+    memory.wait()
+    assert [m.content for m in memory.chat_memory.messages] == ["new", "answer"]
@@ -0,0 +1,64 @@
+"""Tests for the ``madia serve`` daemon and its thin client."""
+from __future__ import annotations
+
+import os
+import stat
+import threading
+
+import pytest
+
+from madia.daemon import MadiaDaemon, forward
+from madia.repl.base_repl import BaseRepl
+
+TREE = {
+    "hello": {"cmd": lambda x: f"Hello {x}!"},
+    "boom": {"cmd": lambda x: 1 / 0},
+    "chat": {"cmd": lambda x: "never run here", "interactive": True},
+    "width": {"cmd": lambda x: f"COLUMNS={os.environ.get('COLUMNS')}"},
+}
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    path = str(tmp_path / "madia.sock")
+    server = MadiaDaemon(path, BaseRepl(TREE, default_fn=print))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+def test_forward_streams_output(daemon, capsys):
+    assert forward(["hello", "world"], daemon) == 0
+    assert "Hello world!" in capsys.readouterr().out
+
+
+def test_forward_reports_failures(daemon, capsys):
+    assert forward(["boom"], daemon) == 1
+    assert "ZeroDivisionError" in capsys.readouterr().out
+
+
+def test_interactive_commands_run_locally(daemon, capsys):
+    assert forward(["chat"], daemon) is None
+    # Quoted, as BaseRepl.execute_command would split it
+    assert forward(['"chat"', "hi"], daemon) is None
+    assert capsys.readouterr().out == ""
+
+
+def test_client_width_is_restored_after_the_command(daemon, monkeypatch, capsys):
+    monkeypatch.setenv("COLUMNS", "100")
+    monkeypatch.setattr("shutil.get_terminal_size", lambda: os.terminal_size((42, 9)))
+
+    assert forward(["width"], daemon) == 0
+    assert "COLUMNS=42" in capsys.readouterr().out
+    assert os.environ["COLUMNS"] == "100"
+
+
+def test_no_daemon(tmp_path):
+    assert forward(["hello"], str(tmp_path / "missing.sock")) is None
+    assert forward(["--ping"], str(tmp_path / "missing.sock")) is None
+
+
+def test_socket_is_owner_only(daemon):
+    assert stat.S_IMODE(os.stat(daemon).st_mode) == 0o600
@@ -0,0 +1,53 @@
+"""Tests for the offline fakes of the LLM, search and image models."""
+from __future__ import annotations
+
+from contextlib import redirect_stdout
+from io import StringIO
+
+from PIL import Image
+
+from madia.llm.blip_caption import caption_image_url
+from madia.llm.fakes import FakeChatModel, FakeSerper, fake_blip
+from madia.llm.openai_search import BufferedSearchWindowMessage
+
+
+def test_fake_chat_model_cycles_through_a_script():
+    llm = FakeChatModel(responses=["first", "second"], cycle=True)
+    assert [llm.predict("same prompt") for _ in range(3)] == [
+        "first",
+        "second",
+        "first",
+    ]
+
+
+def test_fake_serper_is_deterministic():
+    search = FakeSerper(["one", "two", "three"])
+    assert search.run("query") == search.run("query")
+    assert search.results("query")["organic"][0]["title"] == "query"
+    assert search.queries == ["query"] * 3
+
+
+def test_fake_blip_captions_local_images(tmp_path):
+    path = tmp_path / "image.png"
+    Image.new("RGB", (32, 32), "red").save(path)
+    blip = fake_blip(["a red square", "a blue square"])
+    caption = caption_image_url(str(path), blip=blip)
+    assert caption in {"a red square", "a blue square"}
+    assert caption_image_url(str(path), blip=blip) == caption
+    assert blip[1].calls == 2
+
+
+def test_search_agent_runs_offline(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    serper = FakeSerper(["Madia is a REPL."])
+    search = BufferedSearchWindowMessage(search=serper)
+    search.llm = FakeChatModel(
+        cycle=True,
+        responses=[
+            "I should search.\nAction: Intermediate Answer\nAction Input: madia",
+            "I now know the final answer.\nFinal Answer: Madia is a REPL.",
+        ],
+    )
+    with redirect_stdout(StringIO()):
+        assert search.get_response("What is madia?") == "Madia is a REPL."
+    assert serper.queries == ["madia"]
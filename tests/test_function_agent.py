@@ -0,0 +1,102 @@
+"""Tests for the function-calling search agent."""
+from __future__ import annotations
+
+import pytest
+from langchain.schema import FunctionMessage
+
+from madia.llm import openai_search
+from madia.llm.fakes import FakeChatModel, FakeSerper
+from madia.llm.function_agent import FunctionCallingAgent, FunctionTool
+from madia.llm.openai_search import (DEFAULT_SEARCH_AGENT,
+                                     BufferedSearchWindowMessage)
+
+
+def search_call(*queries):
+    return {
+        "name": "tool_calls",
+        "arguments": {
+            "calls": [
+                {"name": "search", "arguments": {"query": query}} for query in queries
+            ]
+        },
+    }
+
+
+def search_tool(queries):
+    def search(query):
+        queries.append(query)
+        return f"result of {query}"
+
+    return FunctionTool(
+        "search",
+        "Search the web",
+        {"type": "object", "properties": {"query": {"type": "string"}}},
+        search,
+    )
+
+
+def test_several_tool_calls_in_one_turn():
+    queries = []
+    llm = FakeChatModel(cycle=True, responses=[search_call("a", "b"), "Both found."])
+    agent = FunctionCallingAgent(llm, [search_tool(queries)])
+
+    assert agent.run("Compare a and b") == "Both found."
+    assert sorted(queries) == ["a", "b"]
+    assert agent.model_calls == 2
+
+
+def test_bad_calls_are_answered_with_the_error():
+    llm = FakeChatModel(
+        cycle=True,
+        responses=[
+            {"name": "tool_calls", "arguments": "{not json"},
+            {"name": "tool_calls", "arguments": {"calls": [{"name": "nope"}]}},
+            "Gave up.",
+        ],
+    )
+    agent = FunctionCallingAgent(llm, [search_tool([])])
+    steps = []
+    original = agent._call_tools
+
+    def record(function_call):
+        results = original(function_call)
+        steps.extend(results)
+        return results
+
+    agent._call_tools = record
+
+    assert agent.run("question") == "Gave up."
+    assert all(isinstance(step, FunctionMessage) for step in steps)
+    assert steps[0].content.startswith("Error: JSONDecodeError")
+    assert "Unknown tool 'nope'" in steps[1].content
+
+
+def test_stops_after_max_turns():
+    llm = FakeChatModel(
+        cycle=True, responses=[search_call("again")] * 3 + ["Final answer."]
+    )
+    agent = FunctionCallingAgent(llm, [search_tool([])], max_turns=3)
+
+    assert agent.run("question") == "Final answer."
+    assert agent.model_calls == 4
+
+
+def test_search_with_functions(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    serper = FakeSerper(["Madia is a REPL."])
+    search = BufferedSearchWindowMessage(search=serper, agent="functions")
+    search.llm = FakeChatModel(
+        cycle=True, responses=[search_call("madia"), "Madia is a REPL."]
+    )
+
+    assert search.get_response("What is madia?") == "Madia is a REPL."
+    assert serper.queries == ["madia"]
+
+
+def test_unknown_search_agent(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(openai_search.settings, "get", {"search_agent": "typo"}.get)
+
+    assert BufferedSearchWindowMessage().agent == DEFAULT_SEARCH_AGENT
+    with pytest.raises(ValueError):
+        BufferedSearchWindowMessage(agent="typo")
@@ -0,0 +1,108 @@
+"""Tests for the server-side Gradio conversation state."""
+from __future__ import annotations
+
+from madia.gradio import sessions as sessions_module
+from madia.gradio.sessions import SessionStore
+from madia.llm.fakes import FakeChatModel
+
+
+def test_session_window_is_token_bounded():
+    llm = FakeChatModel(responses=["one two three"])
+    sessions = SessionStore(llm, max_tokens=20)
+    session = sessions.get("abc")
+
+    for turn in range(10):
+        sessions.record(session, f"question number {turn}", "one two three")
+
+    assert sessions.get("abc") is session
+    assert session.window.tokens <= 20
+    assert len(session.display) == 10
+    prompt = session.prompt_for("last question")
+    assert prompt[-1].content == "last question"
+    assert prompt[-2].content == "one two three"
+
+
+def test_session_summary_and_eviction():
+    llm = FakeChatModel(responses=["the user asked about numbers"])
+    sessions = SessionStore(llm, max_tokens=10, summarize=True, idle_timeout=0)
+    session = sessions.get("abc")
+
+    for turn in range(3):
+        sessions.record(session, f"question number {turn}", "an answer")
+    sessions._summarizer.shutdown(wait=True)  # pylint: disable=protected-access
+
+    assert session.summary == "the user asked about numbers"
+    assert "the user asked about numbers" in session.prompt_for("hi")[0].content
+
+    sessions.SWEEP_INTERVAL = 0
+    sessions.get("other")
+    assert len(sessions) == 1
+
+
+def test_only_idle_sessions_are_evicted(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(sessions_module.time, "monotonic", lambda: clock[0])
+    sessions = SessionStore(FakeChatModel(), idle_timeout=600)
+    idle, active = sessions.get("idle"), sessions.get("active")
+
+    clock[0] += 500
+    active.prompt_for("still here")
+    clock[0] += 200
+    # Not swept before the interval, even past the timeout
+    sessions.SWEEP_INTERVAL = 3600
+    assert sessions.get("idle") is idle
+
+    sessions.SWEEP_INTERVAL = 60
+    clock[0] += 1
+    assert sessions.get("active") is active
+    assert len(sessions) == 1
+    assert sessions.get("idle") is not idle
+
+
+def test_window_evicts_the_oldest_turns_first():
+    # 5 tokens per message with the fake model's counting
+    sessions = SessionStore(FakeChatModel(), max_tokens=17)
+    session = sessions.get("abc")
+
+    for turn in range(3):
+        sessions.record(session, f"question {turn}", f"answer {turn}")
+
+    assert [message.content for message in session.window] == [
+        "answer 1",
+        "question 2",
+        "answer 2",
+    ]
+    assert session.window.tokens == 15
+    assert session.summary == ""
+
+
+def test_evicted_turns_are_folded_into_the_summary():
+    summarizer_calls = []
+
+    class RecordingChatModel(FakeChatModel):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            summarizer_calls.append(messages[-1].content)
+            return super()._generate(messages, stop, run_manager, **kwargs)
+
+    llm = RecordingChatModel(responses=["they asked about numbers"])
+    sessions = SessionStore(llm, max_tokens=10, summarize=True)
+    session = sessions.get("abc")
+
+    sessions.record(session, "question 0", "answer 0")
+    assert summarizer_calls == []
+    sessions.record(session, "question 1", "answer 1")
+    sessions._summarizer.shutdown(wait=True)  # pylint: disable=protected-access
+
+    assert len(summarizer_calls) == 1
+    assert "question 0" in summarizer_calls[0] and "answer 0" in summarizer_calls[0]
+    assert [message.content for message in session.window] == [
+        "question 1",
+        "answer 1",
+    ]
+    prompt = session.prompt_for("question 2")
+    assert prompt[0].content == "Conversation summary: they asked about numbers"
+    assert [message.content for message in prompt[1:]] == [
+        "question 1",
+        "answer 1",
+        "question 2",
+    ]
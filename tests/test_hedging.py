@@ -0,0 +1,104 @@
+"""Tests for the hedging of slow LLM requests."""
+from __future__ import annotations
+
+import threading
+import time
+from itertools import count
+from typing import Any
+
+import pytest
+from langchain.schema import HumanMessage
+
+from madia.llm.fakes import FakeChatModel
+from madia.llm.hedging import HedgePolicy, HedgingMixin, hedged_stream
+
+
+class FakeHedgedModel(HedgingMixin, FakeChatModel):
+    hedge_policy: Any = None
+
+
+def scripted(*latencies):
+    calls = count()
+    return lambda: latencies[next(calls)]
+
+
+def test_slow_request_is_hedged():
+    policy = HedgePolicy(max_delay=0.1)
+    llm = FakeHedgedModel(
+        responses=["hedged answer"], latency_fn=scripted(2.0, 0.0), hedge_policy=policy
+    )
+    start = time.perf_counter()
+    answer = llm.predict_messages([HumanMessage(content="hi")]).content
+
+    assert answer == "hedged answer"
+    assert time.perf_counter() - start < 1.0
+    assert llm.calls == 2
+
+
+def test_losing_request_stops_at_its_first_item():
+    produced, closed = [], threading.Event()
+
+    def slow():
+        try:
+            time.sleep(0.3)
+            for index in range(100):
+                produced.append(index)
+                yield f"slow {index}"
+        finally:
+            closed.set()
+
+    def fast():
+        yield "fast"
+
+    assert list(hedged_stream(HedgePolicy(max_delay=0.05), slow, fast)) == ["fast"]
+    assert closed.wait(5)
+    assert produced == [0]
+
+
+def test_fast_request_is_not_hedged():
+    policy = HedgePolicy(max_delay=0.5)
+    llm = FakeHedgedModel(latency_fn=scripted(0.0, 0.0), hedge_policy=policy)
+    llm.predict_messages([HumanMessage(content="hi")])
+
+    assert llm.calls == 1
+    assert policy.first_token.count == 1
+
+
+def test_delay_follows_the_percentile():
+    policy = HedgePolicy(percentile=90, min_delay=0.01, max_delay=5.0)
+    assert policy.delay() == 5.0  # not enough samples yet
+    for i in range(100):
+        policy.record((i + 1) / 100)
+    assert policy.delay() == pytest.approx(0.9, rel=0.02)
+
+
+def test_budget_limits_hedges():
+    policy = HedgePolicy(max_delay=0.0, budget=0.25)
+    sources = []
+
+    def source(name):
+        sources.append(name)
+        time.sleep(0.05)
+        return [name]
+
+    results = [
+        list(hedged_stream(policy, lambda: source("primary"), lambda: source("backup")))
+        for _ in range(8)
+    ]
+
+    # One hedge to start with, then one every fourth request
+    assert sources.count("backup") == 2
+    assert len(results) == 8
+
+
+def test_failed_request_falls_back():
+    policy = HedgePolicy(max_delay=5.0)
+
+    def failing():
+        raise ConnectionError("reset")
+
+    assert list(hedged_stream(policy, failing, lambda: iter("ok"))) == ["o", "k"]
+
+    with pytest.raises(ConnectionError):
+        # No budget left for a second fallback
+        list(hedged_stream(policy, failing, lambda: iter("ok")))
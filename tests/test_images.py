@@ -0,0 +1,67 @@
+"""Tests for the image sources and reduced-resolution decoding."""
+from __future__ import annotations
+
+import pytest
+from PIL import Image
+
+from madia.llm.blip_caption import caption_image_url
+from madia.llm.fakes import fake_blip
+from madia.llm.images import decode_image, image_data, is_many, iter_images
+
+
+def test_iter_images_of_directories_and_globs(tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name in ("b.jpg", "a.png", "sub/c.jpeg", "notes.txt"):
+        Image.new("RGB", (8, 8)).save(tmp_path / name, "PNG")
+
+    assert [p[len(str(tmp_path)) + 1 :] for p in iter_images(str(tmp_path))] == [
+        "a.png",
+        "b.jpg",
+        "sub/c.jpeg",
+    ]
+    assert list(iter_images(str(tmp_path / "**" / "*.jp*g"))) == [
+        str(tmp_path / "b.jpg"),
+        str(tmp_path / "sub" / "c.jpeg"),
+    ]
+    assert is_many(str(tmp_path)) and is_many(str(tmp_path / "*.png"))
+    assert not is_many(str(tmp_path / "a.png"))
+    assert not is_many("https://example.com/*.jpg")
+
+
+def test_jpegs_are_decoded_close_to_the_input_size(tmp_path):
+    path = tmp_path / "large.jpg"
+    Image.new("RGB", (3200, 2400), "green").save(path)
+
+    with image_data(str(path)) as data:
+        assert decode_image(data).size == (3200, 2400)
+        # 1/4 scale, the smallest still over 384x384
+        image = decode_image(data, 384)
+    assert image.size == (800, 600)
+    assert image.mode == "RGB"
+
+
+def test_caption_a_directory(tmp_path):
+    Image.new("RGB", (16, 16), "red").save(tmp_path / "red.jpg")
+    Image.new("RGB", (16, 16), "blue").save(tmp_path / "blue.png")
+    blip = fake_blip(["a square"])
+
+    assert caption_image_url(str(tmp_path), blip=blip).splitlines() == [
+        f"{tmp_path / 'blue.png'}: a square",
+        f"{tmp_path / 'red.jpg'}: a square",
+    ]
+    assert caption_image_url(str(tmp_path / "*.gif"), blip=blip) == (
+        f"No images found at {tmp_path / '*.gif'}"
+    )
+
+
+def test_unreadable_images_dont_stop_the_batch(tmp_path):
+    (tmp_path / "broken.jpg").write_bytes(b"not a jpeg")
+    Image.new("RGB", (16, 16), "red").save(tmp_path / "red.jpg")
+    blip = fake_blip(["a square"])
+
+    broken, red = caption_image_url(str(tmp_path), blip=blip).splitlines()
+
+    assert broken.startswith(f"{tmp_path / 'broken.jpg'}: Error: ")
+    assert red == f"{tmp_path / 'red.jpg'}: a square"
+    with pytest.raises((OSError, ValueError)):
+        caption_image_url(str(tmp_path / "broken.jpg"), blip=blip)
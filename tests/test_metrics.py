@@ -0,0 +1,97 @@
+"""Tests for the per-command metrics."""
+from __future__ import annotations
+
+import random
+
+import pytest
+from langchain.schema import HumanMessage
+
+from madia.llm.fakes import FakeChatModel
+from madia.llm.utils import MetricsCallbackHandler
+from madia.metrics import (Histogram, format_stats, metrics, prometheus_text,
+                           write_textfile)
+from madia.repl.base_repl import BaseRepl
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    metrics.enabled = True
+    yield
+    metrics.reset()
+
+
+def test_histogram_percentiles_within_one_percent():
+    rng = random.Random(0)
+    values = [rng.uniform(0.0001, 30) for _ in range(10_000)]
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+
+    values.sort()
+    for q in (50, 90, 99):
+        exact = values[int(q / 100 * len(values)) - 1]
+        assert histogram.percentile(q) == pytest.approx(exact, rel=0.01)
+    assert histogram.count == len(values)
+    assert histogram.percentile(100) == max(values)
+
+
+def test_commands_are_recorded_by_path():
+    tree = {
+        "openai": {"child": {"search": {"cmd": lambda x: f"found {x}"}}},
+        "fail": {"cmd": lambda x: 1 / 0},
+    }
+    repl = BaseRepl(tree)
+    for _ in range(3):
+        repl.present_result(repl.execute_command("openai search madia"))
+    with pytest.raises(ZeroDivisionError):
+        repl.execute_command("fail")
+    repl.execute_command("   ")
+
+    assert metrics.histograms[("execute", "openai search")].count == 3
+    assert metrics.histograms[("render", "openai search")].count == 3
+    assert metrics.counters[("errors", "fail", "")] == 1
+    assert metrics.histograms[("execute", "fail")].count == 1
+    assert "openai search" in format_stats()
+
+
+def test_disabled_metrics_record_nothing():
+    metrics.enabled = False
+    repl = BaseRepl({"ping": {"cmd": lambda x: "pong"}})
+    repl.execute_command("ping")
+
+    assert not metrics.histograms
+    assert not metrics.counters
+
+
+def test_model_calls_record_latency_and_tokens():
+    repl = BaseRepl(
+        {
+            "ai": {
+                "cmd": lambda x: FakeChatModel(
+                    responses=["one two three"], callbacks=[MetricsCallbackHandler()]
+                ).predict_messages([HumanMessage(content=x)])
+            }
+        }
+    )
+    repl.execute_command("ai hello there")
+
+    for metric in ("prompt_build", "llm_ttft", "llm_generation"):
+        assert metrics.histograms[(metric, "ai")].count == 1
+    assert metrics.counters[("tokens", "ai", "completion")] == 3
+    assert metrics.counters[("tokens", "ai", "prompt")] > 0
+
+
+def test_textfile_export(tmp_path):
+    metrics.observe("execute", 0.02, command='say "hi"')
+    metrics.increment("tokens", 10, "prompt", command='say "hi"')
+    path = tmp_path / "madia.prom"
+    write_textfile(str(path), force=True)
+
+    text = path.read_text()
+    assert text == prometheus_text()
+    assert "# TYPE madia_execute_seconds histogram" in text
+    assert 'madia_execute_seconds_bucket{command="say \\"hi\\"",le="0.01"} 0' in text
+    assert 'madia_execute_seconds_bucket{command="say \\"hi\\"",le="0.025"} 1' in text
+    assert 'madia_execute_seconds_count{command="say \\"hi\\""} 1' in text
+    assert 'madia_tokens_total{command="say \\"hi\\"",kind="prompt"} 10' in text
@@ -0,0 +1,84 @@
+"""Tests for the entry point plugins and their command manifest."""
+from __future__ import annotations
+
+import sys
+
+from madia.repl.commands import CommandTable
+from madia.repl.plugins import PluginManifest, add_plugin_commands
+
+PLUGIN = """
+CALLS = []
+
+def now(arguments):
+    CALLS.append(arguments)
+    return f"Sunny in {arguments}"
+
+command = {
+    "cmd": lambda x: "weather base command",
+    "help": "Weather commands",
+    "child": {"now": {"cmd": now, "help": "The weather now"}},
+}
+"""
+
+
+def install(site, name, entry_points, source=PLUGIN):
+    (site / f"{name}.py").write_text(source)
+    dist_info = site / f"{name}-0.1.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text(f"Metadata-Version: 2.1\nName: {name}\n")
+    lines = [f"{command} = {value}" for command, value in entry_points.items()]
+    (dist_info / "entry_points.txt").write_text(
+        "[madia.commands]\n" + "\n".join(lines) + "\n"
+    )
+
+
+def test_commands_come_from_the_manifest_without_importing(tmp_path, monkeypatch):
+    site = tmp_path / "site"
+    site.mkdir()
+    install(site, "madia_weather", {"weather": "madia_weather:command"})
+    monkeypatch.syspath_prepend(str(site))
+    path = str(tmp_path / "plugins.json")
+    PluginManifest(path).load()
+    del sys.modules["madia_weather"]
+
+    options = add_plugin_commands({}, PluginManifest(path))
+    table = CommandTable(options)
+
+    assert options["weather"]["child"]["now"]["help"] == "The weather now"
+    assert ("weather", "now") in table
+    assert "madia_weather" not in sys.modules
+    assert table.execute("weather now Dublin") == "Sunny in Dublin"
+    assert sys.modules["madia_weather"].CALLS == ["Dublin"]
+
+
+def test_manifest_is_rebuilt_when_a_distribution_changes(tmp_path, monkeypatch):
+    site = tmp_path / "site"
+    site.mkdir()
+    install(site, "madia_weather", {"weather": "madia_weather:command"})
+    monkeypatch.syspath_prepend(str(site))
+    manifest = PluginManifest(str(tmp_path / "plugins.json"))
+    assert list(manifest.commands()) == ["weather"]
+
+    install(site, "madia_echo", {"echo": "madia_echo:echo"}, "echo = str.upper\n")
+
+    commands = manifest.commands()
+    assert sorted(commands) == ["echo", "weather"]
+    assert commands["echo"]("hi") == "HI"
+
+
+def test_broken_and_clashing_plugins_are_left_out(tmp_path, monkeypatch):
+    site = tmp_path / "site"
+    site.mkdir()
+    install(
+        site,
+        "madia_clash",
+        {"config": "madia_clash:command", "broken": "madia_clash:missing"},
+    )
+    monkeypatch.syspath_prepend(str(site))
+    builtin = {"cmd": lambda x: "config"}
+
+    options = add_plugin_commands(
+        {"config": builtin}, PluginManifest(str(tmp_path / "plugins.json"))
+    )
+
+    assert options == {"config": builtin}
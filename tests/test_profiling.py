@@ -0,0 +1,79 @@
+"""Tests for the command and import-time profiling."""
+from __future__ import annotations
+
+import pstats
+import sys
+import time
+
+from madia import profiling
+from madia.profiling import _method_qualname, parse_import_time
+from madia.repl.base_repl import BaseRepl
+
+IMPORT_TIME = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |     json.decoder
+import time:        50 |        150 |   json
+import time:        20 |         20 |   re
+import time:        30 |        200 | app
+import time:         5 |          5 | other
+"""
+
+
+def slow_command(text):
+    deadline = time.perf_counter() + 0.1
+    while time.perf_counter() < deadline:
+        pass
+    return f"done {text}"
+
+
+def test_profile_command_writes_pstats_and_stacks(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(profiling, "profiles_path", lambda: str(tmp_path))
+    repl = BaseRepl({"slow": {"cmd": slow_command}})
+    repl.profile_command("slow down")
+
+    output = capsys.readouterr().out
+    assert "done down" in output
+    assert "Profiled 'slow down'" in output
+
+    (pstats_file,) = tmp_path.glob("*-slow_down.pstats")
+    functions = {name for _, _, name in pstats.Stats(str(pstats_file)).stats}
+    assert "slow_command" in functions
+
+    (collapsed_file,) = tmp_path.glob("*-slow_down.collapsed")
+    stacks = collapsed_file.read_text().splitlines()
+    assert any(
+        "base_repl:BaseRepl.execute_command" in line
+        and "test_profiling:slow_command" in line
+        for line in stacks
+    )
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+
+
+class Base:
+    def frame(self):
+        return sys._getframe()
+
+
+class Child(Base):
+    pass
+
+
+def test_method_qualname_before_python_3_11():
+    assert _method_qualname(Child().frame()) == "Base.frame"
+    assert _method_qualname(sys._getframe()) == (
+        "test_method_qualname_before_python_3_11"
+    )
+
+
+def test_parse_import_time():
+    stacks, imports = parse_import_time(IMPORT_TIME)
+
+    assert stacks == {
+        ("app",): 30,
+        ("app", "json"): 50,
+        ("app", "json", "json.decoder"): 100,
+        ("app", "re"): 20,
+        ("other",): 5,
+    }
+    assert ("app", 30, 200) in imports
+    assert len(imports) == 5
@@ -0,0 +1,46 @@
+"""Tests for the compiled command dispatch in madia.repl.commands."""
+from __future__ import annotations
+
+from madia.repl.commands import CommandTable
+
+TREE = {
+    "echo": {"cmd": lambda x: f"echo:{x}", "child": {}},
+    "config": {
+        "cmd": lambda x: f"config:{x}",
+        "child": {
+            "read": {"cmd": lambda x: f"read:{x}"},
+            "empty": {"help": "Has no function"},
+        },
+    },
+    "bare": lambda x: f"bare:{x}",
+}
+
+
+def test_execute_longest_command_with_arguments():
+    table = CommandTable(TREE)
+
+    assert len(table) == 5
+    assert table.execute("config read 'all of it'") == "read:all of it"
+    assert table.execute("config unknown") == "config:unknown"
+    assert table.execute("echo") == "echo:"
+    assert table.execute("bare a b") == "bare:a b"
+    assert table.execute("") is None
+
+
+def test_execute_fallbacks():
+    assert CommandTable(TREE).execute("nope x") == "Invalid command: nope"
+    assert "does not map" in CommandTable(TREE).execute("config empty")
+    assert CommandTable(TREE, default_fn=str.upper).execute("hello world") == (
+        "HELLO WORLD"
+    )
+
+
+def test_execute_help():
+    table = CommandTable(TREE)
+    helped = []
+
+    table.execute("config ?", help_fn=helped.append)
+    table.execute("?", help_fn=helped.append)
+
+    assert helped[0].path == ("config",)
+    assert helped[1] is None
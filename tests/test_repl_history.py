@@ -0,0 +1,32 @@
+"""Tests for the REPL history store in madia.repl.history."""
+from __future__ import annotations
+
+import random
+
+from madia.repl.history import CompactFileHistory, PrefixIndex
+
+
+def test_prefix_index_matches_linear_scan():
+    rng = random.Random(0)
+    strings = [f"cmd {rng.randint(0, 50)} {rng.choice('abc')}" for _ in range(500)]
+    index = PrefixIndex(strings[:400], reindex_threshold=32)
+    for string in strings[400:]:
+        index.add(string)
+
+    for prefix in ["cmd", "cmd 1", "cmd 42 b", "nope", "cmd 7 c"]:
+        expected = next((s for s in reversed(strings) if s.startswith(prefix)), None)
+        assert index.lookup(prefix) == expected
+
+
+def test_history_deduplicates_and_caps(tmp_path):
+    filename = str(tmp_path / "history.jsonl")
+    history = CompactFileHistory(filename, max_entries=3)
+    for string in ["a", "b", "multi\nline", "c", "a", "d", "a"]:
+        history.store_string(string)
+
+    reloaded = CompactFileHistory(filename, max_entries=3)
+    assert list(reloaded.load_history_strings()) == ["a", "d", "c"]
+    # Seven lines for three live entries, so the file got compacted
+    with open(filename, encoding="utf-8") as history_file:
+        assert len(history_file.readlines()) == 3
+    assert reloaded.index.lookup("") == "a"
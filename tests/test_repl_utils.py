@@ -0,0 +1,51 @@
+"""Tests for the terminal helpers in madia.repl.utils."""
+from __future__ import annotations
+
+import io
+
+from madia.repl.terminal import count_rows
+from madia.repl.utils import StreamWrapper, delete_stdout_content
+
+
+def test_stream_wrapper_batches_and_clears():
+    sink = io.StringIO()
+    wrapper = StreamWrapper(sink, flush_interval=60, flush_size=10, max_captured=8)
+    wrapper.rows.columns = 80
+
+    wrapper.write("abc\n")
+    assert sink.getvalue() == ""  # still pending
+    wrapper.write("defghij\n")
+    assert sink.getvalue() == "abc\ndefghij\n"
+    assert wrapper.rows.rows == 2
+    assert wrapper.getvalue() == "defghij\n"
+
+    wrapper.clear()
+    assert sink.getvalue().endswith("\r\x1b[2K" + "\x1b[1A\x1b[2K" * 2)
+    assert wrapper.rows.rows == 0
+
+
+def test_stream_wrapper_quiet_captures_without_echo():
+    sink = io.StringIO()
+    wrapper = StreamWrapper(sink, quiet=True)
+
+    wrapper.write("hidden\n")
+    wrapper.flush()
+    wrapper.clear()
+
+    assert sink.getvalue() == ""
+
+
+def test_count_rows_accounts_for_wrapped_lines():
+    assert count_rows("", columns=10) == 0
+    assert count_rows("short\n", columns=10) == 1
+    assert count_rows("x" * 25 + "\n" + "\n", columns=10) == 4
+    # A partial line wrapping pushes the cursor down too
+    assert count_rows("x" * 10 + "y", columns=10) == 1
+    assert count_rows("x" * 10, columns=10) == 0
+
+
+def test_delete_stdout_content_single_write(monkeypatch):
+    sink = io.StringIO()
+    monkeypatch.setattr("sys.stdout", sink)
+    delete_stdout_content("one\ntwo\n")
+    assert sink.getvalue() == "\r\x1b[2K" + "\x1b[1A\x1b[2K" * 2
@@ -0,0 +1,142 @@
+"""Tests for the warm-up of commands fired by the REPL completion."""
+from __future__ import annotations
+
+import socket
+import threading
+
+import openai
+from prompt_toolkit.document import Document
+
+from madia.llm.clients import warm_up_connection
+from madia.metrics import metrics
+from madia.repl.base_repl import BaseRepl
+from madia.repl.warmup import CANCELLED, DONE, WarmupRunner
+
+
+def complete(completer, text):
+    return [c.text for c in completer.get_completions(Document(text), None)]
+
+
+def test_warmup_fires_once_the_prefix_is_unique():
+    warmed = []
+    tree = {
+        "image": {
+            "cmd": lambda x: x,
+            "child": {
+                "caption": {"cmd": lambda x: x, "warmup": lambda: warmed.append(1)},
+                "crop": {"cmd": lambda x: x},
+            },
+        },
+    }
+    warmups = WarmupRunner()
+    completer = BaseRepl.CustomCompleter(tree, warmups)
+
+    complete(completer, "image c")
+    assert not warmups.warmups
+    for text in ("image ca", "image cap", "image caption ", "image caption url"):
+        complete(completer, text)
+
+    warmup = warmups.warmups["image caption"]
+    assert warmup.finished_event.wait(5)
+    assert warmed == [1]
+    assert warmup.state == DONE
+
+
+def test_settle_waits_for_the_running_warmup():
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait()
+
+    metrics.reset()
+    warmups = WarmupRunner()
+    warmups.fire("slow", slow)
+    started.wait()
+    threading.Timer(0.05, release.set).start()
+    warmups.settle("slow")
+
+    assert warmups.warmups["slow"].state == DONE
+    assert metrics.histograms[("warmup_saved", "slow")].count == 1
+
+
+def test_pending_warmups_are_cancelled():
+    release = threading.Event()
+    warmed = []
+    warmups = WarmupRunner()
+    warmups.fire("first", release.wait)
+    warmups.fire("second", lambda: warmed.append("second"))
+    warmups.fire("third", lambda: warmed.append("third"))
+
+    warmups.cancel("second")
+    # The command runs before its warm-up started, it does the work itself
+    warmups.settle("third")
+    release.set()
+    warmups.settle("first")
+
+    assert warmed == []
+    assert warmups.warmups["second"].state == CANCELLED
+    # Cancelled, it can be fired again, but not once the command ran
+    assert warmups.fire("second", lambda: None)
+    assert not warmups.fire("third", lambda: None)
+
+
+class ScriptedSession:
+    def __init__(self, *steps):
+        self.steps = list(steps)
+
+    def prompt(self, message):
+        step = self.steps.pop(0)
+        return step() if callable(step) else step
+
+
+def test_repl_cancels_the_warmups_of_abandoned_lines(capsys):
+    release = threading.Event()
+    warmed = []
+    tree = {
+        "image": {
+            "child": {
+                "caption": {
+                    "cmd": lambda x: x,
+                    "warmup": lambda: warmed.append("caption"),
+                },
+                "crop": {"cmd": lambda x: x, "warmup": lambda: warmed.append("crop")},
+            },
+        },
+    }
+    repl = BaseRepl(tree)
+    completer = BaseRepl.CustomCompleter(tree, repl.warmups)
+    # Busy with another warm-up, the ones fired below stay pending
+    repl.warmups.fire("busy", release.wait)
+
+    def interrupt():
+        complete(completer, "image cap")
+        raise KeyboardInterrupt
+
+    def delete_and_enter():
+        complete(completer, "image cr")
+        return ""
+
+    repl._session = ScriptedSession(interrupt, delete_and_enter, "exit")
+    repl.loop()
+    release.set()
+
+    assert repl.warmups.warmups["image caption"].state == CANCELLED
+    assert repl.warmups.warmups["image crop"].state == CANCELLED
+    repl.warmups.settle("busy")
+    assert warmed == []
+
+
+def test_connection_warmup_leaves_openai_sessions_alone(monkeypatch):
+    resolved = []
+    monkeypatch.setattr(openai, "api_base", "https://api.example.com/v1")
+    monkeypatch.setattr(openai, "proxy", None)
+    monkeypatch.setattr(
+        socket, "getaddrinfo", lambda host, port, **kwargs: resolved.append(host)
+    )
+    session = openai.requestssession
+
+    warm_up_connection()
+
+    assert resolved == ["api.example.com"]
+    assert openai.requestssession is session
@@ -0,0 +1,148 @@
+"""Tests for the local documents index."""
+from __future__ import annotations
+
+import os
+
+import numpy as np
+import pytest
+
+from madia.retrieval.ann import IVFIndex
+from madia.retrieval.docs import DocsIndex
+from madia.retrieval.embeddings import HashingEmbedding, get_embedding
+from madia.retrieval.loaders import (Chunk, ParallelChunker, iter_chunks,
+                                     iter_documents, iter_pages, split_text)
+from madia.retrieval.store import VECTORS_FILE, VectorStore
+
+
+class CountingEmbedding(HashingEmbedding):
+    def __init__(self):
+        super().__init__(dim=64)
+        self.embedded = []
+
+    def __call__(self, texts):
+        self.embedded.extend(texts)
+        return super().__call__(texts)
+
+
+def test_split_text_overlaps_on_word_bounds():
+    text = " ".join(f"w{i}" for i in range(100))
+    chunks = split_text(text, chunk_size=40, chunk_overlap=10)
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    assert chunks[0].split()[-2:] == chunks[1].split()[:2]
+    assert " ".join(chunks).split()[-1] == "w99"
+
+
+def test_split_text_measures_with_the_length_function():
+    # Two "tokens" per word, whatever its length
+    chunks = split_text("a bb ccc dddd eeeee", 4, 2, length_function=lambda w: 2)
+    assert chunks == ["a bb", "bb ccc", "ccc dddd", "dddd eeeee"]
+
+
+def test_parallel_chunker_matches_sequential_chunks():
+    pdf = os.path.join(os.path.dirname(__file__), "..", "data", "WizardLM.pdf")
+    with ParallelChunker(workers=2, pages_per_task=4, max_pending=2) as chunker:
+        assert list(chunker.iter_chunks(pdf)) == list(iter_chunks(pdf))
+
+
+def test_text_pages_split_on_form_feeds(tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_text("one\ntwo\fthree\f\ffour\n")
+    assert list(iter_pages(str(path))) == [
+        (1, "one\ntwo"),
+        (2, "three"),
+        (3, ""),
+        (4, "four\n"),
+    ]
+
+
+def test_iter_documents_rejects_unsupported_files(tmp_path):
+    (tmp_path / "notes.md").write_text("notes")
+    (tmp_path / "photo.png").write_bytes(b"\x89PNG")
+
+    assert list(iter_documents(str(tmp_path))) == [str(tmp_path / "notes.md")]
+    with pytest.raises(ValueError, match="Unsupported document"):
+        list(iter_documents(str(tmp_path / "photo.png")))
+
+
+def test_hashing_embedding_is_normalized_and_stable():
+    embed = get_embedding("hashing")
+    vectors = embed(["the cat sat on the mat", "the cat sat on the mat", ""])
+    assert vectors.shape == (3, 384)
+    assert np.allclose(np.linalg.norm(vectors[0]), 1)
+    assert np.array_equal(vectors[0], vectors[1])
+    assert not vectors[2].any()
+    with pytest.raises(ValueError):
+        get_embedding("nope")
+
+
+def test_ingest_only_embeds_new_chunks(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "cats.txt").write_text("Cats purr and sleep all day.\fCats chase mice.")
+    (docs / "dogs.md").write_text("Dogs bark at the mailman.")
+    embedding = CountingEmbedding()
+    index = DocsIndex(str(tmp_path / "index"), embedding, chunk_size=200)
+
+    stats = index.ingest(str(docs))
+    assert (stats.documents, stats.chunks, stats.embedded) == (2, 3, 3)
+    assert index.ingest(str(docs)).unchanged == 2
+
+    (docs / "cats.txt").write_text("Cats purr and sleep all day.\fCats hunt birds.")
+    stats = index.ingest(str(docs))
+    assert (stats.unchanged, stats.embedded) == (1, 1)
+    assert embedding.embedded[-1] == "Cats hunt birds."
+
+    score, record = index.search("cats chasing mice", k=3)[0]
+    assert record["text"] != "Cats chase mice."  # replaced, no longer returned
+    assert [r["page"] for _, r in index.search("hunt birds", k=1)] == [2]
+
+
+def test_store_reopens_and_recovers_torn_writes(tmp_path):
+    index = DocsIndex(str(tmp_path), HashingEmbedding(dim=64))
+    (tmp_path / "a.txt").write_text("alpha beta gamma")
+    index.ingest(str(tmp_path / "a.txt"))
+    with open(os.path.join(tmp_path, VECTORS_FILE), "ab") as file:
+        file.write(b"\0" * 100)
+
+    store = VectorStore(str(tmp_path), 64, "hashing")
+    assert len(store) == 1 and store.vectors.shape == (1, 64)
+    assert os.path.getsize(os.path.join(tmp_path, VECTORS_FILE)) == 64 * 4
+    with pytest.raises(ValueError):
+        VectorStore(str(tmp_path), 128, "hashing")
+
+
+def unit_vectors(rows, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((rows, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def test_ivf_lists_partition_the_vectors(tmp_path):
+    vectors = unit_vectors(500)
+    index = IVFIndex.build(vectors, nlist=8, workers=2)
+    assert sorted(index.order) == list(range(500))
+    assert index.offsets[-1] == 500
+
+    path = str(tmp_path / "ivf.npz")
+    index.save(path)
+    loaded = IVFIndex.load(path)
+    assert loaded.rows == 500 and np.array_equal(loaded.order, index.order)
+    # Probing every list is an exact search
+    assert len(loaded.candidates(vectors[0], nprobe=8)) == 500
+
+
+def test_store_search_with_ann_includes_unindexed_rows(tmp_path):
+    vectors = unit_vectors(300)
+    chunks = [Chunk(str(i), "doc", 1, f"chunk {i}") for i in range(300)]
+    store = VectorStore(str(tmp_path), 16, "test")
+    store.add(chunks[:200], vectors[:200])
+    store.set_source("doc", [0, 0], [chunk.id for chunk in chunks[:200]])
+    store.build_ann(nlist=4)
+    store.add(chunks[200:], vectors[200:])
+    store.set_source("doc", [1, 1], [chunk.id for chunk in chunks])
+    assert store.unindexed == 100
+
+    for row in (10, 250):
+        assert store.search(vectors[row], k=1, nprobe=1)[0][1]["id"] == str(row)
+    exact = store.search(vectors[3], k=5, exact=True)
+    assert store.search(vectors[3], k=5, nprobe=4) == exact
+    assert VectorStore(str(tmp_path), 16, "test").ann.rows == 200
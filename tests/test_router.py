@@ -0,0 +1,107 @@
+"""Tests for the prompt-aware model router."""
+from __future__ import annotations
+
+import json
+
+from madia.llm import openai_chat
+from madia.llm import router as router_module
+from madia.llm.fakes import FakeChatModel
+from madia.llm.openai_chat import BufferedWindowMessage
+from madia.llm.router import LATENCY_TTL, ModelRouter, Route, get_router
+
+ROUTES = [
+    Route(
+        ("gpt-4", "gpt-3.5-turbo-16k"), command="bots developer", min_prompt_tokens=200
+    ),
+    Route(("gpt-3.5-turbo", "gpt-3.5-turbo-16k")),
+]
+
+
+def test_routes_by_command_and_prompt_tokens():
+    router = ModelRouter(ROUTES)
+
+    assert router.choose(500, "bots developer", "default").model == "gpt-4"
+    assert router.choose(50, "bots developer", "default").model == "gpt-3.5-turbo"
+    assert router.choose(500, "bots joker", "default").model == "gpt-3.5-turbo"
+    # Too long for the 4k context of gpt-3.5-turbo
+    decision = router.choose(6000, "ai", "default")
+    assert decision.model == "gpt-3.5-turbo-16k"
+    assert decision.reason == "route 1: fits"
+    assert ModelRouter([]).choose(10, "ai", "default").model == "default"
+
+
+def test_overrides_win():
+    router = ModelRouter(ROUTES, overrides={"bots developer": "gpt-4-32k"})
+    decision = router.choose(10, "bots developer", "default")
+
+    assert decision.model == "gpt-4-32k"
+    assert decision.reason == "override"
+
+
+def test_slow_preferred_model_is_avoided():
+    router = ModelRouter(ROUTES)
+    router.observe("gpt-3.5-turbo", 0.4)
+    router.observe("gpt-3.5-turbo-16k", 0.5)
+    assert router.choose(100, "ai", "default").model == "gpt-3.5-turbo"
+
+    for _ in range(10):
+        router.observe("gpt-3.5-turbo", 3.0)
+    decision = router.choose(100, "ai", "default")
+    assert decision.model == "gpt-3.5-turbo-16k"
+    assert decision.reason == "route 1: faster"
+
+
+def test_decisions_are_logged(tmp_path):
+    log_path = tmp_path / "routing.jsonl"
+    router = ModelRouter(ROUTES, log_path=str(log_path))
+    router.choose(500, "bots developer", "default")
+    router.choose(20, "ai", "default")
+
+    records = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert [record["model"] for record in records] == ["gpt-4", "gpt-3.5-turbo"]
+    assert records[0]["command"] == "bots developer"
+    assert records[0]["prompt_tokens"] == 500
+
+
+def test_chat_uses_the_routed_model(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    router = ModelRouter(ROUTES)
+    monkeypatch.setattr(openai_chat, "get_router", lambda: router)
+    monkeypatch.setattr(openai_chat, "current_command", lambda: "bots developer")
+
+    chat = BufferedWindowMessage()
+    chat.llm = chat.memory.llm = FakeChatModel(
+        model_name="gpt-3.5-turbo", responses=["cheap"]
+    )
+    chat.routed_llms["gpt-4"] = FakeChatModel(model_name="gpt-4", responses=["smart"])
+
+    assert chat.get_response("hi") == "cheap"
+    assert chat.get_response("refactor this " * 100) == "smart"
+    assert set(router.latencies) == {"gpt-3.5-turbo", "gpt-4"}
+
+
+def test_avoided_model_is_tried_again():
+    now = [0.0]
+    router = ModelRouter(ROUTES, clock=lambda: now[0])
+    router.observe("gpt-3.5-turbo", 3.0)
+    router.observe("gpt-3.5-turbo-16k", 0.5)
+    assert router.choose(100, "ai", "default").model == "gpt-3.5-turbo-16k"
+
+    now[0] = LATENCY_TTL + 1
+    router.observe("gpt-3.5-turbo-16k", 0.5)
+    assert router.choose(100, "ai", "default").model == "gpt-3.5-turbo"
+
+
+def test_get_router_follows_the_log_setting(tmp_path, monkeypatch):
+    values = {"llm_routing": True, "llm_routing_log": "routing.jsonl"}
+    monkeypatch.setattr(router_module.settings, "get", values.get)
+    monkeypatch.setattr(router_module, "_router", None)
+    monkeypatch.chdir(tmp_path)
+
+    # A bare file name, in the current directory
+    router = get_router()
+    assert router.log_path == "routing.jsonl"
+    assert get_router() is router
+
+    values["llm_routing_log"] = str(tmp_path / "logs" / "routing.jsonl")
+    assert get_router().log_path == values["llm_routing_log"]
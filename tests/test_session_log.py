@@ -0,0 +1,101 @@
+"""Tests for the persistent conversation sessions."""
+from __future__ import annotations
+
+import os
+
+import pytest
+from langchain.schema import AIMessage, HumanMessage
+
+from madia.llm.fakes import FakeChatModel
+from madia.llm.openai_chat import BufferedWindowMessage
+from madia.llm.session_log import INDEX_ENTRY, SessionLogStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionLogStore(str(tmp_path))
+
+
+def test_tail_reads_only_the_token_window(store):
+    log = store.open("long")
+    for i in range(0, 1000, 2):
+        log.append(
+            [HumanMessage(content=f"question {i}"), AIMessage(content="x" * 500)],
+            [10, 100],
+        )
+    assert len(log) == 1000
+
+    tail = log.tail(max_tokens=215)
+    assert [m.content for m in tail] == ["x" * 500, "question 998", "x" * 500]
+    assert log.read(0, 1)[0].content == "question 0"
+    # The long answers are stored compressed
+    assert os.path.getsize(log.log_path) < 500 * 500
+
+
+def test_tail_keeps_the_last_message_over_budget(store):
+    log = store.open("big")
+    log.append([AIMessage(content="huge")], [5000])
+    assert [m.content for m in log.tail(100)] == ["huge"]
+    assert store.open("empty").tail(100) == []
+
+
+def test_interrupted_append_is_repaired(store, tmp_path):
+    log = store.open("torn")
+    log.append([HumanMessage(content="kept")], [1])
+    with open(log.index_path, "ab") as index:
+        index.write(INDEX_ENTRY.pack(10_000, 10, 1) + b"\0\0")
+
+    repaired = SessionLogStore(str(tmp_path)).open("torn")
+    assert len(repaired) == 1
+    assert repaired.read()[0].content == "kept"
+
+
+def test_fork_list_and_current(store):
+    store.open("main").append([HumanMessage(content="hi")], [1])
+    store.fork("main", "branch").append([HumanMessage(content="more")], [1])
+
+    assert {(name, count) for name, count, _ in store.list()} == {
+        ("main", 1),
+        ("branch", 2),
+    }
+    with pytest.raises(ValueError):
+        store.fork("main", "branch")
+    with pytest.raises(ValueError):
+        store.open("../escape")
+
+    assert store.current == "default"
+    store.current = "branch"
+    assert SessionLogStore(store.path).current == "branch"
+
+
+def test_chat_resumes_its_session(store, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+
+    def chat():
+        buffered = BufferedWindowMessage(session_store=store)
+        buffered.llm = buffered.memory.llm = FakeChatModel(responses=["pong"])
+        return buffered
+
+    chat().get_response("ping")
+    resumed = chat()
+    assert [m.content for m in resumed.memory.chat_memory.messages] == [
+        "ping",
+        "pong",
+    ]
+    assert "Forked session 'default' into 'other'" in resumed.fork_session("other")
+    assert store.current == "other"
+    assert "* other" in resumed.list_sessions()
+
+
+def test_turns_longer_than_the_memory_are_saved(store, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    answer = " ".join(["word"] * 3000)
+    buffered = BufferedWindowMessage(session_store=store)
+    buffered.llm = buffered.memory.llm = FakeChatModel(responses=[answer])
+    buffered.memory.max_token_limit = 500
+
+    buffered.get_response("ping")
+
+    # The memory evicted the whole turn, the session keeps it
+    assert buffered.memory.chat_memory.messages == []
+    assert [m.content for m in store.open(store.current).read()] == ["ping", answer]
@@ -0,0 +1,121 @@
+"""Tests for the single-flight coalescing of identical LLM requests."""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import HumanMessage
+
+from madia.llm.fakes import FakeChatModel
+from madia.llm.singleflight import SingleFlight, SingleFlightMixin, flights
+
+
+class FakeSingleFlightModel(SingleFlightMixin, FakeChatModel):
+    pass
+
+
+class TokenRecorder(BaseCallbackHandler):
+    def __init__(self):
+        self.tokens = []
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.tokens.append(token)
+
+
+def ask_together(llm, prompts):
+    barrier = threading.Barrier(len(prompts))
+
+    def ask(prompt):
+        barrier.wait()
+        return llm.predict_messages([HumanMessage(content=prompt)]).content
+
+    with ThreadPoolExecutor(len(prompts)) as pool:
+        return list(pool.map(ask, prompts))
+
+
+def test_identical_requests_are_sent_once():
+    llm = FakeSingleFlightModel(
+        responses=["one answer", "another answer"], first_token_latency=0.2
+    )
+    coalesced = flights.coalesced
+    answers = ask_together(llm, ["same question"] * 8)
+
+    assert llm.calls == 1
+    assert len(set(answers)) == 1
+    assert flights.coalesced - coalesced == 7
+    assert not flights  # forgotten once landed, it's no cache
+
+    ask_together(llm, ["same question"])
+    assert llm.calls == 2
+
+
+def test_different_requests_are_not_coalesced():
+    llm = FakeSingleFlightModel(first_token_latency=0.1)
+    ask_together(llm, [f"question {i}" for i in range(4)])
+    assert llm.calls == 4
+
+    other = FakeSingleFlightModel(first_token_latency=0.1, model_name="other")
+    barrier = threading.Barrier(2)
+
+    def ask(model):
+        barrier.wait()
+        return model.predict_messages([HumanMessage(content="same")])
+
+    with ThreadPoolExecutor(2) as pool:
+        list(pool.map(ask, [llm, other]))
+    assert llm.calls == 5 and other.calls == 1
+
+
+def test_late_subscribers_replay_the_stream():
+    llm = FakeSingleFlightModel(responses=["a b c d e f g h"], tokens_per_second=50)
+    prompt = [HumanMessage(content="stream it")]
+    first, late = TokenRecorder(), TokenRecorder()
+    started = threading.Event()
+
+    def leader():
+        chunks = []
+        for chunk in llm.stream(prompt, config={"callbacks": [first]}):
+            chunks.append(chunk.content)
+            started.set()
+        return chunks
+
+    with ThreadPoolExecutor(1) as pool:
+        leading = pool.submit(leader)
+        started.wait()
+        joined = [
+            chunk.content for chunk in llm.stream(prompt, config={"callbacks": [late]})
+        ]
+
+    assert llm.calls == 1
+    assert joined == leading.result()
+    assert "".join(joined) == "a b c d e f g h"
+    assert late.tokens == first.tokens == joined
+
+
+def test_errors_reach_every_caller():
+    group = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        release.wait()
+        raise RuntimeError("boom")
+
+    def call():
+        with pytest.raises(RuntimeError, match="boom"):
+            group.call("key", fail)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while group.coalesced < 2:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert not group